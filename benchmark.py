@@ -0,0 +1,571 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Salih Kiliclioglu
+
+# Micro benchmarks for mediasort.
+# Usage: benchmark.py [options] [BENCHMARK ...]   (default: run all benchmarks)
+# With --json every result is written to a file as well, to compare versions.
+
+from datetime import datetime, timedelta
+from optparse import OptionParser
+
+import glob
+import json
+import logging
+import os
+import platform
+import re
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+import exifreader
+import instrument
+import mediasort
+import planner
+import rules
+import synthtree
+import targetindex
+import videoreader
+
+timer = getattr(time, 'perf_counter', time.time)
+
+TESTDATA_FOLDER = "testdata"
+# synthetic trees are created on tmpfs if available, so the disk doesn't dominate the results
+TMPFS_FOLDER = "/dev/shm"
+SORT_MODES = ("simulate", "move")
+
+# results of the benchmarks run, written by --json
+results = []
+
+
+def measure(function, arguments, rounds):
+    """Call function once per argument tuple, repeated rounds times. Return the elapsed seconds."""
+    start = timer()
+    for _ in range(rounds):
+        for argument in arguments:
+            function(*argument)
+    return timer() - start
+
+
+def report(name, elapsed, calls, baseline=None, details=None):
+    line = "%-40s %10.3f ms %12.1f us/call" % (name, elapsed * 1000, elapsed * 1000000 / max(calls, 1))
+    result = {'name': name, 'seconds': elapsed, 'calls': calls}
+    if baseline:
+        line += " %8.1fx" % (baseline / elapsed if elapsed else float('inf'))
+        result['speedup'] = baseline / elapsed if elapsed else None
+    if details:
+        result.update(details)
+    results.append(result)
+    print(line)
+
+
+def pillow_exif(path):
+    from PIL import Image
+    with open(path, 'rb') as exif_file:
+        exif_data = Image.open(exif_file)._getexif()
+        if exif_data:
+            return mediasort.get_date_from_exif(exif_data), mediasort.get_model_from_exif(exif_data)
+    return None, None
+
+
+def bench_exif(options):
+    """Pillow _getexif() versus the header-only exifreader on the testdata images."""
+    paths = [(path,) for path in sorted(glob.glob(os.path.join(TESTDATA_FOLDER, "*")))
+             if os.path.splitext(path)[1].lower() in ('.jpg', '.jpeg', '.png')]
+    calls = len(paths) * options.rounds
+    baseline = measure(pillow_exif, paths, options.rounds)
+    report("exif: Pillow _getexif", baseline, calls)
+    report("exif: exifreader.read_metadata", measure(exifreader.read_metadata, paths, options.rounds), calls, baseline)
+
+
+# names used for synthetic files: two dated video names, a dated image name and an undated file
+SYNTHETIC_NAMES = ("VID_%08d_%06d.mp4", "clip-%08d-%04d.mov", "IMG_%08d_%06d.tiff", "document-%d-%d.txt")
+
+
+def create_synthetic_tree(folder, file_count, files_per_folder=1000):
+    """Create file_count empty files in subfolders of folder, two levels deep."""
+    for index in range(file_count):
+        subfolder = os.path.join(folder, "d%03d" % (index // (files_per_folder * 10)),
+                                 "d%03d" % (index // files_per_folder % 10))
+        if index % files_per_folder == 0:
+            os.makedirs(subfolder)
+        name = SYNTHETIC_NAMES[index % len(SYNTHETIC_NAMES)] % (19750101 + index % 28, index % 2400)
+        os.close(os.open(os.path.join(subfolder, name), os.O_CREAT | os.O_WRONLY))
+
+
+class SyscallCounter(object):
+    """Count the calls of the os functions which result in a stat or a directory read."""
+    NAMES = ('stat', 'lstat', 'listdir', 'scandir')
+
+    def __init__(self):
+        self.counts = dict((name, 0) for name in self.NAMES)
+        self._originals = {}
+
+    def _wrap(self, name, function):
+        def counting(*args, **kwargs):
+            self.counts[name] += 1
+            return function(*args, **kwargs)
+        return counting
+
+    def __enter__(self):
+        for name in self.NAMES:
+            if hasattr(os, name):
+                self._originals[name] = getattr(os, name)
+                setattr(os, name, self._wrap(name, self._originals[name]))
+        if mediasort.scandir:
+            self._originals['mediasort.scandir'] = mediasort.scandir
+            mediasort.scandir = self._wrap('scandir', mediasort.scandir)
+        return self
+
+    def __exit__(self, *exc_info):
+        for name, function in self._originals.items():
+            if name == 'mediasort.scandir':
+                mediasort.scandir = function
+            else:
+                setattr(os, name, function)
+
+
+def baseline_walk(source, max_recursion_level, level=1):
+    """The walk of scan_files before walk_files: os.listdir, os.path.isdir per entry and once more
+    per datetime format tried for a name."""
+    for filename in os.listdir(source):
+        if os.path.isdir(os.path.join(source, filename)) and max_recursion_level and \
+                filename not in mediasort.skip_folders and max_recursion_level >= level:
+            for entry in baseline_walk(os.path.join(source, filename), max_recursion_level, level + 1):
+                yield entry
+        for datetime_format in mediasort.datetime_formats.values():
+            if mediasort.get_date_from_filename(filename, datetime_format):
+                break
+            elif os.path.isdir(os.path.join(source, filename)):
+                break
+        yield source, filename
+
+
+def bench_walk(options):
+    """Directory walk over a synthetic tree, counting stat calls and directory reads."""
+    folder = tempfile.mkdtemp(prefix="mediasort-bench-")
+    try:
+        create_synthetic_tree(folder, options.files)
+        walkers = [("walk: baseline listdir + isdir", lambda: baseline_walk(folder, 3)),
+                   ("walk: walk_files (%s)" % ("scandir" if mediasort.scandir else "listdir fallback"),
+                    lambda: mediasort.walk_files(folder, folder, 3))]
+        for name, walker in walkers:
+            with SyscallCounter() as counter:
+                start = timer()
+                for _ in walker():
+                    pass
+                elapsed = timer() - start
+            report(name, elapsed, options.files)
+            print("    " + ", ".join("%s: %d" % (call, counter.counts[call]) for call in SyscallCounter.NAMES))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def baseline_check_match(regex_pattern, filename):
+    match = False
+    for match in re.finditer(regex_pattern, filename, re.UNICODE):
+        pass
+    return match and all(match.groups())
+
+
+def baseline_classify(filename):
+    """Filename checks of scan_files before the FilenameClassifier: up to seven regexes built per name."""
+    if baseline_check_match(r"(?P<filename>.*)\.(?P<extension>%s)" % mediasort.FILE_EXTENSION_EXIF, filename):
+        return mediasort.get_date_from_filename(filename, mediasort.datetime_formats['IOS'])
+    for datetime_format in mediasort.datetime_formats.values():
+        for extensions in (mediasort.FILE_EXTENSION_VIDEO, mediasort.FILE_EXTENSION_EXIF,
+                           mediasort.FILE_EXTENSION_OTHER):
+            if baseline_check_match(r"(?P<filename>%s.*)\.(?P<extension>%s)" % (datetime_format['regex'], extensions),
+                                    filename):
+                return mediasort.get_date_from_filename(filename, datetime_format)
+    return None
+
+
+def synthetic_names(count):
+    names = SYNTHETIC_NAMES + ("IMG_%04d%04d.JPG", "PXL_%08d_%06d123.jpg")
+    return [(names[index % len(names)] % (19750101 + index % 28, index % 2400),) for index in range(count)]
+
+
+def bench_classify(options):
+    """Classification of synthetic filenames: per-name regexes versus the precompiled classifier."""
+    names = synthetic_names(options.names)
+    baseline = measure(baseline_classify, names, 1)
+    report("classify: regex per name", baseline, len(names))
+    report("classify: FilenameClassifier", measure(mediasort.filename_classifier.classify, names, 1), len(names),
+           baseline)
+
+
+def synthetic_rules(count, by):
+    """count - 1 rules which never match the synthetic names and a last rule taking all files.
+
+    The rules are for other extensions, other camera models or other filenames.
+    """
+    matchers = [{'extension': "x%03d" % index} if by == 'extension' else
+                {'model': "Model %03d" % index} if by == 'model' else {'filename': "x%03d_*" % index}
+                for index in range(count - 1)]
+    return rules.compile_rules({'rules': [{'match': match, 'target': "{year}/{model}"} for match in matchers] +
+                                         [{'target': "{year}/{month}/{model}"}]})
+
+
+def bench_rules(options):
+    """Finding the rule of a file with 1 rule and with 200 rules on extensions, models or filenames."""
+    files = [(name, name.rpartition('.')[2], "iPhone X", rules.DATE_SOURCE_EXIF)
+             for (name,) in synthetic_names(options.names)]
+    baseline = measure(synthetic_rules(1, 'extension').find, files, 1)
+    report("rules: 1 rule", baseline, len(files))
+    for by in ('extension', 'model', 'filename'):
+        report("rules: 200 rules by %s" % by, measure(synthetic_rules(200, by).find, files, 1), len(files), baseline)
+
+
+def baseline_foldername(date_str, pattern, output_pattern):
+    """make_foldername_from_date before fastdate: strptime and strftime per file."""
+    return datetime.strptime(date_str, pattern).strftime(output_pattern)
+
+
+def bench_foldername(options):
+    """Date to folder name conversion: strptime/strftime versus the fixed width parser."""
+    samples = []
+    for index in range(options.names // 10):
+        image_datetime = datetime(1975, 1, 1) + timedelta(minutes=index * 97)
+        pattern = (mediasort.DATETIME_FORMAT_EXIF, mediasort.datetime_formats['IOS']['datetime'],
+                   mediasort.datetime_formats['OTHER']['datetime'])[index % 3]
+        output_pattern = (mediasort.output_formats['MONTHLY'], mediasort.output_formats['DAILY'])[index % 2]
+        samples.append((image_datetime.strftime(pattern), pattern, output_pattern))
+    baseline = measure(baseline_foldername, samples, 1)
+    report("foldername: strptime + strftime", baseline, len(samples))
+    report("foldername: make_foldername_from_date", measure(mediasort.make_foldername_from_date, samples, 1),
+           len(samples), baseline)
+
+
+class CountingFile(object):
+    """File wrapper counting the bytes read."""
+
+    def __init__(self, wrapped_file):
+        self.wrapped_file = wrapped_file
+        self.bytes_read = 0
+
+    def read(self, size):
+        data = self.wrapped_file.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        return self.wrapped_file.seek(offset, whence)
+
+    def tell(self):
+        return self.wrapped_file.tell()
+
+
+def create_sparse_videos(folder, size):
+    """Create sparse MP4 (moov first and last) and AVI files with size bytes of media data."""
+    mvhd = struct.pack('>I4s4sII', 8 + 12 + 88, b'mvhd', b'\x00' * 4, 3640929300, 3640929300) + b'\x00' * 88
+    moov = struct.pack('>I4s', 8 + len(mvhd), b'moov') + mvhd
+    ftyp = struct.pack('>I4s8s', 16, b'ftyp', b'isom\x00\x00\x02\x00')
+    mdat_header = struct.pack('>I4sQ', 1, b'mdat', size + 16)
+    idit = struct.pack('<4sI', b'IDIT', 20) + b'2019:05:17 09:15:00\x00'
+    hdrl = struct.pack('<4sI4s', b'LIST', 4 + len(idit), b'hdrl') + idit
+    videos = {
+        "moov-first.mp4": (ftyp + moov + mdat_header, b''),
+        "moov-last.mp4": (ftyp + mdat_header, moov),
+        "large.avi": (b'RIFF' + struct.pack('<I', 0xffffffff) + b'AVI ' + hdrl +
+                      struct.pack('<4sI4s', b'LIST', min(size + 4, 0xffffffff), b'movi'), b''),
+    }
+    paths = []
+    for name, (head, tail) in sorted(videos.items()):
+        path = os.path.join(folder, name)
+        with open(path, 'wb') as video_file:
+            video_file.write(head)
+            video_file.truncate(len(head) + size)
+            video_file.seek(0, 2)
+            video_file.write(tail)
+        paths.append(path)
+    return paths
+
+
+def bench_video(options):
+    """Creation date of large sparse video files, bytes read per file."""
+    folder = tempfile.mkdtemp(prefix="mediasort-bench-")
+    try:
+        for path in create_sparse_videos(folder, options.video_size):
+            with open(path, 'rb') as video_file:
+                counting_file = CountingFile(video_file)
+                start = timer()
+                date_str = videoreader.parse_video(counting_file)
+                elapsed = timer() - start
+            report("video: " + os.path.basename(path), elapsed, 1)
+            print("    %s, %d bytes read of %d" % (date_str, counting_file.bytes_read, os.path.getsize(path)))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def scratch_folder(options):
+    if options.scratch:
+        return options.scratch
+    return TMPFS_FOLDER if os.access(TMPFS_FOLDER, os.W_OK) else None
+
+
+def tree_spec(options):
+    return synthtree.TreeSpec(options.files, options.depth, options.fanout, options.exif_ratio,
+                              options.video_ratio, options.undated_ratio, options.eadir_files)
+
+
+def bench_sort(options):
+    """End-to-end sort of a synthetic tree with the time per phase, simulated and with real moves."""
+    spec = tree_spec(options)
+    modes = SORT_MODES if options.mode == "both" else (options.mode,)
+    folder = tempfile.mkdtemp(prefix="mediasort-bench-", dir=scratch_folder(options))
+    try:
+        for mode in modes:
+            source = os.path.join(folder, "source")
+            target = os.path.join(folder, "target")
+            counts = synthtree.create_tree(source, spec)
+            stats = instrument.RunStats()
+            sorter = mediasort.Sorter(mediasort.SortOptions(target, recursion_level=spec.depth, jobs=options.jobs,
+                                                            simulate=mode == "simulate"), stats=stats)
+            start = timer()
+            plan = sorter.apply(sorter.iter_decisions(source))
+            elapsed = timer() - start
+            stats.finish()
+            summary = stats.to_dict()
+            report("sort: %s (%d jobs)" % (mode, options.jobs), elapsed, counts['files'],
+                   details={'tree': counts, 'moves': len(plan), 'moved': plan.moved, 'outcomes': summary['outcomes'],
+                            'phases': summary['phases']})
+            for phase in instrument.PHASES:
+                if phase in summary['phases']:
+                    values = summary['phases'][phase]
+                    print("    %-10s %8d calls %10.3f ms %10.1f us/call" % (phase, values['count'],
+                                                                           values['total'] * 1000,
+                                                                           values['mean'] * 1000000))
+            shutil.rmtree(source)
+            shutil.rmtree(target, ignore_errors=True)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def bench_transfer(options):
+    """Files of --transfer-size bytes moved, copied, hard linked and cloned, against a read/write copy."""
+    folder = tempfile.mkdtemp(prefix="mediasort-bench-", dir=scratch_folder(options))
+    target_folder = tempfile.mkdtemp(prefix="mediasort-bench-", dir=options.transfer_target or folder)
+    content = os.urandom(options.transfer_size)
+    kernel_copies = planner._kernel_copies
+    baseline = None
+    try:
+        for mode in ("read/write",) + planner.MODES:
+            source = os.path.join(folder, "source")
+            target = os.path.join(target_folder, "target")
+            os.makedirs(source)
+            plan = planner.MovePlan(mode=planner.MODE_COPY if mode == "read/write" else mode)
+            for index in range(options.transfer_files):
+                path = os.path.join(source, "IMG_%05d.JPG" % index)
+                synthtree.write_file(path, content)
+                plan.add(path, target)
+            if mode == "read/write":
+                planner._kernel_copies = lambda: []
+            try:
+                start = timer()
+                plan.execute()
+                elapsed = timer() - start
+            finally:
+                planner._kernel_copies = kernel_copies
+            report("transfer: %s" % mode, elapsed, plan.moved, baseline,
+                   details={'bytes': plan.moved_bytes, 'copied_bytes': plan.copied_bytes,
+                            'linked_bytes': plan.linked_bytes, 'bytes_per_second': plan.throughput()})
+            print("    %d bytes copied, %d bytes linked, %.1f MB/s" % (plan.copied_bytes, plan.linked_bytes,
+                                                                     plan.throughput() / 1000000))
+            if baseline is None:
+                baseline = elapsed
+            shutil.rmtree(source)
+            shutil.rmtree(target, ignore_errors=True)
+    finally:
+        shutil.rmtree(target_folder, ignore_errors=True)
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def index_size(names):
+    """Bytes allocated for a TargetIndex of the names, None before Python 3.4."""
+    try:
+        import tracemalloc
+    except ImportError:
+        return None
+    tracemalloc.start()
+    index = targetindex.TargetIndex()
+    index.folder_created(["new"])
+    for name in names:
+        index.claim("new", name, 0)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size
+
+
+def bench_index(options):
+    """--files names claimed in a target folder of --files files, one in ten taken, against an lexists() per name."""
+    folder = tempfile.mkdtemp(prefix="mediasort-bench-", dir=scratch_folder(options))
+    try:
+        for index in range(options.files):
+            synthtree.write_file(os.path.join(folder, "IMG_%07d.JPG" % index), b"")
+        # one name in ten is taken
+        names = ["IMG_%07d.JPG" % index for index in range(options.files - options.files // 10,
+                                                           options.files * 2 - options.files // 10)]
+
+        def lexists():
+            for name in names:
+                os.path.lexists(os.path.join(folder, name))
+
+        def claim():
+            index = targetindex.TargetIndex()
+            for name in names:
+                index.claim(folder, name, 1)
+
+        baseline = measure(lexists, [()], 1)
+        report("index: lexists", baseline, len(names))
+        elapsed = measure(claim, [()], 1)
+        size = index_size(names)
+        report("index: claim", elapsed, len(names), baseline, details={'bytes': size})
+        if size is not None:
+            print("    %.1f bytes per name" % (size / float(len(names))))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+# modules mediasort imported at startup before they were imported on first use
+EAGER_IMPORTS = "import PIL.ExifTags, PIL.Image, sqlite3, ctypes.util, csv, cProfile, multiprocessing.pool"
+# new interpreters started per startup measurement, the fastest one counts
+STARTUP_ROUNDS = 20
+# direct imports of mediasort listed by the startup benchmark
+SLOWEST_IMPORTS = 8
+
+
+def run_python(arguments, rounds):
+    """Shortest wall time of running python with arguments in a new process, in the folder of mediasort."""
+    folder = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for _ in range(rounds):
+        start = timer()
+        subprocess.check_call([sys.executable] + arguments, cwd=folder)
+        elapsed = timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def slowest_imports(code):
+    """[(microseconds, module)] of the modules imported directly by code, from python -X importtime."""
+    process = subprocess.Popen([sys.executable, "-X", "importtime", "-c", code],
+                               cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.PIPE)
+    imports = []
+    for line in process.communicate()[1].decode('ascii', 'replace').splitlines():
+        fields = line.split('|')
+        # "import time: self | cumulative | name", direct imports are indented by two spaces
+        if len(fields) == 3 and fields[2].startswith("   ") and not fields[2].startswith("    "):
+            imports.append((int(fields[1]), fields[2].strip()))
+    return sorted(imports, reverse=True)[:SLOWEST_IMPORTS]
+
+
+def bench_startup(options):
+    """Startup cost in new processes: importing mediasort and a run on an empty source folder."""
+    rounds = min(options.rounds, STARTUP_ROUNDS)
+    folder = tempfile.mkdtemp(prefix="mediasort-bench-")
+    try:
+        interpreter = run_python(["-c", "pass"], rounds)
+        report("startup: python", interpreter, 1)
+        baseline = run_python(["-c", EAGER_IMPORTS + "; import mediasort"], rounds) - interpreter
+        report("startup: eager imports + mediasort", baseline, 1)
+        report("startup: import mediasort", run_python(["-c", "import mediasort"], rounds) - interpreter, 1,
+               baseline)
+        run = "import sys, mediasort; mediasort.main(sys.argv[1:])"
+        report("startup: run on an empty folder", run_python(["-c", run, "-i", folder, "-o", folder,
+                                                              "-c", os.path.join(folder, "cache")], rounds)
+               - interpreter, 1)
+        if sys.version_info >= (3, 7):
+            for microseconds, module in slowest_imports("import mediasort"):
+                print("    %-20s %8.1f ms" % (module, microseconds / 1000.0))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+BENCHMARKS = {
+    'classify': bench_classify,
+    'exif': bench_exif,
+    'foldername': bench_foldername,
+    'index': bench_index,
+    'rules': bench_rules,
+    'sort': bench_sort,
+    'startup': bench_startup,
+    'transfer': bench_transfer,
+    'video': bench_video,
+    'walk': bench_walk,
+}
+
+
+def main(argv):
+    parser = OptionParser(usage="%prog [options] [" + "|".join(sorted(BENCHMARKS)) + " ...]")
+    parser.add_option("-n", "--rounds", type="int", dest="rounds", default=200,
+                      help="Repeat each benchmark ROUNDS times. Default = 200")
+    parser.add_option("-f", "--files", type="int", dest="files", default=100000,
+                      help="Number of files in synthetic trees. Default = 100000")
+    parser.add_option("--names", type="int", dest="names", default=1000000,
+                      help="Number of synthetic filenames to classify. Default = 1000000")
+    parser.add_option("--video-size", type="int", dest="video_size", default=4 * 1024 ** 3,
+                      help="Bytes of media data in the sparse video files. Default = 4 GiB")
+    parser.add_option("--depth", type="int", dest="depth", default=3,
+                      help="Levels of subfolders in synthetic media trees. Default = 3")
+    parser.add_option("--fanout", type="int", dest="fanout", default=10,
+                      help="Subfolders per folder in synthetic media trees. Default = 10")
+    parser.add_option("--exif-ratio", type="float", dest="exif_ratio", default=0.4,
+                      help="Fraction of JPEGs with EXIF data in synthetic media trees. Default = 0.4")
+    parser.add_option("--video-ratio", type="float", dest="video_ratio", default=0.3,
+                      help="Fraction of videos in synthetic media trees. Default = 0.3")
+    parser.add_option("--undated-ratio", type="float", dest="undated_ratio", default=0.1,
+                      help="Fraction of undated files in synthetic media trees. Default = 0.1")
+    parser.add_option("--eadir-files", type="int", dest="eadir_files", default=2,
+                      help="Thumbnails in the @eaDir folder of every folder. Default = 2")
+    parser.add_option("--mode", type="choice", choices=SORT_MODES + ("both",), dest="mode", default="both",
+                      help="MODE = simulate|move|both, sort benchmark: plan only or move the files. Default = both")
+    parser.add_option("-j", "--jobs", type="int", dest="jobs", default=1,
+                      help="Worker threads of the sort benchmark. Default = 1")
+    parser.add_option("--transfer-files", type="int", dest="transfer_files", default=100,
+                      help="Files per mode of the transfer benchmark. Default = 100")
+    parser.add_option("--transfer-size", type="int", dest="transfer_size", default=8 * 1024 ** 2,
+                      help="Size of the files of the transfer benchmark in bytes. Default = 8 MiB")
+    parser.add_option("--transfer-target", type="string", dest="transfer_target",
+                      help="Volume the transfer benchmark writes to. Default = the scratch folder")
+    parser.add_option("--scratch", type="string", dest="scratch",
+                      help="Create synthetic trees in SCRATCH. Default = /dev/shm if writable, else the temp dir")
+    parser.add_option("--json", type="string", dest="json",
+                      help="Write the results as JSON to JSON")
+    (options, args) = parser.parse_args(argv)
+
+    # the warnings about undated files would flood the output
+    logging.basicConfig(level=logging.ERROR)
+    for name in args or sorted(BENCHMARKS):
+        if name not in BENCHMARKS:
+            parser.error("Unknown benchmark: " + name)
+        BENCHMARKS[name](options)
+    if options.json:
+        write_results(options.json, options)
+
+
+def source_version():
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"], stderr=subprocess.STDOUT,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, options):
+    with open(path, 'w') as results_file:
+        json.dump({'version': source_version(),
+                   'python': platform.python_version(),
+                   'platform': platform.platform(),
+                   'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                   'options': vars(options),
+                   'results': results}, results_file, indent=2, separators=(',', ': '), sort_keys=True)
+        results_file.write("\n")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
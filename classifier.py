@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Salih Kiliclioglu
+
+# Filename classifier for mediasort.
+# The extension is looked up in a dict and all datetime formats are combined into
+# one precompiled regex, so a filename is classified with a single search.
+
+import hashlib
+import re
+
+KIND_EXIF = "exif"
+KIND_VIDEO = "video"
+KIND_OTHER = "other"
+
+# regex for the strptime directives usable in filename dates
+DIRECTIVE_REGEX = {
+    'Y': r'\d{4}',
+    'y': r'\d{2}',
+    'm': r'\d{2}',
+    'd': r'\d{2}',
+    'H': r'\d{2}',
+    'M': r'\d{2}',
+    'S': r'\d{2}',
+    'j': r'\d{3}',
+    '%': '%',
+}
+
+
+def regex_from_datetime_pattern(pattern):
+    """Build the regex matching a strptime pattern, e.g. %Y%m%d_%H%M -> \\d{4}\\d{2}\\d{2}_\\d{2}\\d{2}."""
+    regex = []
+    position = 0
+    while position < len(pattern):
+        if pattern[position] == '%':
+            directive = pattern[position + 1:position + 2]
+            if directive not in DIRECTIVE_REGEX:
+                raise ValueError("Unsupported directive %" + directive + " in " + pattern)
+            regex.append(DIRECTIVE_REGEX[directive])
+            position += 2
+        else:
+            regex.append(re.escape(pattern[position]))
+            position += 1
+    return "".join(regex)
+
+
+def split_extensions(extensions):
+    """Accept extensions as 'JPG|jpg' string or as a list."""
+    if hasattr(extensions, 'split'):
+        return extensions.split('|')
+    return extensions
+
+
+class FilenameClassifier(object):
+    """Classify filenames by extension and find the date in the name.
+
+    datetime_formats: dict NAME -> {'regex': ..., 'datetime': strptime pattern}
+    Extensions are case sensitive, like the lists they are built from.
+    """
+
+    def __init__(self, datetime_formats, exif_extensions, video_extensions, other_extensions):
+        self.kinds = {}
+        for kinds, extensions in ((KIND_EXIF, exif_extensions), (KIND_VIDEO, video_extensions),
+                                  (KIND_OTHER, other_extensions)):
+            for extension in split_extensions(extensions):
+                self.kinds[extension] = kinds
+        self.formats = []
+        for name in sorted(datetime_formats):
+            self.formats.append((name, datetime_formats[name]['regex'], datetime_formats[name]['datetime']))
+        self._compile()
+
+    def add_datetime_format(self, name, datetime_pattern, regex=None):
+        """Add a datetime format. The regex is derived from the strptime pattern if not given."""
+        self.formats.append((name, regex or regex_from_datetime_pattern(datetime_pattern), datetime_pattern))
+        self._compile()
+
+    def _compile(self):
+        self._groups = ["f%d" % index for index in range(len(self.formats))]
+        self._date_regex = re.compile("|".join("(?P<%s>%s)" % (group, date_format[1])
+                                               for group, date_format in zip(self._groups, self.formats)),
+                                      re.UNICODE)
+
+    def fingerprint(self):
+        """Short hash of the datetime formats, a date found with other formats may differ."""
+        text = "\n".join("%s\t%s" % (regex, datetime_pattern) for _, regex, datetime_pattern in self.formats)
+        if not isinstance(text, bytes):
+            text = text.encode('utf-8')
+        return hashlib.sha1(text).hexdigest()[:16]
+
+    def find_date(self, filename):
+        """Return (date_str, strptime pattern) of the leftmost date in filename or (None, None)."""
+        match = self._date_regex.search(filename)
+        if match:
+            for group, date_format in zip(self._groups, self.formats):
+                if match.group(group) is not None:
+                    return match.group(group), date_format[2]
+        return None, None
+
+    def classify(self, filename):
+        """Return (kind, date_str, strptime pattern). kind is None for unknown extensions."""
+        stem, dot, extension = filename.rpartition('.')
+        kind = self.kinds.get(extension) if dot else None
+        if kind is None:
+            return None, None, None
+        date_str, date_pattern = self.find_date(stem)
+        return kind, date_str, date_pattern
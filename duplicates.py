@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Salih Kiliclioglu
+
+# Duplicate detection for mediasort.
+# Files can only be identical if their sizes are equal, so the files are grouped by
+# size first. Within a size group only the first and the last block are hashed, the
+# whole file is hashed only if those collide as well. Hashing runs in worker threads,
+# hashlib and file reads release the GIL.
+# The hashes of the files in the target folders are kept in an index between runs,
+# validated by size and mtime like the date cache.
+# sqlite3 and the thread pool are imported on first use, they are slow to import and
+# only needed with --duplicates.
+
+import hashlib
+import logging
+import os
+import stat
+import threading
+
+try:
+    from os import fsencode as _key
+except ImportError:
+    # Python 2 paths are byte strings already
+    def _key(path):
+        return path
+
+# increase whenever the way hashes are computed changes, older indexes are dropped then
+INDEX_VERSION = 1
+
+EDGE_BLOCK_SIZE = 64 * 1024
+HASH_BUFFER_SIZE = 1024 * 1024
+
+
+def hash_edges(path, size):
+    """Hash of the first and the last block. Covers the whole file if it is at most two blocks long."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as media_file:
+        digest.update(media_file.read(EDGE_BLOCK_SIZE))
+        if size > EDGE_BLOCK_SIZE:
+            media_file.seek(max(size - EDGE_BLOCK_SIZE, EDGE_BLOCK_SIZE))
+            digest.update(media_file.read(EDGE_BLOCK_SIZE))
+    return digest.hexdigest()
+
+
+def hash_file(path):
+    """Hash of the whole file, read in fixed size chunks."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as media_file:
+        chunk = media_file.read(HASH_BUFFER_SIZE)
+        while chunk:
+            digest.update(chunk)
+            chunk = media_file.read(HASH_BUFFER_SIZE)
+    return digest.hexdigest()
+
+
+def import_thread_pool():
+    try:
+        from multiprocessing.pool import ThreadPool
+    except ImportError:
+        return None
+    return ThreadPool
+
+
+class HashIndex(object):
+    """Hashes of already sorted files, path -> (size, mtime, edge hash, full hash)."""
+
+    def __init__(self, path=":memory:"):
+        import sqlite3
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.text_factory = str
+        if self._db.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+            self._db.execute("DROP TABLE IF EXISTS hashes")
+            self._db.execute("PRAGMA user_version = %d" % INDEX_VERSION)
+        self._db.execute("CREATE TABLE IF NOT EXISTS hashes ("
+                         "path TEXT PRIMARY KEY, size INTEGER, mtime REAL, edges TEXT, full TEXT)")
+
+    def get(self, path, stat_result):
+        """Return (edge hash, full hash), either may be None."""
+        row = self._db.execute("SELECT size, mtime, edges, full FROM hashes WHERE path = ?", (_key(path),)).fetchone()
+        if row is None or tuple(row[:2]) != (stat_result.st_size, stat_result.st_mtime):
+            return None, None
+        return row[2], row[3]
+
+    def put(self, path, stat_result, edges, full):
+        self._db.execute("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)",
+                         (_key(path), stat_result.st_size, stat_result.st_mtime, edges, full))
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
+
+
+class Candidate(object):
+    __slots__ = ('path', 'size', 'stat', 'is_source', 'edges', 'full')
+
+    def __init__(self, path, stat_result, is_source):
+        self.path = path
+        self.size = stat_result.st_size
+        self.stat = stat_result
+        self.is_source = is_source
+        self.edges = None
+        self.full = None
+
+
+class DuplicateFinder(object):
+    """Find the moves whose file already exists in one of the target folders of a plan.
+
+    Only the target folders of the plan are indexed: a copy of a file gets the same date
+    and therefore the same target folder. Empty files are never reported as duplicates.
+    """
+
+    def __init__(self, index=None, jobs=1):
+        self.index = index or HashIndex()
+        self.jobs = jobs
+        self.edge_hashes = 0
+        self.full_hashes = 0
+        self.duplicates = 0
+        self._hashes = {}  # source file -> (edge hash, full hash) of the last find()
+        # plans of several sources may be checked in parallel, they are checked one after another
+        self._lock = threading.Lock()
+
+    def find(self, moves):
+        """Return {source file: identical file} for moves = [(source file, target folder)].
+
+        The identical file is a file in a target folder or the source of an earlier move.
+        """
+        with self._lock:
+            return self._find(moves)
+
+    def _find(self, moves):
+        candidates = []
+        for folder in sorted(set(target_folder for _, target_folder in moves)):
+            candidates.extend(self.list_folder(folder))
+        for source_file, _ in moves:
+            try:
+                candidates.append(Candidate(source_file, os.stat(source_file), True))
+            except OSError as error:
+                logging.error("%s", error)
+
+        by_size = {}
+        for candidate in candidates:
+            if candidate.size:
+                by_size.setdefault(candidate.size, []).append(candidate)
+        groups = [group for group in by_size.values() if len(group) > 1 and any(c.is_source for c in group)]
+
+        self.hash_all([c for group in groups for c in group], 'edges')
+        colliding = []
+        for group in groups:
+            by_edges = {}
+            for candidate in group:
+                if candidate.edges:
+                    by_edges.setdefault(candidate.edges, []).append(candidate)
+            for same_edges in by_edges.values():
+                if len(same_edges) > 1 and any(c.is_source for c in same_edges):
+                    colliding.extend(same_edges)
+        self.hash_all(colliding, 'full')
+
+        originals = {}
+        duplicates = {}
+        for candidate in candidates:
+            if candidate.full is None:
+                continue
+            original = originals.setdefault(candidate.full, candidate.path)
+            if candidate.is_source and original != candidate.path:
+                duplicates[candidate.path] = original
+        # kept for record() if the file is moved to its target folder
+        for candidate in candidates:
+            if candidate.is_source and candidate.edges and candidate.path not in duplicates:
+                self._hashes[candidate.path] = (candidate.edges, candidate.full)
+        self.duplicates += len(duplicates)
+        return duplicates
+
+    def list_folder(self, folder):
+        try:
+            names = os.listdir(folder)
+        except OSError:
+            return []  # not created yet
+        candidates = []
+        for name in sorted(names):
+            path = os.path.join(folder, name)
+            try:
+                stat_result = os.stat(path)
+            except OSError:
+                continue
+            if stat.S_ISREG(stat_result.st_mode):
+                candidate = Candidate(path, stat_result, False)
+                candidate.edges, candidate.full = self.index.get(path, stat_result)
+                candidates.append(candidate)
+        return candidates
+
+    def hash_all(self, candidates, attribute):
+        """Compute the edge or full hash of the candidates which don't have it yet."""
+        missing = [c for c in candidates if getattr(c, attribute) is None]
+        if attribute == 'full':
+            # the edge hash of a small file covers the whole file already
+            for candidate in missing:
+                if candidate.size <= 2 * EDGE_BLOCK_SIZE:
+                    candidate.full = candidate.edges
+            missing = [c for c in missing if c.full is None]
+        if not missing:
+            return
+
+        def compute(candidate):
+            try:
+                if attribute == 'edges':
+                    return hash_edges(candidate.path, candidate.size)
+                return hash_file(candidate.path)
+            except (IOError, OSError) as error:
+                logging.error("%s", error)
+                return None
+
+        thread_pool = import_thread_pool() if self.jobs > 1 and len(missing) > 1 else None
+        if thread_pool:
+            pool = thread_pool(min(self.jobs, len(missing)))
+            try:
+                hashes = pool.map(compute, missing)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            hashes = [compute(candidate) for candidate in missing]
+        for candidate, file_hash in zip(missing, hashes):
+            setattr(candidate, attribute, file_hash)
+            if not candidate.is_source and file_hash:
+                self.index.put(candidate.path, candidate.stat, candidate.edges, candidate.full)
+        if attribute == 'edges':
+            self.edge_hashes += len(missing)
+        else:
+            self.full_hashes += len(missing)
+
+    def record(self, completed_moves, moves=()):
+        """Add the hashes of moved files to the index, completed_moves = [(source file, target file)].
+
+        The hashes of the other moves = [(source file, target folder)] of the plan are dropped.
+        """
+        with self._lock:
+            self._record(completed_moves, moves)
+
+    def _record(self, completed_moves, moves):
+        for source_file, target_file in completed_moves:
+            edges, full = self._hashes.pop(source_file, (None, None))
+            if edges:
+                try:
+                    self.index.put(target_file, os.stat(target_file), edges, full)
+                except OSError:
+                    pass
+        for source_file, _ in moves:
+            self._hashes.pop(source_file, None)
+
+    def close(self):
+        self.index.close()
+        logging.info("[DUPLICATES] %d found, %d edge hashes, %d full hashes",
+                     self.duplicates, self.edge_hashes, self.full_hashes)
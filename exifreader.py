@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Salih Kiliclioglu
+
+# Minimal EXIF reader used by mediasort.
+# Only the file header is read: the JPEG APP1 segment, the PNG eXIf chunk or the
+# TIFF IFD0/ExifIFD entries. Just the capture datetime and the camera model are
+# decoded, every other tag is skipped without being parsed.
+# Formats which are not understood are handed over to Pillow, which is imported only then.
+
+import io
+import logging
+import struct
+
+TAG_MODEL = 0x0110
+TAG_DATETIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+
+TYPE_ASCII = 2
+TYPE_LONG = 4
+TYPE_IFD = 13
+
+JPEG_SOI = b'\xff\xd8'
+JPEG_APP1 = 0xE1
+JPEG_SOS = 0xDA
+JPEG_EOI = 0xD9
+EXIF_HEADER = b'Exif\x00\x00'
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_EXIF_CHUNK = b'eXIf'
+PNG_STOP_CHUNKS = (b'IDAT', b'IEND')
+
+TIFF_HEADERS = (b'II*\x00', b'MM\x00*')
+
+# upper limit for an IFD entry count, protects against corrupt offsets
+MAX_IFD_ENTRIES = 1024
+
+
+def read_metadata(path):
+    """Return (datetime, model) of an image file. Each value is None if not available."""
+    with open(path, 'rb') as image_file:
+        header = image_file.read(8)
+        image_file.seek(0)
+        try:
+            if header[:2] == JPEG_SOI:
+                return parse_tiff(find_jpeg_exif(image_file))
+            if header == PNG_SIGNATURE:
+                return parse_tiff(find_png_exif(image_file))
+            if header[:4] in TIFF_HEADERS:
+                return parse_tiff(image_file)
+        except (struct.error, ValueError) as error:
+            logging.debug("Invalid EXIF header in %s: %s", path, error)
+            return None, None
+    return read_metadata_with_pillow(path)
+
+
+def read_metadata_with_pillow(path):
+    """Fallback for formats without a dedicated reader."""
+    logging.debug("Pillow EXIF fallback: %s", path)
+    from PIL import Image
+    try:
+        image = Image.open(path)
+    except IOError as error:
+        logging.debug("%s: %s", path, error)
+        return None, None
+    exif_data = getattr(image, '_getexif', lambda: None)()
+    if not exif_data:
+        return None, None
+    return exif_data.get(TAG_DATETIME) or exif_data.get(TAG_DATETIME_ORIGINAL), exif_data.get(TAG_MODEL)
+
+
+def find_jpeg_exif(jpeg_file):
+    """Return the TIFF structure embedded in the APP1 segment or None."""
+    jpeg_file.seek(2)
+    while True:
+        marker = jpeg_file.read(2)
+        if len(marker) < 2 or marker[:1] != b'\xff':
+            return None
+        marker_type = struct.unpack('>B', marker[1:])[0]
+        if marker_type == 0xFF:
+            # fill byte, the marker type follows
+            jpeg_file.seek(-1, io.SEEK_CUR)
+            continue
+        if marker_type in (JPEG_SOS, JPEG_EOI):
+            return None
+        if marker_type == 0x01 or 0xD0 <= marker_type <= 0xD7:
+            # standalone markers without length
+            continue
+        length = struct.unpack('>H', jpeg_file.read(2))[0]
+        if marker_type == JPEG_APP1:
+            segment = jpeg_file.read(length - 2)
+            if segment[:6] == EXIF_HEADER:
+                return io.BytesIO(segment[6:])
+        else:
+            jpeg_file.seek(length - 2, io.SEEK_CUR)
+
+
+def find_png_exif(png_file):
+    """Return the TIFF structure stored in the eXIf chunk or None."""
+    png_file.seek(len(PNG_SIGNATURE))
+    while True:
+        chunk_header = png_file.read(8)
+        if len(chunk_header) < 8:
+            return None
+        length, chunk_type = struct.unpack('>I4s', chunk_header)
+        if chunk_type == PNG_EXIF_CHUNK:
+            chunk = png_file.read(length)
+            # some writers keep the JPEG APP1 prefix
+            if chunk[:6] == EXIF_HEADER:
+                chunk = chunk[6:]
+            return io.BytesIO(chunk)
+        if chunk_type in PNG_STOP_CHUNKS:
+            return None
+        # skip data and CRC
+        png_file.seek(length + 4, io.SEEK_CUR)
+
+
+def parse_tiff(tiff_file):
+    """Read DateTime (or DateTimeOriginal) and Model from a TIFF structure.
+
+    tiff_file is a seekable file object positioned on the TIFF header at offset 0.
+    """
+    if tiff_file is None:
+        return None, None
+    header = tiff_file.read(8)
+    if header[:2] == b'II':
+        byte_order = '<'
+    elif header[:2] == b'MM':
+        byte_order = '>'
+    else:
+        raise ValueError("Unknown TIFF byte order")
+    magic, ifd_offset = struct.unpack(byte_order + 'HI', header[2:8])
+    if magic != 42:
+        raise ValueError("Invalid TIFF magic number")
+
+    ifd0 = read_ifd(tiff_file, byte_order, ifd_offset, (TAG_DATETIME, TAG_MODEL, TAG_EXIF_IFD))
+    date_str = ifd0.get(TAG_DATETIME)
+    if not date_str and TAG_EXIF_IFD in ifd0:
+        exif_ifd = read_ifd(tiff_file, byte_order, ifd0[TAG_EXIF_IFD], (TAG_DATETIME_ORIGINAL,))
+        date_str = exif_ifd.get(TAG_DATETIME_ORIGINAL)
+    return date_str or None, ifd0.get(TAG_MODEL)
+
+
+def read_ifd(tiff_file, byte_order, offset, wanted_tags):
+    """Return a dict with the values of wanted_tags found in the IFD at offset."""
+    values = {}
+    tiff_file.seek(offset)
+    count = struct.unpack(byte_order + 'H', tiff_file.read(2))[0]
+    if count > MAX_IFD_ENTRIES:
+        raise ValueError("Too many IFD entries")
+    entries = tiff_file.read(count * 12)
+    for index in range(count):
+        tag, value_type, value_count, value = struct.unpack(byte_order + 'HHI4s', entries[index * 12:index * 12 + 12])
+        if tag not in wanted_tags:
+            continue
+        if value_type == TYPE_ASCII:
+            if value_count > 4:
+                tiff_file.seek(struct.unpack(byte_order + 'I', value)[0])
+                value = tiff_file.read(value_count)
+            values[tag] = decode_ascii(value[:value_count])
+        elif value_type in (TYPE_LONG, TYPE_IFD):
+            values[tag] = struct.unpack(byte_order + 'I', value)[0]
+    return values
+
+
+def decode_ascii(value):
+    value = value.rstrip(b'\x00')
+    if str is bytes:
+        return value
+    return value.decode('latin-1')
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Salih Kiliclioglu
+
+# Date to folder name conversion without strptime.
+# The datetime formats of mediasort are fixed width, so one precompiled regex per
+# pattern splits the string into its digit fields. Folder names which only depend
+# on the date are memoized per (year, month, day, output pattern), keyed by the
+# digit strings, so a known day costs one regex match and one dict lookup.
+# folder_name() returns None for everything it can't handle exactly like strptime,
+# the caller falls back to strptime then.
+
+from datetime import date, datetime
+
+import re
+
+# width of the directives which are parsed by the fast path
+FIXED_WIDTH_DIRECTIVES = {'Y': 4, 'm': 2, 'd': 2, 'H': 2, 'M': 2, 'S': 2}
+FIELDS = 'YmdHMS'
+# values strptime uses for missing fields, in the order of FIELDS
+FIELD_DEFAULTS = ('1900', '01', '01', '00', '00', '00')
+
+# strftime directives which only depend on the date, folder names using just these are memoized
+DATE_DIRECTIVES = frozenset('aAbBdjmUwWyY%')
+
+_layouts = {}  # pattern -> (compiled regex, group index per field) or None
+_memoizable = {}  # output pattern -> bool
+_folder_names = {}  # (year, month, day, output pattern) -> folder name or _INVALID
+_INVALID = object()
+
+
+def compile_layout(pattern):
+    """Return (regex, group index per field) for a fixed width pattern or None."""
+    regex = []
+    groups = [None] * len(FIELDS)
+    group = 0
+    index = 0
+    while index < len(pattern):
+        if pattern[index] == '%':
+            directive = pattern[index + 1:index + 2]
+            if directive not in FIXED_WIDTH_DIRECTIVES or groups[FIELDS.index(directive)] is not None:
+                return None
+            groups[FIELDS.index(directive)] = group
+            group += 1
+            regex.append("([0-9]{%d})" % FIXED_WIDTH_DIRECTIVES[directive])
+            index += 2
+        else:
+            # whitespace matches any amount of whitespace in strptime, here exactly the same
+            # character is required, other input falls back to strptime
+            regex.append(re.escape(pattern[index]))
+            index += 1
+    return re.compile("".join(regex) + r"\Z"), tuple(groups)
+
+
+def is_memoizable(output_pattern):
+    if output_pattern not in _memoizable:
+        directives = output_pattern.split('%')[1:]
+        _memoizable[output_pattern] = all(directive[:1] in DATE_DIRECTIVES for directive in directives)
+    return _memoizable[output_pattern]
+
+
+def split_fields(date_str, pattern):
+    """Return the digit strings for year, month, day, hour, minute and second or None."""
+    try:
+        layout = _layouts[pattern]
+    except KeyError:
+        layout = _layouts[pattern] = compile_layout(pattern)
+    if layout is None:
+        return None
+    match = layout[0].match(date_str)
+    if match is None:
+        return None
+    values = match.groups()
+    return tuple(FIELD_DEFAULTS[field] if group is None else values[group] for field, group in enumerate(layout[1]))
+
+
+def make_date(year, month, day):
+    """Return a date or None where strptime would raise a ValueError."""
+    try:
+        return date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+def folder_name(date_str, pattern, output_pattern):
+    """Same as datetime.strptime(date_str, pattern).strftime(output_pattern) or None."""
+    fields = split_fields(date_str, pattern)
+    # two digit strings compare like numbers
+    if fields is None or fields[3] > '23' or fields[4] > '59' or fields[5] > '59':
+        return None
+    if not is_memoizable(output_pattern):
+        day = make_date(*fields[:3])
+        if day is None:
+            return None
+        return datetime(day.year, day.month, day.day, *map(int, fields[3:])).strftime(output_pattern)
+
+    key = fields[:3] + (output_pattern,)
+    name = _folder_names.get(key)
+    if name is None:
+        day = make_date(*fields[:3])
+        name = _folder_names[key] = _INVALID if day is None else day.strftime(output_pattern)
+    if name is _INVALID:
+        return None
+    return name
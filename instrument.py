@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Salih Kiliclioglu
+
+# Run statistics for mediasort.
+# Every phase (walk, classify, exif, video, foldername, mkdir, move) keeps a count, the
+# total and maximum time and a histogram with power of two buckets in microseconds, so
+# recording a measurement is a few additions. The slowest files are kept in a small heap.
+# At the end of a run the summary is logged and written as JSON or CSV.
+
+import heapq
+import json
+import logging
+import threading
+import time
+
+timer = getattr(time, 'perf_counter', time.time)
+
+PHASES = ('walk', 'classify', 'exif', 'video', 'foldername', 'mkdir', 'move')
+HISTOGRAM_BUCKETS = 32
+SLOWEST_FILES = 10
+
+
+class Histogram(object):
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        # bucket n counts the measurements below 2**n microseconds
+        self.buckets[min(int(elapsed * 1000000).bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+    def to_dict(self):
+        return {'count': self.count,
+                'total': self.total,
+                'mean': self.total / self.count if self.count else 0.0,
+                'max': self.max,
+                'histogram_us': dict(("<%d" % (1 << bucket), count)
+                                     for bucket, count in enumerate(self.buckets) if count)}
+
+
+class RunStats(object):
+    """Counters of one run. add() and add_file() may be called from worker threads."""
+
+    def __init__(self, clock=timer):
+        self.clock = clock
+        self.started = clock()
+        self.finished = None
+        self.phases = dict((phase, Histogram()) for phase in PHASES)
+        self.outcomes = {}
+        self.files = 0
+        self.bytes_moved = 0  # size of the files moved, copied or linked
+        self.bytes_copied = 0  # data copied
+        self.bytes_linked = 0  # hard linked or cloned without copying the data
+        self._slowest = []  # heap of (seconds, path)
+        self._lock = threading.Lock()
+
+    def add(self, phase, elapsed):
+        with self._lock:
+            self.phases[phase].add(elapsed)
+
+    def add_file(self, path, elapsed):
+        """Count a file which was looked at, elapsed = time needed to find its date."""
+        with self._lock:
+            self.files += 1
+            if len(self._slowest) < SLOWEST_FILES:
+                heapq.heappush(self._slowest, (elapsed, path))
+            elif elapsed > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, (elapsed, path))
+
+    def add_bytes(self, moved_bytes, copied_bytes=0, linked_bytes=0):
+        with self._lock:
+            self.bytes_moved += moved_bytes
+            self.bytes_copied += copied_bytes
+            self.bytes_linked += linked_bytes
+
+    def count(self, outcome, number=1):
+        with self._lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + number
+
+    def finish(self):
+        self.finished = self.clock()
+
+    def elapsed(self):
+        return (self.finished or self.clock()) - self.started
+
+    def slowest(self):
+        return sorted(self._slowest, reverse=True)
+
+    def to_dict(self):
+        elapsed = self.elapsed()
+        move_time = self.phases['move'].total
+        return {'elapsed': elapsed,
+                'files': self.files,
+                'files_per_second': self.files / elapsed if elapsed else 0.0,
+                'bytes_moved': self.bytes_moved,
+                'bytes_copied': self.bytes_copied,
+                'bytes_linked': self.bytes_linked,
+                # throughput of the move phase, bytes per second spent moving, copying or linking
+                'bytes_per_second': self.bytes_moved / move_time if move_time else 0.0,
+                'outcomes': self.outcomes,
+                'phases': dict((phase, histogram.to_dict()) for phase, histogram in self.phases.items()
+                               if histogram.count),
+                'slowest_files': [{'path': path, 'seconds': seconds} for seconds, path in self.slowest()]}
+
+    def log(self):
+        summary = self.to_dict()
+        logging.info("[REPORT] %d files in %.3fs, %.1f files/s, %d bytes moved (%d copied, %d linked) at %.1f MB/s, "
+                     "%s", summary['files'], summary['elapsed'], summary['files_per_second'], summary['bytes_moved'],
+                     summary['bytes_copied'], summary['bytes_linked'], summary['bytes_per_second'] / 1000000,
+                     ", ".join("%s: %d" % outcome for outcome in sorted(self.outcomes.items())))
+        for phase in PHASES:
+            histogram = self.phases[phase]
+            if histogram.count:
+                logging.info("[REPORT] %-10s %8d calls %10.3fs total %10.1fus max", phase, histogram.count,
+                             histogram.total, histogram.max * 1000000)
+
+    def write(self, path):
+        """Write the summary to path, as CSV if it ends with .csv, as JSON otherwise."""
+        with open(path, 'w') as report_file:
+            if path.lower().endswith('.csv'):
+                self.write_csv(report_file)
+            else:
+                json.dump(self.to_dict(), report_file, indent=2, separators=(',', ': '), sort_keys=True)
+                report_file.write("\n")
+
+    def write_csv(self, report_file):
+        import csv
+        summary = self.to_dict()
+        writer = csv.writer(report_file)
+        writer.writerow(('section', 'name', 'count', 'total', 'mean', 'max'))
+        for name in ('elapsed', 'files', 'files_per_second', 'bytes_moved', 'bytes_copied', 'bytes_linked',
+                     'bytes_per_second'):
+            writer.writerow(('run', name, summary[name], '', '', ''))
+        for outcome, count in sorted(self.outcomes.items()):
+            writer.writerow(('outcome', outcome, count, '', '', ''))
+        for phase in PHASES:
+            if phase in summary['phases']:
+                values = summary['phases'][phase]
+                writer.writerow(('phase', phase, values['count'], values['total'], values['mean'], values['max']))
+        for seconds, path in self.slowest():
+            writer.writerow(('slowest', path, '', seconds, '', ''))
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Salih Kiliclioglu
+
+# Write-ahead journal for the moves of mediasort.
+# All moves of a plan are written and synced to disk before the first file is touched.
+# The outcome of every move is appended afterwards, these records are synced in batches,
+# so a move costs no sync of its own. After a crash the moves without an outcome are
+# the ones to resume, in the mode recorded with them. The moved files of one or more runs
+# can be moved back (undo), copies and links made by the other modes are removed.
+# One JSON object per line, a line cut off by a crash is ignored when reading.
+
+import json
+import logging
+import os
+import threading
+import time
+
+# sync the outcome records after this many records or seconds, whatever comes first
+DEFAULT_SYNC_EVERY = 1000
+DEFAULT_SYNC_INTERVAL = 1.0
+
+OUTCOME_MOVED = 'moved'
+OUTCOME_COPIED = 'copied'  # the source was kept: copied, hard linked or cloned
+OUTCOME_UNDONE = 'undone'
+
+
+class Journal(object):
+    def __init__(self, path, sync_every=DEFAULT_SYNC_EVERY, sync_interval=DEFAULT_SYNC_INTERVAL, clock=time.time):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.clock = clock
+        self.syncs = 0
+        self._file = open(path, 'a')
+        # plans of several sources may be executed in parallel
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = clock()
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, sort_keys=True) + "\n")
+        self._unsynced += 1
+
+    def begin(self, moves, mode=None):
+        """Record the planned moves = [(source file, target file)] and sync before any of them is executed.
+
+        mode is the planner mode of the moves, resume executes them in it.
+        """
+        with self._lock:
+            for source_file, target_file in moves:
+                record = {'op': 'plan', 'source': source_file, 'target': target_file}
+                if mode:
+                    record['mode'] = mode
+                self._write(record)
+            self._sync()
+
+    def folder_created(self, folder):
+        with self._lock:
+            self._write({'op': 'mkdir', 'folder': folder})
+            self._sync_if_due()
+
+    def finish(self, source_file, target_file, outcome):
+        with self._lock:
+            self._write({'op': 'done', 'source': source_file, 'target': target_file, 'outcome': outcome})
+            self._sync_if_due()
+
+    def undone(self, source_file):
+        self.finish(source_file, None, OUTCOME_UNDONE)
+
+    def _sync_if_due(self):
+        if self._unsynced >= self.sync_every or self.clock() - self._last_sync >= self.sync_interval:
+            self._sync()
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.syncs += 1
+        self._unsynced = 0
+        self._last_sync = self.clock()
+
+    def close(self):
+        with self._lock:
+            self._sync()
+            self._file.close()
+        logging.info("[JOURNAL] %s: %d syncs", self.path, self.syncs)
+
+
+class JournalState(object):
+    """State of every source file recorded in a journal, the last record wins."""
+
+    def __init__(self):
+        self.entries = {}  # source file -> [target file, outcome or None]
+        self.order = []  # source files in order of their first plan record
+        self.modes = {}  # source file -> planner mode of the last plan record, if recorded
+        self.folders = []  # created folders
+
+    def apply(self, record):
+        op = record.get('op')
+        if op == 'plan':
+            if record['source'] not in self.entries:
+                self.order.append(record['source'])
+            self.entries[record['source']] = [record['target'], None]
+            self.modes[record['source']] = record.get('mode')
+        elif op == 'done' and record['source'] in self.entries:
+            entry = self.entries[record['source']]
+            if record['outcome'] != OUTCOME_UNDONE:
+                entry[0] = record['target']
+            entry[1] = record['outcome']
+        elif op == 'mkdir':
+            self.folders.append(record['folder'])
+
+    def pending(self):
+        """[(source file, target file)] of the planned moves without an outcome."""
+        return [(source_file, self.entries[source_file][0]) for source_file in self.order
+                if self.entries[source_file][1] is None]
+
+    def completed(self):
+        """[(source file, target file)] of the moved files which were not moved back."""
+        return [(source_file, self.entries[source_file][0]) for source_file in self.order
+                if self.entries[source_file][1] == OUTCOME_MOVED]
+
+    def copies(self):
+        """[(source file, target file)] of the copies and links which were not removed."""
+        return [(source_file, self.entries[source_file][0]) for source_file in self.order
+                if self.entries[source_file][1] == OUTCOME_COPIED]
+
+
+def read_journal(path):
+    state = JournalState()
+    with open(path) as journal_file:
+        for number, line in enumerate(journal_file, 1):
+            try:
+                state.apply(json.loads(line))
+            except (ValueError, KeyError):
+                logging.warning("%s:%d: invalid journal record ignored", path, number)
+    return state
@@ -6,17 +6,40 @@
 # If exif datetime is not available, look for datetime in filename.
 # Video files are moved into a separate subfolder
 
-from PIL import Image
-from PIL.ExifTags import TAGS
+from collections import namedtuple
 from datetime import datetime
 from optparse import OptionParser
 
+import classifier
+import duplicates
+import exifreader
+import fastdate
+import instrument
+import journal
+import metacache
 import os
-import shutil
+import pipeline
+import planner
+import rules
+import targetindex
 import re
+import signal
+import stat
 import sys
+import threading
+import time
+import videoreader
+import watcher
 import logging
 
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir  # backport for Python 2
+    except ImportError:
+        scandir = None
+
 # global variables
 
 output_formats = {  # available formats used for output folder creation
@@ -27,6 +50,13 @@ output_formats = {  # available formats used for output folder creation
 
 DATETIME_FORMAT_EXIF = "%Y:%m:%d %H:%M:%S"
 
+# numeric IDs of the tags read from a Pillow _getexif() dict, saves importing PIL.ExifTags
+EXIF_TAGS = {
+    'DateTime': exifreader.TAG_DATETIME,
+    'DateTimeOriginal': exifreader.TAG_DATETIME_ORIGINAL,
+    'Model': exifreader.TAG_MODEL
+}
+
 datetime_formats = {
     'IOS': {'regex': r'\d{8}_\d{6}', 'datetime': '%Y%m%d_%H%M%S'},
     'OTHER': {'regex': r'\d{8}\-\d{4}', 'datetime': '%Y%m%d-%H%M'}
@@ -38,24 +68,34 @@ FILE_EXTENSION_EXIF = 'JPG|jpg|jpeg|BMP|bmp|PNG|png'
 FILE_EXTENSION_VIDEO = 'MPG|mpg|MOV|mov|AVI|avi|MPEG|mpeg|MP4|mp4'
 FILE_EXTENSION_OTHER = 'tiff|tif|TIF'
 
+filename_classifier = classifier.FilenameClassifier(datetime_formats, FILE_EXTENSION_EXIF, FILE_EXTENSION_VIDEO,
+                                                    FILE_EXTENSION_OTHER)
+
 DEFAULT_SOURCE_FOLDER = "."
 DEFAULT_TARGET_FOLDER = "."
+DEFAULT_CACHE_FILE = os.path.abspath(__file__) + ".cache"
+DEFAULT_HASH_INDEX = os.path.abspath(__file__) + ".hashes"
 
 # subfolder for video files
 DEFAULT_VIDEO_FOLDER = "video"
 DEFAULT_OTHER_FOLDER = "other"
+# subfolder of the target folder for duplicates, if they are moved
+DEFAULT_DUPLICATES_FOLDER = "duplicates"
+DUPLICATES_ACTIONS = ("skip", "move")
+
+# watch mode: seconds to wait for events and between two status lines in the log
+WATCH_POLL_TIMEOUT = 1.0
+WATCH_REPORT_INTERVAL = 600
 
-# variables to store command line options
-opt_recursion = None
-recursion_level = 0  # type: int
+# defaults of walk_files, plan_files and scan_files, main() configures a Sorter instead
 opt_simulate = False
 opt_single = True
 
+timer = instrument.timer
+
 
 def get_field(exif, field):
-    for (k, v) in exif.iteritems():
-        if TAGS.get(k) == field:
-            return v
+    return exif.get(EXIF_TAGS[field])
 
 
 # date_str = input string
@@ -64,11 +104,13 @@ def get_field(exif, field):
 def make_foldername_from_date(date_str, pattern, output_pattern):
     if date_str:
         try:
-            image_datetime = datetime.strptime(date_str, pattern)
-            date_str = image_datetime.strftime(output_pattern)
+            folder_name = fastdate.folder_name(date_str, pattern, output_pattern)
+            if folder_name is None:
+                folder_name = datetime.strptime(date_str, pattern).strftime(output_pattern)
+            date_str = folder_name
         except ValueError as ve:
-            logging.error(str(ve) + " Parameter: (" + date_str + "," + pattern + "," + output_pattern)
-        logging.debug("Make Foldername: " + date_str)
+            logging.error("%s Parameter: (%s,%s,%s", ve, date_str, pattern, output_pattern)
+        logging.debug("Make Foldername: %s", date_str)
     return date_str
 
 
@@ -87,165 +129,638 @@ def get_date_from_exif(exif_data):
 
 def get_model_from_exif(exif_data):
     model_str = get_field(exif_data, 'Model')
-    logging.debug("Model: " + str(model_str))
+    logging.debug("Model: %s", model_str)
     return str(model_str)
 
 
-def create_target_folder(path):
-    if not os.path.exists(path):
-        if not opt_simulate:
-            try:
-                os.makedirs(os.path.join(path))
-            except IOError as ioe:
-                logging.error(str(ioe) + "Folder: " + os.path.join(path))
-        logging.debug("Folder created: " + path)
-    return
-
-
-def move_file(filename, source_folder, target_folder, subfolder_name, video=""):
-    create_target_folder(os.path.join(target_folder, subfolder_name, video))
-    logging.info("[MOVE] " +
-                 os.path.join(source_folder, filename) + " to " +
-                 os.path.join(target_folder, subfolder_name, video)
-                 )
-    if os.path.join(source_folder, filename) == os.path.join(target_folder, subfolder_name, video, filename):
-        logging.info("[SKIP] Source = Target! ")
-
-    elif not opt_simulate:
-        try:
-            shutil.move(os.path.join(source_folder, filename),
-                        os.path.join(target_folder, subfolder_name, video))
-        except Exception as e:
-            logging.error(str(e))
-            logging.info("[SKIP] shutil error ")
-    return
-
-
-def move_video_file(filename, source, target, output_format, datetime_format):
-    global DEFAULT_VIDEO_FOLDER
-    logging.debug("Video file: " + filename)
-    subfolder_name = make_foldername_from_date(get_date_from_filename(filename, datetime_format),
-                                               datetime_format['datetime'], output_format)
-    if subfolder_name:
-        move_file(filename, source, target, subfolder_name, DEFAULT_VIDEO_FOLDER)
-    else:
-        logging.warning(os.path.join(source, filename) + ": Can't get date from filename ")
-    return
+# A file found by walk_files. dir_entry caches file type and stat result.
+MediaEntry = namedtuple('MediaEntry', ['source', 'filename', 'output', 'dir_entry'])
 
+# Where a file belongs: the date found in it or its name with its strptime pattern, the kind
+# subfolder (video, other or "" for photos), the camera model and the target folder.
+# Everything but path is None for files without a date.
+Decision = namedtuple('Decision', ['path', 'date', 'date_pattern', 'kind', 'model', 'destination'])
 
-def move_other_file(filename, source, output, output_format, datetime_format):
-    logging.debug("Other file: " + filename)
-    subfolder_name = make_foldername_from_date(get_date_from_filename(filename, datetime_format),
-                                               datetime_format['datetime'], output_format)
-    if subfolder_name:
-        move_file(filename, source, output, subfolder_name, DEFAULT_OTHER_FOLDER)
-    else:
-        logging.warning(os.path.join(source, filename) + ": Can't get date from filename ")
-    return
 
+class ListdirEntry(object):
+    """Replacement for os.DirEntry if scandir is not available. Needs one stat per entry."""
 
-def move_exif_file(exif_file, filename, source, output, output_format):
-    moved = False
-    other = ""
-    logging.debug("EXIF file: " + filename)
-    try:
-        exif_data = exif_file._getexif()
-        if exif_data:
-            subfolder_name = make_foldername_from_date(get_date_from_exif(exif_data), DATETIME_FORMAT_EXIF,
-                                                       output_format)
+    def __init__(self, folder, name):
+        self.name = name
+        self.path = os.path.join(folder, name)
+        self._stat = None
 
-            if get_model_from_exif(exif_data) == "":
-                other = DEFAULT_OTHER_FOLDER
+    def stat(self):
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
 
+    def is_dir(self):
+        try:
+            return stat.S_ISDIR(self.stat().st_mode)
+        except OSError:
+            return False
+
+
+def iter_folder(folder):
+    """Yield the entries of folder while they are read, the listing isn't held in memory.
+
+    Entries which exist for the whole iteration are returned exactly once, also while files are
+    moved out of the folder. Without scandir the names are listed at once.
+    """
+    if not scandir:
+        for name in os.listdir(folder):
+            yield ListdirEntry(folder, name)
+        return
+    dir_entries = scandir(folder)
+    try:
+        for dir_entry in dir_entries:
+            yield dir_entry
+    finally:
+        # Python < 3.6 closes the directory when the iterator is exhausted or freed
+        if hasattr(dir_entries, 'close'):
+            dir_entries.close()
+
+
+class SortOptions(object):
+    """Configuration of a Sorter, the defaults are those of the command line.
+
+    Without output every file is sorted into subfolders of the folder it is in, the files
+    directly in a source folder into subfolders of the current dir.
+    """
+
+    def __init__(self, output=None, output_format=output_formats['MONTHLY'], recursion_level=None,
+                 datetime_formats=(), jobs=1, per_device=1, duplicates=None, simulate=False, batch_size=0,
+                 mode=planner.MODE_MOVE, rules=None):
+        self.single = output is not None
+        self.output = DEFAULT_TARGET_FOLDER if output is None else output
+        self.output_format = output_format
+        self.recursion_level = recursion_level  # levels of subfolders to scan, 0 = unlimited
+        self.datetime_formats = list(datetime_formats)  # additional strptime patterns of dates in filenames
+        self.jobs = jobs
+        self.per_device = per_device
+        self.duplicates = duplicates  # None or one of DUPLICATES_ACTIONS
+        self.simulate = simulate
+        self.batch_size = batch_size  # files moved at a time while the source is read, 0 = plan all first
+        self.mode = mode  # one of planner.MODES, all but move keep the source files
+        self.rules = rules  # rules.RuleSet replacing output_format and the kind folders
+        self.video_folder = DEFAULT_VIDEO_FOLDER
+        self.other_folder = DEFAULT_OTHER_FOLDER
+        self.skip_folders = list(skip_folders)
+
+
+class Sorter(object):
+    """Sort the files below source folders as configured by a SortOptions object.
+
+    iter_decisions() only reads the source folders, apply() creates the target folders and
+    moves the files. All state of a run is kept in the sorter, so several sorters can be used
+    in one process. Cache, stats, journal and duplicate finder are optional.
+    """
+
+    def __init__(self, options=None, metadata_cache=None, stats=None, move_journal=None, duplicate_finder=None,
+                 target_index=None):
+        self.options = options or SortOptions()
+        self.metadata_cache = metadata_cache  # type: metacache.MetadataCache
+        self.stats = stats  # type: instrument.RunStats
+        self.journal = move_journal  # type: journal.Journal
+        self.duplicate_finder = duplicate_finder  # type: duplicates.DuplicateFinder
+        # names in the target folders, in memory only unless given
+        self.target_index = target_index if target_index is not None else targetindex.TargetIndex()
+        self._created_folders = set()  # absolute paths of the folders created by executed plans
+        self._target_folders = set()  # absolute paths of the target folders of executed plans
+        self.classifier = filename_classifier
+        if self.options.datetime_formats:
+            self.classifier = classifier.FilenameClassifier(datetime_formats, FILE_EXTENSION_EXIF,
+                                                            FILE_EXTENSION_VIDEO, FILE_EXTENSION_OTHER)
+            for index, datetime_pattern in enumerate(self.options.datetime_formats):
+                self.classifier.add_datetime_format("CUSTOM%d" % index, datetime_pattern)
+        # cached dates are valid for the same datetime formats only
+        self._formats_fingerprint = self.classifier.fingerprint() if metadata_cache else ""
+
+    def new_plan(self):
+        return planner.MovePlan(self.stats, self.journal, self.options.mode, self.target_index)
+
+    # Look for a date in the EXIF data first, then in the filename. Videos without a date in
+    # the filename are dated by the creation time in their container.
+    # Returns (date_str, date_pattern, kind_folder, model) or None if no date was found.
+    def get_date_from_file(self, filename, source):
+        start = timer()
+        kind, date_str, date_pattern = self.classifier.classify(filename)
+        if self.stats:
+            self.stats.add('classify', timer() - start)
+        if kind == classifier.KIND_EXIF:
+            logging.debug("EXIF file: %s", filename)
+            start = timer()
+            exif_date_str, model_str = exifreader.read_metadata(os.path.join(source, filename))
+            if self.stats:
+                self.stats.add('exif', timer() - start)
+            logging.debug("Model: %s", model_str)
+            if exif_date_str:
+                return (exif_date_str, DATETIME_FORMAT_EXIF, self.options.other_folder if model_str == "" else "",
+                        model_str)
+
+        if kind and date_str:
+            kind_folder = self.options.video_folder if kind == classifier.KIND_VIDEO else self.options.other_folder
+            logging.debug("%s file: %s", kind_folder, filename)
+            return date_str, date_pattern, kind_folder, None
+
+        if kind == classifier.KIND_VIDEO:
+            start = timer()
+            video_date_str = videoreader.read_creation_date(os.path.join(source, filename))
+            if self.stats:
+                self.stats.add('video', timer() - start)
+            if video_date_str:
+                logging.debug("Video creation date: %s", video_date_str)
+                return video_date_str, videoreader.DATETIME_FORMAT, self.options.video_folder, None
+        return None
+
+    # Same as get_date_from_file, but unchanged files are answered from the metadata cache.
+    # dir_entry is used to avoid another stat call for files found by walk.
+    def read_file_date(self, filename, source, dir_entry=None):
+        if self.metadata_cache is None:
+            return self.get_date_from_file(filename, source)
+        path = os.path.abspath(os.path.join(source, filename))
+        try:
+            stat_result = dir_entry.stat() if dir_entry else os.stat(path)
+        except OSError as error:
+            # a dangling symlink or a file removed since the walk, undated like without the cache
+            logging.error("%s", error)
+            return None
+        file_date = self.metadata_cache.get(path, stat_result, self._formats_fingerprint)
+        if file_date is metacache.MISS:
+            file_date = self.get_date_from_file(filename, source)
+            self.metadata_cache.put(path, stat_result, file_date, self._formats_fingerprint)
+        return file_date
+
+    def decide(self, entry):
+        """Return the Decision for a MediaEntry, without touching the target."""
+        start = timer()
+        path = os.path.join(entry.source, entry.filename)
+        logging.debug("Checking: %s", entry.filename)
+        decision = Decision(path, None, None, None, None, None)
+        file_date = self.read_file_date(entry.filename, entry.source, entry.dir_entry)
+        if not file_date:
+            logging.warning("%s: Can't get date from exif or filename ", path)
+        else:
+            date_str, date_pattern, kind_folder, model_str = file_date
+            folder_start = timer()
+            if self.options.rules:
+                subfolder_name = self.rule_folder(entry.filename, date_str, date_pattern, model_str)
+                kind_folder = ""
+            else:
+                subfolder_name = make_foldername_from_date(date_str, date_pattern, self.options.output_format)
+            if self.stats:
+                self.stats.add('foldername', timer() - folder_start)
             if subfolder_name:
-                moved = move_file(filename, source, output, subfolder_name, other)
+                decision = Decision(path, date_str, date_pattern, kind_folder, model_str,
+                                    os.path.join(entry.output, subfolder_name, kind_folder) if kind_folder else
+                                    os.path.join(entry.output, subfolder_name))
+            elif not self.options.rules:
+                logging.warning("%s: Can't get date from filename ", path)
+        if self.stats:
+            if decision.destination is None:
+                self.stats.count('no_rule' if file_date and self.options.rules else 'no_date')
+            self.stats.add_file(path, timer() - start)
+        return decision
+
+    def rule_folder(self, filename, date_str, date_pattern, model_str):
+        """Folder of a dated file below the output by the first matching rule, None if no rule matches."""
+        extension = filename.rpartition('.')[2]
+        if date_pattern != DATETIME_FORMAT_EXIF:
+            date_source = rules.DATE_SOURCE_FILENAME
+        elif self.classifier.kinds.get(extension) == classifier.KIND_VIDEO:
+            date_source = rules.DATE_SOURCE_VIDEO
+        else:
+            date_source = rules.DATE_SOURCE_EXIF
+        rule = self.options.rules.find(filename, extension, model_str, date_source)
+        if rule is None:
+            logging.info("[SKIP] No rule for %s", filename)
+            return None
+        date_folder = make_foldername_from_date(date_str, date_pattern, rule.date_format)
+        return rule.folder(date_folder, extension, model_str, date_source)
+
+    def output_for(self, folder, source):
+        """Output folder of the files in folder, a subfolder of source or source itself."""
+        return self.options.output if self.options.single or folder == source else folder
+
+    # Yield a MediaEntry for every file below source.
+    # Subfolders are entered as long as the recursion level >= level of the current folder.
+    # The file type comes from the directory listing (d_type), no stat call per entry.
+    def walk(self, source):
+        max_recursion_level = self.options.recursion_level
+        stack = [(source, self.options.output, 1)]
+        while stack:
+            folder, folder_output, level = stack.pop()
+            logging.debug("Recursion Level: %s/%s", level, max_recursion_level)
+            subfolders = []
+            listing_time = 0.0
+            dir_entries = iter_folder(folder)
+            while True:
+                start = timer()
+                dir_entry = next(dir_entries, None)
+                listing_time += timer() - start
+                if dir_entry is None:
+                    break
+                if not dir_entry.is_dir():
+                    yield MediaEntry(folder, dir_entry.name, folder_output, dir_entry)
+                elif self._created_folders and os.path.abspath(dir_entry.path) in self._created_folders:
+                    # created by a batch executed while this folder is read, holds sorted files only
+                    logging.debug("%s: Created by this run", dir_entry.path)
+                elif max_recursion_level and max_recursion_level >= level and \
+                        dir_entry.name not in self.options.skip_folders:
+                    logging.debug("%s is a folder. Max level %s Current level %s", dir_entry.name,
+                                  max_recursion_level, level)
+                    # with a single output folder all files go there, otherwise the files of
+                    # a subfolder are sorted into subfolders of their own folder
+                    subfolders.append((dir_entry.path, self.output_for(dir_entry.path, source), level + 1))
+                else:
+                    logging.debug("%s: Is a directory ", dir_entry.path)
+            if self.stats:
+                self.stats.add('walk', listing_time)
+            # reversed, so subfolders are scanned in listing order
+            stack.extend(reversed(subfolders))
+
+    def has_candidates(self, source):
+        """True if a file below source has a known extension, the walk stops at the first one."""
+        for entry in self.walk(source):
+            if self.classifier.classify(entry.filename)[0]:
+                return True
+        return False
+
+    def iter_decisions(self, source):
+        """Yield a Decision for every file below source, in walk order.
+
+        Nothing is moved or created. With jobs > 1 the dates are read by worker threads, at
+        most a fixed number of files is held at any time, independent of the size of the tree.
+        """
+        entries = self.walk(source)
+        if self.options.jobs <= 1:
+            for entry in entries:
+                yield self.decide(entry)
+            return
+        for entry, decision in pipeline.Pipeline(self.decide, self.options.jobs).results(entries):
+            # None if reading the file failed, the error is logged by the pipeline
+            yield decision or Decision(os.path.join(entry.source, entry.filename), None, None, None, None, None)
+
+    def plan(self, decisions, plan=None):
+        """Add the moves of the decisions with a destination to plan, a new MovePlan by default."""
+        if plan is None:
+            plan = self.new_plan()
+        for decision in decisions:
+            if not decision.destination:
+                continue
+            if decision.path == os.path.join(decision.destination, os.path.basename(decision.path)):
+                logging.info("[SKIP] Source = Target! %s", decision.path)
+                if self.stats:
+                    self.stats.count('source_is_target')
+                continue
+            plan.add(decision.path, decision.destination)
+        return plan
+
+    def apply(self, decisions):
+        """Plan and execute the decisions. Returns the MovePlan, executed unless simulating.
+
+        With a batch size the decisions are executed in batches while they are read, memory
+        doesn't depend on the number of files then. The returned plan only holds the counts.
+        """
+        if not self.options.batch_size:
+            plan = self.plan(decisions)
+            self.check_duplicates([plan])
+            if not self.options.simulate:
+                self.execute_plan(plan)
+            return plan
+        total = self.new_plan()
+        for batch in pipeline.batches(decisions, self.options.batch_size):
+            plan = self.plan(batch)
+            self.check_duplicates([plan])
+            if not self.options.simulate:
+                self.execute_plan(plan)
+            elif self.duplicate_finder:
+                self.duplicate_finder.record([], plan.moves)  # nothing moved
+            total.add_counts(plan)
+        return total
+
+    def scan(self, source):
+        return self.apply(self.iter_decisions(source))
+
+    # Plan the moves for several source folders, the sources on different devices are read in parallel.
+    def plan_sources(self, sources):
+        progress = {'planned': 0}
+        progress_lock = threading.Lock()
+
+        def plan_source(source):
+            plan = self.plan(self.iter_decisions(source))
+            with progress_lock:
+                progress['planned'] += 1
+                logging.info("[SOURCE] %s: %d moves planned (%d/%d sources)", source, len(plan),
+                             progress['planned'], len(sources))
+            return plan
+
+        if len(sources) == 1:
+            return [plan_source(sources[0])]
+        plans = pipeline.run_per_device(sources, source_device, plan_source, self.options.per_device)
+        return [plan or self.new_plan() for plan in plans]
+
+    # Sort several source folders in batches, the sources on different devices in parallel.
+    def scan_sources(self, sources):
+        progress = {'scanned': 0}
+        progress_lock = threading.Lock()
+
+        def scan_source(source):
+            plan = self.scan(source)
+            with progress_lock:
+                progress['scanned'] += 1
+                logging.info("[SOURCE] %s: %d moved, %d skipped (%d/%d sources)", source, plan.moved,
+                             plan.skipped, progress['scanned'], len(sources))
+
+        pipeline.run_per_device(sources, source_device, scan_source, self.options.per_device)
+
+    # Skip the files which already exist in their target folder or send them to its duplicates folder.
+    # All plans are checked together, so a file found in several sources is moved once.
+    def check_duplicates(self, plans):
+        if not self.duplicate_finder:
+            return
+        moves = [move for plan in plans for move in plan.moves]
+        target_folders = dict(moves)
+        targets = {}
+        for source_file, original in self.duplicate_finder.find(moves).items():
+            logging.info("[DUPLICATE] %s = %s", source_file, original)
+            if self.options.duplicates == "move":
+                targets[source_file] = os.path.join(target_folders[source_file], DEFAULT_DUPLICATES_FOLDER)
+            else:
+                targets[source_file] = None
+        if self.stats:
+            self.stats.count('duplicate', len(targets))
+        for plan in plans:
+            plan.retarget(targets)
+
+    def execute_plan(self, plan):
+        plan.execute()
+        if self.duplicate_finder:
+            self.duplicate_finder.record(plan.completed, plan.moves)
+        for folder in plan.created_folders:
+            self._created_folders.add(os.path.abspath(folder))
+        for folder in plan.folders:
+            self._target_folders.add(os.path.abspath(folder))
+
+    # Execute the plans of several sources, the sources on different devices in parallel.
+    def execute_plans(self, sources, plans):
+        if len(plans) == 1:
+            self.execute_plan(plans[0])
+            return
+        progress = {'executed': 0}
+        progress_lock = threading.Lock()
+
+        def execute_source(source_plan):
+            source, plan = source_plan
+            self.execute_plan(plan)
+            with progress_lock:
+                progress['executed'] += 1
+                logging.info("[SOURCE] %s: %d moved, %d skipped (%d/%d sources)", source, plan.moved,
+                             plan.skipped, progress['executed'], len(plans))
+
+        pipeline.run_per_device(list(zip(sources, plans)), lambda source_plan: source_device(source_plan[0]),
+                                execute_source, self.options.per_device)
+
+    # Plan the moves of an interrupted run, the moves in the journal without an outcome.
+    # One plan per mode, the moves are resumed in the mode of the run which planned them.
+    def plan_resume(self, journal_state):
+        plans = {}
+        modes = []  # in order of their first move
+        for source_file, target_file in journal_state.pending():
+            mode = journal_state.modes.get(source_file) or self.options.mode
+            if planner.is_transferred(source_file, target_file, mode):
+                # moved or copied, but the outcome didn't reach the journal before the interruption
+                logging.info("[RESUME] Already done: %s", source_file)
+                if self.journal:
+                    self.journal.finish(source_file, target_file, journal.OUTCOME_MOVED if mode == planner.MODE_MOVE
+                                        else journal.OUTCOME_COPIED)
+                continue
+            if mode not in plans:
+                plans[mode] = planner.MovePlan(self.stats, self.journal, mode, self.target_index)
+                modes.append(mode)
+            # the name journaled, a numbered one if the name was taken
+            plans[mode].add(source_file, os.path.dirname(target_file), os.path.basename(target_file))
+        return [plans[mode] for mode in modes] or [self.new_plan()]
+
+    # Plan moving the files moved by the runs in the journal back, the last moved file first.
+    def plan_undo(self, journal_state):
+        plan = planner.MovePlan(self.stats)
+        for source_file, target_file in reversed(journal_state.completed()):
+            # back to the original name, the target may have been renamed
+            plan.add(target_file, os.path.dirname(source_file), os.path.basename(source_file))
+        return plan
+
+    def in_sorted_folder(self, folder, source):
+        """True if folder is below source in a folder holding sorted files.
+
+        That is a folder created by this run, a target folder of its moves or the output folder.
+        Watch mode ignores them, the files moved there would be sorted again.
+        """
+        source = os.path.abspath(source)
+        output = os.path.abspath(self.options.output) if self.options.output else None
+        if output and (source + os.sep).startswith(output + os.sep):
+            output = None  # the files of source itself go there
+        folder = os.path.abspath(folder)
+        while len(folder) > len(source):
+            if folder in self._created_folders or folder in self._target_folders or folder == output:
+                return True
+            folder = os.path.dirname(folder)
+        return False
+
+    def create_watcher(self, source):
+        if watcher.InotifyWatcher.available():
+            try:
+                return watcher.InotifyWatcher(source, self.options.recursion_level, self.options.skip_folders,
+                                              lambda folder: self.in_sorted_folder(folder, source))
+            except OSError as error:
+                logging.warning("inotify not usable, polling instead: %s", error)
+
+        def listing():
+            for entry in self.walk(source):
+                try:
+                    yield entry.source, entry.filename, entry.dir_entry.stat()
+                except OSError:
+                    pass  # removed in the meantime
+        return watcher.PollingWatcher(listing)
+
+    # Sort new files as they arrive, until interrupted.
+    def watch(self, source, file_watcher, settle_time=watcher.DEFAULT_SETTLE_TIME):
+        tracker = watcher.FileTracker(settle_time, file_watcher.require_close)
+        last_report = time.time()
+        logging.info("Watching %s", source)
+        try:
+            while True:
+                for folder, filename, closed in file_watcher.poll(WATCH_POLL_TIMEOUT):
+                    if self.in_sorted_folder(folder, source):
+                        continue
+                    if closed is None:
+                        tracker.remove(folder, filename)
+                    elif filename not in self.options.skip_folders:
+                        tracker.update(folder, filename, closed)
+                if file_watcher.overflowed:
+                    file_watcher.overflowed = False
+                    self.target_index.forget()
+                    self.scan(source)
+
+                ready = [(folder, filename, closed_at) for folder, filename, closed_at in tracker.pop_ready()
+                         if os.path.isfile(os.path.join(folder, filename))]
+                if ready:
+                    # the target folders may have changed since the last files were sorted
+                    self.target_index.forget()
+                    # same output folder as walk would use
+                    self.apply([self.decide(MediaEntry(folder, filename, self.output_for(folder, source), None))
+                                for folder, filename, closed_at in ready])
+                    for folder, filename, closed_at in ready:
+                        tracker.record_done(closed_at)
+                    if self.metadata_cache:
+                        self.metadata_cache.flush()
+
+                if time.time() - last_report >= WATCH_REPORT_INTERVAL:
+                    tracker.report()
+                    last_report = time.time()
+        finally:
+            tracker.report()
+
+
+def source_device(source):
+    return os.stat(source).st_dev
+
+
+def finish_undo(plan, journal_state, journal_path):
+    undo_journal = journal.Journal(journal_path)
+    try:
+        for target_file, source_file in plan.completed:
+            undo_journal.undone(source_file)
+        # copies and links are removed, as long as their source is still there
+        for source_file, target_file in reversed(journal_state.copies()):
+            if not os.path.lexists(source_file):
+                logging.info("[SKIP] Source gone, copy kept: %s", target_file)
+                continue
+            try:
+                os.remove(target_file)
+            except OSError as error:
+                logging.error("%s", error)
+                continue
+            logging.info("[MOVE] Copy removed: %s", target_file)
+            undo_journal.undone(source_file)
+    finally:
+        undo_journal.close()
+    # the folders created by the runs are removed if they are empty now
+    for folder in reversed(journal_state.folders):
+        try:
+            os.rmdir(folder)
+            logging.debug("Folder removed: %s", folder)
+        except OSError:
+            pass
+
+
+# The functions below sort with a Sorter configured by their arguments and the opt_ globals.
+def default_sorter(output, max_recursion_level, output_format=output_formats['MONTHLY'], jobs=1):
+    options = SortOptions(output, output_format, max_recursion_level, jobs=jobs, simulate=opt_simulate)
+    options.single = opt_single
+    return Sorter(options)
 
-    except AttributeError as error:
-        # Output expected AttributeErrors.
-        logging.error(str(error) + filename)
 
-    return moved
+def walk_files(source, output, max_recursion_level):
+    return default_sorter(output, max_recursion_level).walk(source)
 
 
-def check_match(regex_pattern, str):
-    match = False
-    filename, extension = None, None
-    filename_matches = re.finditer(regex_pattern, str, re.UNICODE)
-    for match in filename_matches:
-        filename, extension = match.groups()
-    if filename and extension:
-        match = True
-    return match
+def plan_files(source, output, max_recursion_level, output_format, jobs=1):
+    sorter = default_sorter(output, max_recursion_level, output_format, jobs)
+    return sorter.plan(sorter.iter_decisions(source))
 
 
 def scan_files(source, output, max_recursion_level, output_format):
-    global recursion_level
-
-    # increase global recursion counter when function entered and decrease before exit
-    recursion_level += 1
-    logging.debug("Recursion Level: " + str(recursion_level) + "/" + str(max_recursion_level))
-
-    for filename in os.listdir(source):
-        logging.debug("Checking: " + filename)
-        if os.path.isdir(os.path.join(source, filename)) and max_recursion_level and (filename not in skip_folders):
-            logging.debug(
-                filename + " is a folder. " + "Max level " + str(max_recursion_level) + " Current level " + str(
-                    recursion_level))
-            if max_recursion_level == 0 or max_recursion_level >= recursion_level:
-                # opt_single is true, when an output folder has been specified
-                # if no output folder specified, create output folder in the same location as the source file
-                if not opt_single:
-                    output = os.path.join(source, filename)
-                scan_files(os.path.join(source, filename), output, max_recursion_level, output_format)
-
-        match = False
-
-        if check_match(r"(?P<filename>.*)\.(?P<extension>%s)" % FILE_EXTENSION_EXIF, filename):
-            with open(os.path.join(source, filename), 'rb') as exif_file:
-                image_file = Image.open(exif_file)
-                if move_exif_file(image_file, filename, source, output, output_format):
-                    continue
-
-        for datetime_format in datetime_formats:
-            if check_match(r"(?P<filename>%s.*)\.(?P<extension>%s)" % (datetime_formats[datetime_format]['regex'],
-                                                                       FILE_EXTENSION_VIDEO), filename):
-                move_video_file(filename, source, output, output_format, datetime_formats[datetime_format])
-                match = True
-                break
-            elif check_match(r"(?P<filename>%s.*)\.(?P<extension>%s)" % (datetime_formats[datetime_format]['regex'],
-                                                                         FILE_EXTENSION_EXIF), filename):
-                move_other_file(filename, source, output, output_format, datetime_formats[datetime_format])
-                match = True
-                break
-            elif check_match(r"(?P<filename>%s.*)\.(?P<extension>%s)" % (datetime_formats[datetime_format]['regex'],
-                                                                         FILE_EXTENSION_OTHER), filename):
-                move_other_file(filename, source, output, output_format, datetime_formats[datetime_format])
-                match = True
-                break
-            elif os.path.isdir(os.path.join(source, filename)):
-
-                logging.debug(os.path.join(source, filename) + ": Is a directory ")
-                logging.debug("Format: " + datetime_format)
-                match = True
-                break
-
-        if not match:
-            logging.warning(os.path.join(source, filename) + ": Can't get date from exif or filename ")
-
-    recursion_level -= 1
-    return
+    return default_sorter(output, max_recursion_level, output_format).scan(source)
+
+
+# Sort the files below the source folders once, then keep watching if options.watch is set.
+def sort_folders(options, sort_options, source_folders, stats=None):
+    if options.undo:
+        sorter = Sorter(sort_options, stats=stats)
+        journal_state = journal.read_journal(options.undo)
+        plan = sorter.plan_undo(journal_state)
+        if sort_options.simulate:
+            plan.dump(sys.stdout)
+        else:
+            plan.execute()
+            finish_undo(plan, journal_state, options.undo)
+        return
+
+    if not options.resume and not options.watch:
+        # nothing to do: exit before the cache, the hash index and the journal are opened
+        probe = Sorter(sort_options)
+        source_folders = [source for source in source_folders if probe.has_candidates(source)]
+        if not source_folders:
+            logging.info("[SKIP] No media files in the source folders")
+            return
+
+    metadata_cache = metacache.MetadataCache(options.cache or DEFAULT_CACHE_FILE) if options.use_cache else None
+    duplicate_finder = None
+    if sort_options.duplicates:
+        hash_index = duplicates.HashIndex(options.hash_index or DEFAULT_HASH_INDEX) if options.use_cache else None
+        duplicate_finder = duplicates.DuplicateFinder(hash_index, sort_options.jobs)
+    move_journal = journal.Journal(options.journal) if options.journal and not sort_options.simulate else None
+    target_index = targetindex.TargetIndex(options.target_index)
+    sorter = Sorter(sort_options, metadata_cache, stats, move_journal, duplicate_finder, target_index)
+
+    # the watcher is started first, files arriving during the first scan aren't missed
+    file_watcher = sorter.create_watcher(source_folders[0]) if options.watch else None
+
+    try:
+        if sort_options.batch_size:
+            # moved while the sources are read, there is no complete plan to dump
+            sorter.scan_sources(source_folders)
+        else:
+            if options.resume:
+                plans = sorter.plan_resume(journal.read_journal(options.journal))
+            else:
+                # start reading the source folders
+                plans = sorter.plan_sources(source_folders)
+            sorter.check_duplicates(plans)
+
+            plan = plans[0]
+            if len(plans) > 1:
+                plan = planner.MovePlan()
+                for source_plan in plans:
+                    plan.extend(source_plan)
+            if options.plan:
+                with open(options.plan, 'w') as plan_file:
+                    plan.dump(plan_file)
+            if sort_options.simulate:
+                if not options.plan:
+                    plan.dump(sys.stdout)
+            elif options.resume:
+                for resume_plan in plans:
+                    sorter.execute_plan(resume_plan)
+            else:
+                sorter.execute_plans(source_folders, plans)
+
+        if file_watcher:
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+            sorter.watch(source_folders[0], file_watcher, options.settle_time)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if file_watcher:
+            file_watcher.close()
+        if metadata_cache:
+            metadata_cache.close()
+        if duplicate_finder:
+            duplicate_finder.close()
+        if move_journal:
+            move_journal.close()
+        target_index.close()
 
 
 def main(argv):
-    global opt_recursion
-    global opt_simulate
-    global opt_single
     global DEFAULT_SOURCE_FOLDER
     global DEFAULT_TARGET_FOLDER
 
     parser = OptionParser()
-    parser.add_option("-i", "--input", "--source", type="string", dest="source", default=DEFAULT_SOURCE_FOLDER,
-                      help="Read from folder SOURCE. Default = current dir")
+    parser.add_option("-i", "--input", "--source", type="string", dest="sources", action="append", metavar="SOURCE",
+                      help="Read from folder SOURCE. Can be repeated to sort several folders. Default = current dir")
 
     parser.add_option("-o", "--output", "--target", type="string", dest="target",
                       help="Write all files to a single location = TARGET. If not specified = current working dir")
@@ -256,42 +771,138 @@ def main(argv):
     parser.add_option("-g", "--groupby", type="string", dest="group", default="MONTHLY",
                       help="GROUP = YEARLY|MONTHLY|DAILY. Default = MONTHLY")
 
+    parser.add_option("--rules", type="string", dest="rules",
+                      help="Sort by the rules in the JSON file RULES instead of GROUP and the video and other folders")
+
     parser.add_option("-s", "--simulate", action="store_true", dest="simulate",
-                      help="Simulation mode. No files will be moved")
+                      help="Simulation mode. No files will be moved, the plan is printed as JSON")
+
+    parser.add_option("-p", "--plan", type="string", dest="plan",
+                      help="Write the planned moves as JSON to PLAN. Simulation mode prints them if not given")
+
+    parser.add_option("-m", "--mode", type="choice", choices=planner.MODES, dest="mode", default=planner.MODE_MOVE,
+                      help="MODE = move|copy|hardlink|reflink. copy, hardlink and reflink keep the source files, "
+                           "hardlink and reflink copy if the target can't link. Default = move")
+
+    parser.add_option("-j", "--jobs", type="int", dest="jobs", default=1,
+                      help="Number of worker threads reading dates. JOBS > 1 = pipelined mode. Default = 1")
+
+    parser.add_option("-d", "--datetime-format", type="string", dest="datetime_formats", action="append",
+                      metavar="FORMAT", default=[], help="Additional date format in filenames, e.g. %Y.%m.%d. Can be repeated")
+
+    parser.add_option("--per-device", type="int", dest="per_device", default=1,
+                      help="Number of sources read at the same time per device. Default = 1")
+
+    parser.add_option("--batch-size", type="int", dest="batch_size", default=0,
+                      help="Move the files in batches of BATCH_SIZE while the sources are read, for folders too "
+                           "large to plan at once. Default = 0 = plan all moves first")
+
+    parser.add_option("-w", "--watch", action="store_true", dest="watch",
+                      help="Keep running after the first scan and sort new files as they arrive")
+
+    parser.add_option("--settle-time", type="float", dest="settle_time", default=watcher.DEFAULT_SETTLE_TIME,
+                      help="Watch mode: seconds a new file has to be unchanged before it is sorted. Default = %default")
+
+    parser.add_option("--duplicates", type="choice", choices=DUPLICATES_ACTIONS, dest="duplicates", metavar="ACTION",
+                      help="Detect files which already exist in their target folder. "
+                           "ACTION = skip|move, move = to the duplicates subfolder")
+
+    parser.add_option("--hash-index", type="string", dest="hash_index",
+                      help="Remember the hashes of sorted files in HASH_INDEX. Default = mediasort.py.hashes")
+
+    parser.add_option("--journal", type="string", dest="journal",
+                      help="Record the planned moves and their outcomes in JOURNAL, for --resume and --undo")
+
+    parser.add_option("--resume", action="store_true", dest="resume",
+                      help="Execute the moves in JOURNAL which were not completed instead of scanning SOURCE")
+
+    parser.add_option("--undo", type="string", dest="undo", metavar="JOURNAL",
+                      help="Move the files moved by the runs recorded in JOURNAL back")
+
+    parser.add_option("--target-index", type="string", dest="target_index",
+                      help="Remember the names in the target folders in TARGET_INDEX, unchanged folders aren't "
+                           "listed again")
+
+    parser.add_option("-c", "--cache", type="string", dest="cache",
+                      help="Remember dates of unchanged files in CACHE. Default = mediasort.py.cache")
+
+    parser.add_option("--no-cache", action="store_false", dest="use_cache", default=True,
+                      help="Don't read or write the date cache and the hash index")
+
+    parser.add_option("--report", type="string", dest="report",
+                      help="Write timings per phase, outcome counts and the slowest files to REPORT. "
+                           "CSV if REPORT ends with .csv, JSON otherwise")
+
+    parser.add_option("--profile", type="string", dest="profile",
+                      help="Run with cProfile and write the stats to PROFILE")
 
     parser.add_option("-l", "--loglevel", type="string", dest="loglevel",
                       help="LOGLEVEL = ERROR|WARNING|INFO|DEBUG")
 
     (options, args) = parser.parse_args()
+    if options.resume and not options.journal:
+        parser.error("--resume needs --journal")
+    if options.undo and (options.resume or options.watch):
+        parser.error("--undo can't be combined with --resume or --watch")
+    if options.batch_size and (options.simulate or options.plan or options.resume or options.undo):
+        parser.error("--batch-size can't be combined with --simulate, --plan, --resume or --undo")
+    source_folders = []
+    for source_folder in options.sources or [DEFAULT_SOURCE_FOLDER]:
+        if not os.path.isdir(source_folder):
+            parser.error("No such folder: " + source_folder)
+        if os.path.normpath(source_folder) not in map(os.path.normpath, source_folders):
+            source_folders.append(source_folder)
+    if options.watch and len(source_folders) > 1:
+        parser.error("--watch needs a single source")
+    sort_rules = None
+    if options.rules:
+        try:
+            sort_rules = rules.load_rules(options.rules)
+        except (IOError, OSError, ValueError) as error:
+            parser.error("%s: %s" % (options.rules, error))
+    for datetime_pattern in options.datetime_formats or ():
+        try:
+            classifier.regex_from_datetime_pattern(datetime_pattern)
+        except ValueError as error:
+            parser.error("-d %s: %s" % (datetime_pattern, error))
     if options.loglevel:
         numeric_loglevel = getattr(logging, options.loglevel.upper(), None)
         if not isinstance(numeric_loglevel, int):
-            logging.error('Invalid log level: %s' % options.loglevel)
+            logging.error('Invalid log level: %s', options.loglevel)
         else:
             logging.getLogger().setLevel(numeric_loglevel)
-    source_folder = options.source
-    output_folder = options.target
-    opt_recursion = options.level
-    opt_simulate = options.simulate
-    output_format = output_formats[options.group]
-
-    logging.debug("Source:" + source_folder)
-    if output_folder:
-        logging.debug("Target:" + output_folder)
-    else:
-        output_folder = DEFAULT_TARGET_FOLDER
-        # no single location for output if no target folder specified
-        # set opt_single to false, source file location will be used for outputs
-        opt_single = False
-    if opt_recursion:
-        logging.debug("Recursion:" + str(opt_recursion))
-    if opt_simulate:
+    # no single location for output if no target folder specified, source file location will be used for outputs
+    sort_options = SortOptions(options.target, output_formats[options.group], options.level, options.datetime_formats,
+                               options.jobs, options.per_device, options.duplicates, options.simulate,
+                               options.batch_size, options.mode, sort_rules)
+
+    logging.debug("Source:%s", ", ".join(source_folders))
+    if options.target:
+        logging.debug("Target:%s", options.target)
+    if options.level:
+        logging.debug("Recursion:%s", options.level)
+    if options.simulate:
         logging.info("****** Simulation Mode *******")
     else:
         logging.info("****** Active Mode *******")
 
-    # start reading the source folder
-    scan_files(source_folder, output_folder, opt_recursion, output_format)
+    run_stats = instrument.RunStats()
+    profiler = None
+    if options.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+    try:
+        if profiler:
+            profiler.runcall(sort_folders, options, sort_options, source_folders, run_stats)
+        else:
+            sort_folders(options, sort_options, source_folders, run_stats)
+    finally:
+        run_stats.finish()
+        run_stats.log()
+        if options.report:
+            run_stats.write(options.report)
+        if profiler:
+            profiler.dump_stats(options.profile)
 
 
 if __name__ == "__main__":
@@ -301,5 +912,5 @@ if __name__ == "__main__":
                         datefmt='%Y-%m-%d %H:%M:%S',
                         level=logging.INFO)
 
-    logging.info(__file__ + " started")
+    logging.info("%s started", __file__)
     main(sys.argv[1:])
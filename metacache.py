@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Salih Kiliclioglu
+
+# Persistent cache for the dates found by mediasort.
+# A file is identified by its path and validated by inode, size and mtime, so an
+# unchanged file costs one stat and one indexed lookup instead of parsing it again.
+# The date also depends on the datetime formats of the classifier, an entry found with
+# other formats (e.g. another -d) is read again.
+# Files without any date are cached as well, they are the ones seen on every run.
+# The cache keeps at most max_entries rows, the least recently used ones are
+# evicted when the cache is closed.
+# sqlite3 is imported when a cache is opened, runs which exit early don't need it.
+
+import logging
+import threading
+
+try:
+    from os import fsencode as _key
+except ImportError:
+    # Python 2 paths are byte strings already
+    def _key(path):
+        return path
+
+# increase whenever the way dates are read changes, older caches are dropped then
+CACHE_VERSION = 3
+DEFAULT_MAX_ENTRIES = 1000000
+
+# pending writes are flushed to sqlite in batches of this size
+BATCH_SIZE = 1000
+
+# returned by get() if a file is not in the cache or has changed
+MISS = object()
+
+
+class MetadataCache(object):
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+        import sqlite3
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pending_puts = []
+        self._pending_hits = []
+        # the cache is shared by the worker threads of the pipeline, access is serialized by _lock
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.text_factory = str
+        if self._db.execute("PRAGMA user_version").fetchone()[0] != CACHE_VERSION:
+            self._db.execute("DROP TABLE IF EXISTS files")
+            self._db.execute("PRAGMA user_version = %d" % CACHE_VERSION)
+        self._db.execute("CREATE TABLE IF NOT EXISTS files ("
+                         "path TEXT PRIMARY KEY, inode INTEGER, size INTEGER, mtime REAL, "
+                         "date_str TEXT, pattern TEXT, kind TEXT, model TEXT, formats TEXT, last_used INTEGER)")
+        self._run = (self._db.execute("SELECT MAX(last_used) FROM files").fetchone()[0] or 0) + 1
+
+    def get(self, path, stat_result, formats=""):
+        """Return the cached (date_str, pattern, kind, model) tuple, None if the file has no date or MISS.
+
+        formats is the fingerprint of the datetime formats the date is looked for with.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT inode, size, mtime, formats, date_str, pattern, kind, model FROM files "
+                                   "WHERE path = ?", (_key(path),)).fetchone()
+            if row is None or tuple(row[:4]) != (stat_result.st_ino, stat_result.st_size, stat_result.st_mtime,
+                                                 formats):
+                self.misses += 1
+                return MISS
+            self.hits += 1
+            self._pending_hits.append((self._run, _key(path)))
+            if len(self._pending_hits) >= BATCH_SIZE:
+                self._flush()
+        if row[6] is None:
+            return None
+        return tuple(row[4:])
+
+    def put(self, path, stat_result, file_date, formats=""):
+        """Store file_date = (date_str, pattern, kind, model) or None if no date was found."""
+        with self._lock:
+            self._pending_puts.append((_key(path), stat_result.st_ino, stat_result.st_size, stat_result.st_mtime) +
+                                      tuple(file_date or (None, None, None, None)) + (formats, self._run))
+            if len(self._pending_puts) >= BATCH_SIZE:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._evict()
+            self._db.commit()
+            self._db.close()
+        logging.info("[CACHE] %s: %d hits, %d misses", self.path, self.hits, self.misses)
+
+    def _flush(self):
+        self._db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", self._pending_puts)
+        self._db.executemany("UPDATE files SET last_used = ? WHERE path = ?", self._pending_hits)
+        self._db.commit()
+        self._pending_puts = []
+        self._pending_hits = []
+
+    def _evict(self):
+        surplus = self._db.execute("SELECT COUNT(*) FROM files").fetchone()[0] - self.max_entries
+        if surplus > 0:
+            logging.debug("Evicting %d cache entries", surplus)
+            self._db.execute("DELETE FROM files WHERE path IN "
+                             "(SELECT path FROM files ORDER BY last_used LIMIT ?)", (surplus,))
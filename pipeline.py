@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Salih Kiliclioglu
+
+# Pipelined processing for mediasort.
+# Stage 1: a walker thread reads the source tree and feeds a bounded queue.
+# Stage 2: a pool of worker threads resolves the dates (EXIF, filename).
+# Stage 3: results() yields the results to the calling thread, which applies them
+#          (create folders, move files) strictly in walk order, so name collisions
+#          are resolved exactly like in sequential mode.
+# run_per_device() runs whole source folders in parallel, limited per device.
+# batches() cuts a stream into lists of a fixed size, e.g. the files moved at a time.
+
+import logging
+import threading
+import time
+
+try:
+    from queue import Empty, Queue
+except ImportError:
+    from Queue import Empty, Queue
+
+timer = getattr(time, 'perf_counter', time.time)
+
+# marks the end of the input for a worker
+_DONE = object()
+
+
+class StageStats(object):
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.busy = 0.0  # type: float
+
+    def add(self, elapsed):
+        self.count += 1
+        self.busy += elapsed
+
+    def report(self, workers=1):
+        # throughput of the stage itself, busy time is summed up over all workers
+        rate = self.count * workers / self.busy if self.busy else 0.0
+        logging.info("[STATS] %-8s %8d files %8.2fs busy %10.1f files/s (%d thread%s)",
+                     self.name, self.count, self.busy, rate, workers, "" if workers == 1 else "s")
+
+
+class Pipeline(object):
+    """Run resolve(entry) in worker threads, the results are applied in the calling thread.
+
+    At most max_in_flight entries are held between the walker and the caller, which keeps
+    memory bounded independent of the size of the tree.
+    """
+
+    def __init__(self, resolve, jobs, max_in_flight=None):
+        self.resolve = resolve
+        self.jobs = max(1, jobs)
+        self.max_in_flight = max_in_flight or self.jobs * 64
+        self.walk_stats = StageStats("walk")
+        self.resolve_stats = StageStats("resolve")
+        self.apply_stats = StageStats("apply")
+        self._stats_lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        self._input = Queue(self.max_in_flight)
+        self._output = Queue()
+        self._walk_error = None
+        self._stopped = False
+
+    def results(self, entries):
+        """Yield (entry, resolve(entry)) in the order of entries, result = None if resolve raised.
+
+        The worker threads are stopped if the generator is closed before the end. The time
+        the caller takes per result counts as apply time, the stages are reported at the end.
+        """
+        start = timer()
+        threads = [threading.Thread(target=self._walk, args=(iter(entries),), name="mediasort-walk")]
+        threads += [threading.Thread(target=self._work, name="mediasort-worker-%d" % index)
+                    for index in range(self.jobs)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        pending = {}
+        next_sequence = 0
+        running = self.jobs
+        try:
+            while running:
+                item = self._output.get()
+                if item is _DONE:
+                    running -= 1
+                    continue
+                pending[item[0]] = item
+                while next_sequence in pending:
+                    _, entry, result = pending[next_sequence]
+                    started = timer()
+                    yield entry, result
+                    self.apply_stats.add(timer() - started)
+                    del pending[next_sequence]
+                    self._in_flight.release()
+                    next_sequence += 1
+        finally:
+            if running:
+                # closed early: the walker stops at its next entry, the results still coming are dropped
+                self._stopped = True
+                for _ in pending:
+                    self._in_flight.release()
+                while running:
+                    item = self._output.get()
+                    if item is _DONE:
+                        running -= 1
+                    else:
+                        self._in_flight.release()
+            for thread in threads:
+                thread.join()
+            self.report(timer() - start)
+        if self._walk_error:
+            raise self._walk_error
+
+    def report(self, wall_time):
+        logging.info("[STATS] %d files in %.2fs", self.apply_stats.count, wall_time)
+        self.walk_stats.report()
+        self.resolve_stats.report(self.jobs)
+        self.apply_stats.report()
+
+    def _walk(self, entries):
+        sequence = 0
+        try:
+            while True:
+                started = timer()
+                try:
+                    entry = next(entries)
+                except StopIteration:
+                    break
+                self.walk_stats.add(timer() - started)
+                self._in_flight.acquire()
+                if self._stopped:
+                    break
+                self._input.put((sequence, entry))
+                sequence += 1
+        except Exception as error:
+            logging.error("Walker failed: %s", error)
+            self._walk_error = error
+        finally:
+            for _ in range(self.jobs):
+                self._input.put(_DONE)
+
+    def _work(self):
+        while True:
+            item = self._input.get()
+            if item is _DONE:
+                self._output.put(_DONE)
+                return
+            sequence, entry = item
+            started = timer()
+            try:
+                result = self.resolve(entry)
+            except Exception as error:
+                logging.error("%s: %s", entry, error)
+                result = None
+            elapsed = timer() - started
+            with self._stats_lock:
+                self.resolve_stats.add(elapsed)
+            self._output.put((sequence, entry, result))
+
+
+def run_per_device(items, device_of, function, per_device=1):
+    """Call function(item) for all items in threads, at most per_device items of one device at a time.
+
+    Items of different devices run concurrently, the items of one device start in the given order.
+    Returns the results in the order of items, None for items whose call raised an exception.
+    """
+    queues = {}
+    for index, item in enumerate(items):
+        queues.setdefault(device_of(item), Queue()).put((index, item))
+    results = [None] * len(items)
+
+    def work(queue):
+        while True:
+            try:
+                index, item = queue.get_nowait()
+            except Empty:
+                return
+            try:
+                results[index] = function(item)
+            except Exception as error:
+                logging.error("%s: %s", item, error)
+
+    threads = []
+    for device, queue in sorted(queues.items()):
+        for number in range(min(max(1, per_device), queue.qsize())):
+            threads.append(threading.Thread(target=work, args=(queue,),
+                                            name="mediasort-device-%s-%d" % (device, number)))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def batches(items, size):
+    """Yield the items in lists of size items, the last one may be shorter."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,461 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Salih Kiliclioglu
+
+# Move planner for mediasort.
+# All moves are collected first. Executing the plan creates every target folder
+# exactly once and moves the files with os.rename if source and target folder are
+# on the same device. Only moves across devices copy the data, in large chunks.
+# The other modes keep the source: copy lets the kernel copy the data (copy_file_range,
+# sendfile), hardlink links on the same device and reflink clones the extents (FICLONE),
+# both fall back to a copy. Timestamps are kept in every mode.
+# In simulation mode the plan is written as JSON instead of being executed.
+# With a journal the moves are recorded before they are executed and their outcomes
+# afterwards, see journal.py.
+# With a target index the folders to create and the free names come from the index,
+# a file whose name is taken by another file gets a numbered name, see targetindex.py.
+# Without one a move to a name which exists is skipped.
+# No move replaces a file: rename_new links the target and removes the source.
+
+import errno
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+
+timer = getattr(time, 'perf_counter', time.time)
+
+COPY_BUFFER_SIZE = 1024 * 1024
+# bytes per copy_file_range/sendfile call, the data doesn't pass through user space
+KERNEL_COPY_SIZE = 64 * 1024 * 1024
+# ioctl of Linux cloning the extents of a file, supported by Btrfs, XFS and OCFS2
+FICLONE = 0x40049409
+# errors of a kernel copy or clone which mean the files don't support it, the data is copied instead
+UNSUPPORTED_ERRNOS = set(getattr(errno, name) for name in ('ENOSYS', 'EXDEV', 'EINVAL', 'ENOTTY', 'EOPNOTSUPP',
+                                                           'ENOTSUP', 'EBADF', 'EPERM') if hasattr(errno, name))
+
+MODE_MOVE = 'move'
+MODE_COPY = 'copy'
+MODE_HARDLINK = 'hardlink'
+MODE_REFLINK = 'reflink'
+MODES = (MODE_MOVE, MODE_COPY, MODE_HARDLINK, MODE_REFLINK)
+# files copied across devices get their final name when they are complete
+PARTIAL_SUFFIX = ".mediasort-part"
+
+# target files being moved to by any plan, plans of several sources run in parallel
+_reserved_targets = set()
+_reserved_lock = threading.Lock()
+
+
+class MovePlan(object):
+    def __init__(self, stats=None, journal=None, mode=MODE_MOVE, index=None):
+        self.stats = stats  # instrument.RunStats for the mkdir and move timings and the outcomes
+        self.journal = journal  # journal.Journal
+        self.mode = mode  # one of MODES, all but MODE_MOVE keep the source files
+        self.index = index  # targetindex.TargetIndex, shared by the plans of a run
+        self.moves = []  # (source file, target folder)
+        self.names = {}  # source file -> target name, for the moves which rename the file
+        # source file -> (name, name claimed in the index or None if the same file is there, size)
+        self._claimed = {}
+        self.folders = []  # distinct target folders in order of first use
+        self._known_folders = set()
+        self._same_device = {}  # (source folder, target folder) -> bool
+        self.completed = []  # (source file, target file) of the executed moves
+        self.created_folders = []  # folders created by execute(), the missing parents included
+        self.moved = 0  # files moved, or copied or linked in the other modes
+        self.skipped = 0
+        self.copied_bytes = 0  # data copied, across devices in move mode
+        self.linked_bytes = 0  # hard linked or cloned, no data copied
+        self.moved_bytes = 0  # size of all files moved, copied or linked
+        self.transfer_time = 0.0  # seconds spent moving the files, mkdir excluded
+
+    def __len__(self):
+        return len(self.moves)
+
+    def add(self, source_file, target_folder, name=None):
+        """Plan moving source_file to target_folder, renamed to name if given."""
+        logging.info("[MOVE] %s to %s", source_file, target_folder)
+        self.moves.append((source_file, target_folder))
+        self._use_folder(target_folder)
+        if name and name != os.path.basename(source_file):
+            self.names[source_file] = name
+
+    def target_name(self, source_file):
+        claimed = self._claimed.get(source_file)
+        if claimed and claimed[1]:
+            return claimed[1]
+        return self.names.get(source_file) or os.path.basename(source_file)
+
+    def _use_folder(self, target_folder):
+        if target_folder not in self._known_folders:
+            self._known_folders.add(target_folder)
+            self.folders.append(target_folder)
+
+    def extend(self, plan):
+        """Append the moves of another plan."""
+        for source_file, target_folder in plan.moves:
+            self.moves.append((source_file, target_folder))
+            self._use_folder(target_folder)
+        self.names.update(plan.names)
+
+    def retarget(self, targets):
+        """Change the target folder of moves, targets = {source file: new target folder or None to drop it}."""
+        moves = self.moves
+        self.moves = []
+        self.folders = []
+        self._known_folders = set()
+        for source_file, target_folder in moves:
+            target_folder = targets.get(source_file, target_folder)
+            if target_folder is None:
+                self.skipped += 1
+                continue
+            self.moves.append((source_file, target_folder))
+            self._use_folder(target_folder)
+
+    def add_counts(self, plan):
+        """Add the outcomes of an executed plan to the counters of this one."""
+        self.moved += plan.moved
+        self.skipped += plan.skipped
+        self.copied_bytes += plan.copied_bytes
+        self.linked_bytes += plan.linked_bytes
+        self.moved_bytes += plan.moved_bytes
+        self.transfer_time += plan.transfer_time
+
+    def target_files(self):
+        """[(source file, target file)] of the moves."""
+        return [(source_file, os.path.join(target_folder, self.target_name(source_file)))
+                for source_file, target_folder in self.moves]
+
+    def to_dict(self):
+        return {'folders': self.folders,
+                'moves': [{'source': source_file, 'target': target_file}
+                          for source_file, target_file in self.target_files()]}
+
+    def dump(self, stream):
+        json.dump(self.to_dict(), stream, indent=2, separators=(',', ': '), sort_keys=True)
+        stream.write("\n")
+
+    def execute(self):
+        """Create the target folders and move the files. Return the number of moved files."""
+        stats = self.stats
+        journal = self.journal
+        failed_folders = set()
+        for folder in self.folders:
+            start = timer()
+            if not self.create_folder(folder):
+                failed_folders.add(folder)
+            if stats:
+                stats.add('mkdir', timer() - start)
+        if self.index is not None:
+            self.claim_names(failed_folders)
+        if journal:
+            # the final names, the files which are there already aren't moved
+            journal.begin([(source_file, target_file) for source_file, target_file in self.target_files()
+                           if self._claimed.get(source_file, (None, True))[1] is not None], self.mode)
+
+        for source_file, target_folder in self.moves:
+            start = timer()
+            target_file = os.path.join(target_folder, self.target_name(source_file))
+            if target_folder in failed_folders:
+                logging.info("[SKIP] No target folder for %s", source_file)
+                self.skipped += 1
+                outcome = 'no_target_folder'
+            else:
+                outcome, target_file = self.move(source_file, target_folder, self.target_name(source_file))
+                if outcome in ('moved', 'copied'):
+                    self.moved += 1
+                    self.completed.append((source_file, target_file))
+                else:
+                    self.skipped += 1
+            if journal:
+                journal.finish(source_file, target_file, outcome)
+            elapsed = timer() - start
+            self.transfer_time += elapsed
+            if stats:
+                stats.add('move', elapsed)
+                stats.count(outcome)
+        if journal:
+            journal.sync()
+        if stats:
+            stats.add_bytes(self.moved_bytes, self.copied_bytes, self.linked_bytes)
+        logging.info("[PLAN] %s: %d files, %d skipped, %d bytes (%d copied, %d linked) in %.2fs, %.1f MB/s",
+                     self.mode, self.moved, self.skipped, self.moved_bytes, self.copied_bytes, self.linked_bytes,
+                     self.transfer_time, self.throughput() / 1000000)
+        return self.moved
+
+    def throughput(self):
+        """Bytes moved, copied or linked per second of transfer time."""
+        return self.moved_bytes / self.transfer_time if self.transfer_time else 0.0
+
+    def create_folder(self, folder):
+        if self.index.folder_exists(folder) if self.index is not None else os.path.isdir(folder):
+            return True
+        # every folder created is recorded, the missing parents included
+        created = []
+        parent = folder
+        while parent and not os.path.isdir(parent):
+            created.append(parent)
+            parent = os.path.dirname(parent)
+        try:
+            os.makedirs(folder)
+        except OSError as error:
+            if error.errno == errno.EEXIST and os.path.isdir(folder):
+                return True  # created by a plan running in parallel
+            logging.error("%s Folder: %s", error, folder)
+            return False
+        logging.debug("Folder created: %s", folder)
+        created.reverse()
+        if self.index is not None:
+            self.index.folder_created(created)
+        for created_folder in created:
+            self.created_folders.append(created_folder)
+            if self.journal:
+                self.journal.folder_created(created_folder)
+        return True
+
+    def is_same_device(self, source_folder, target_folder):
+        key = (source_folder, target_folder)
+        if key not in self._same_device:
+            self._same_device[key] = os.stat(source_folder).st_dev == os.stat(target_folder).st_dev
+        return self._same_device[key]
+
+    def move(self, source_file, target_folder, name=None):
+        """Move source_file to target_folder as name, its own name by default.
+
+        Returns (outcome, target file). outcome is 'moved', 'copied' if the source is kept,
+        'target_exists' or 'move_failed'. With an index the target file may be renamed.
+        """
+        name = name or os.path.basename(source_file)
+        target_file = os.path.join(target_folder, name)
+        if source_file in self._claimed:
+            return self._move_indexed(source_file, target_folder, *self._claimed[source_file])
+        try:
+            size = os.lstat(source_file).st_size
+        except OSError as error:
+            logging.error("%s", error)
+            logging.info("[SKIP] Move failed: %s", source_file)
+            return 'move_failed', target_file
+        if self.index is not None:
+            return self._move_indexed(source_file, target_folder, name, self._claim(source_file, target_folder,
+                                                                                     name, size), size)
+        with _reserved_lock:
+            if target_file in _reserved_targets or os.path.lexists(target_file):
+                logging.info("[SKIP] Target exists: %s", target_file)
+                return 'target_exists', target_file
+            _reserved_targets.add(target_file)
+        try:
+            return self._transfer(source_file, target_folder, target_file, size), target_file
+        finally:
+            with _reserved_lock:
+                _reserved_targets.discard(target_file)
+
+    def claim_names(self, failed_folders=()):
+        """Claim the target names of the moves in the index, before they are journaled."""
+        for source_file, target_folder in self.moves:
+            if target_folder in failed_folders or source_file in self._claimed:
+                continue
+            try:
+                size = os.lstat(source_file).st_size
+            except OSError:
+                continue  # the move fails
+            self._claim(source_file, target_folder, self.target_name(source_file), size)
+
+    def _claim(self, source_file, target_folder, name, size):
+        """The name claimed for the move, None if the same file is there."""
+        free_name = self.index.claim(target_folder, name, size)
+        self._claimed[source_file] = (name, free_name, size)
+        if free_name is None:
+            logging.info("[SKIP] Same name and size in target: %s", os.path.join(target_folder, name))
+        elif free_name != name:
+            logging.info("[MOVE] %s renamed to %s, the name is taken", source_file, free_name)
+        return free_name
+
+    def _move_indexed(self, source_file, target_folder, name, free_name, size):
+        outcome = 'target_exists'
+        while free_name is not None:
+            outcome = self._transfer(source_file, target_folder, os.path.join(target_folder, free_name), size)
+            if outcome != 'target_exists':
+                break
+            # put there by another program after the folder was listed, the name stays taken
+            free_name = self._claim(source_file, target_folder, name, size)
+            if free_name is not None and self.journal:
+                self.journal.begin([(source_file, os.path.join(target_folder, free_name))], self.mode)
+        target_file = os.path.join(target_folder, free_name or name)
+        if outcome == 'move_failed':
+            self.index.release(target_folder, free_name)
+        elif outcome == 'moved':
+            # the source folder may be a target folder as well
+            self.index.release(os.path.dirname(source_file), os.path.basename(source_file))
+        return outcome, target_file
+
+    def _transfer(self, source_file, target_folder, target_file, size):
+        if self.mode == MODE_MOVE:
+            return self._move(source_file, target_folder, target_file, size)
+        return self._copy(source_file, target_folder, target_file, size)
+
+    def _move(self, source_file, target_folder, target_file, size):
+        try:
+            if self.is_same_device(os.path.dirname(source_file) or os.curdir, target_folder):
+                try:
+                    rename_new(source_file, target_file)
+                    self.moved_bytes += size
+                    return 'moved'
+                except OSError as error:
+                    # same st_dev, but different mounts of one filesystem
+                    if error.errno != errno.EXDEV:
+                        raise
+            self.copy(source_file, target_file, size)
+            os.remove(source_file)
+            self.moved_bytes += size
+            return 'moved'
+        except (IOError, OSError) as error:
+            if error.errno == errno.EEXIST:
+                logging.info("[SKIP] Target exists: %s", target_file)
+                return 'target_exists'
+            logging.error("%s", error)
+            logging.info("[SKIP] Move failed: %s", source_file)
+            return 'move_failed'
+
+    def _copy(self, source_file, target_folder, target_file, size):
+        try:
+            if self.mode == MODE_HARDLINK and self.is_same_device(os.path.dirname(source_file) or os.curdir,
+                                                                  target_folder):
+                try:
+                    os.link(source_file, target_file)
+                    self.linked_bytes += size
+                    self.moved_bytes += size
+                    return 'copied'
+                except OSError as error:
+                    # different mounts of one filesystem or no hard links on it
+                    if error.errno not in UNSUPPORTED_ERRNOS | {errno.EMLINK}:
+                        raise
+            self.copy(source_file, target_file, size, clone=self.mode == MODE_REFLINK)
+            self.moved_bytes += size
+            return 'copied'
+        except (IOError, OSError) as error:
+            if error.errno == errno.EEXIST:
+                logging.info("[SKIP] Target exists: %s", target_file)
+                return 'target_exists'
+            logging.error("%s", error)
+            logging.info("[SKIP] Copy failed: %s", source_file)
+            return 'move_failed'
+
+    def copy(self, source_file, target_file, size, clone=False):
+        """Copy source_file of size bytes with its timestamps, try to clone it first if clone is set."""
+        partial_file = target_file + PARTIAL_SUFFIX
+        cloned = False
+        try:
+            with open(source_file, 'rb') as source, open(partial_file, 'wb') as target:
+                cloned = clone and clone_file(source, target)
+                if not cloned:
+                    copy_data(source, target, size)
+                target.flush()
+                if os.fstat(target.fileno()).st_size != size:
+                    raise IOError(errno.EIO, "Incomplete copy", partial_file)
+            shutil.copystat(source_file, partial_file)
+            rename_new(partial_file, target_file)
+        except (IOError, OSError):
+            if os.path.exists(partial_file):
+                os.remove(partial_file)
+            raise
+        if cloned:
+            self.linked_bytes += os.path.getsize(target_file)
+        else:
+            self.copied_bytes += os.path.getsize(target_file)
+
+
+def is_transferred(source_file, target_file, mode):
+    """Whether target_file is the result of moving or copying source_file in mode.
+
+    A move if the source is gone, a hard link if it is the source file, a copy if the sizes match.
+    """
+    try:
+        target = os.lstat(target_file)
+    except OSError:
+        return False
+    try:
+        source = os.lstat(source_file)
+    except OSError:
+        return mode == MODE_MOVE
+    if mode == MODE_MOVE:
+        return False
+    if mode == MODE_HARDLINK and source.st_dev == target.st_dev:
+        return os.path.samestat(source, target)
+    return source.st_size == target.st_size
+
+
+def _link(source, target):
+    """Hard link to a symlink itself, like os.rename moves it."""
+    if sys.version_info[0] < 3:
+        os.link(source, target)  # link() of Linux doesn't follow symlinks
+    else:
+        os.link(source, target, follow_symlinks=False)
+
+
+def rename_new(source, target):
+    """Rename source to target without replacing a file: OSError EEXIST if target exists.
+
+    Atomic where the filesystem has hard links: target is linked and source removed.
+    Elsewhere target is checked before the rename.
+    """
+    try:
+        _link(source, target)
+    except OSError as error:
+        if error.errno not in UNSUPPORTED_ERRNOS | {errno.EMLINK}:
+            raise
+        if os.path.lexists(target):
+            raise OSError(errno.EEXIST, os.strerror(errno.EEXIST), target)
+        os.rename(source, target)
+        return
+    os.remove(source)
+
+
+def clone_file(source, target):
+    """Share the extents of the open file source with target. False if the filesystem can't."""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+    except (IOError, OSError) as error:
+        if error.errno not in UNSUPPORTED_ERRNOS:
+            raise
+        return False
+    return True
+
+
+def copy_data(source, target, size):
+    """Copy the open file source of size bytes to target, in the kernel if the platform allows it."""
+    for kernel_copy in _kernel_copies():
+        offset = 0
+        try:
+            while True:
+                copied = kernel_copy(source.fileno(), target.fileno(), offset)
+                if not copied:
+                    break
+                offset += copied
+        except OSError as error:
+            # nothing written yet, the next way of copying starts from the beginning
+            if offset or error.errno not in UNSUPPORTED_ERRNOS:
+                raise
+        # nothing copied from a file which isn't empty, e.g. from a filesystem the kernel can't copy from
+        if offset or not size:
+            return
+    shutil.copyfileobj(source, target, COPY_BUFFER_SIZE)
+
+
+def _kernel_copies():
+    """Functions copying up to KERNEL_COPY_SIZE bytes at offset(source fd, target fd, offset), best first."""
+    copies = []
+    if hasattr(os, 'copy_file_range'):
+        copies.append(lambda source_fd, target_fd, offset:
+                      os.copy_file_range(source_fd, target_fd, KERNEL_COPY_SIZE, offset, offset))
+    if hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+        # the target is written at its position, which moves on like the offset
+        copies.append(lambda source_fd, target_fd, offset:
+                      os.sendfile(target_fd, source_fd, offset, KERNEL_COPY_SIZE))
+    return copies
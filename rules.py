@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Salih Kiliclioglu
+
+# Declarative sort rules for mediasort.
+# A rules file is JSON: {"rules": [{"match": {...}, "target": "{year}/{month}/{model}"}, ...]}.
+# The first rule matching a file gives its target folder, files without a matching rule stay.
+# The rules are compiled once into a dispatch table extension -> candidate rules. The rules
+# left for an extension, camera model and date source are memoized, their filename patterns
+# combined into one regex like the datetime formats of the classifier. So a file costs one
+# dict lookup and one regex match, however many rules there are.
+# The date fields of a target are turned into a strftime pattern, the folder name of the
+# date is made like the -g formats, only model, extension and date source are filled in
+# per file.
+
+import fnmatch
+import json
+import re
+
+DATE_SOURCE_EXIF = "exif"
+DATE_SOURCE_FILENAME = "filename"
+DATE_SOURCE_VIDEO = "video"
+DATE_SOURCES = (DATE_SOURCE_EXIF, DATE_SOURCE_FILENAME, DATE_SOURCE_VIDEO)
+
+MATCHERS = ("extension", "model", "date_source", "filename")
+
+# template fields -> strftime directive, the other fields are filled in per file
+DATE_FIELDS = {
+    'year': '%Y',
+    'month': '%m',
+    'day': '%d',
+    'hour': '%H',
+    'minute': '%M',
+    'second': '%S',
+    'weekday': '%a',
+}
+FILE_FIELDS = ("model", "ext", "date_source")
+
+# filename patterns combined into one regex, Python 2 allows 100 groups per regex
+PATTERNS_PER_REGEX = 90
+
+# {model} of files without a camera model
+UNKNOWN_MODEL = "unknown"
+
+_FIELD_REGEX = re.compile(r"\{\{|\}\}|\{([^{}]*)\}|[{}]")
+
+
+def as_list(value):
+    """Accept a single value or a list of values."""
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+def compile_template(template):
+    """Split a target template into a strftime pattern of the date fields and a format string.
+
+    "{year}/{month}/{model}" -> ("%Y/%m/{model}", True), the flag tells if the folder name of the
+    date still has to be formatted, for the file fields or escaped braces.
+    """
+    parts = []
+    needs_format = False
+    position = 0
+    for match in _FIELD_REGEX.finditer(template):
+        parts.append(template[position:match.start()].replace('%', '%%'))
+        position = match.end()
+        token = match.group()
+        field = match.group(1)
+        if field in DATE_FIELDS:
+            parts.append(DATE_FIELDS[field])
+        elif token in ("{{", "}}") or field in FILE_FIELDS:
+            parts.append(token)
+            needs_format = True
+        else:
+            raise ValueError("Unknown field %s in target %s" % (token, template))
+    parts.append(template[position:].replace('%', '%%'))
+    return "".join(parts), needs_format
+
+
+class Rule(object):
+    """One rule: the matchers which are given and the compiled target."""
+
+    def __init__(self, index, match, target):
+        self.index = index
+        unknown = sorted(set(match) - set(MATCHERS))
+        if unknown:
+            raise ValueError("Rule %d: unknown matcher %s" % (index, ", ".join(unknown)))
+        self.extensions = None
+        if 'extension' in match:
+            self.extensions = set(extension.lstrip('.').lower() for extension in as_list(match['extension']))
+        self.date_sources = None
+        if 'date_source' in match:
+            self.date_sources = set(as_list(match['date_source']))
+            if not self.date_sources <= set(DATE_SOURCES):
+                raise ValueError("Rule %d: date_source must be one of %s" % (index, "|".join(DATE_SOURCES)))
+        try:
+            # the whole model has to match, "" matches files without a model
+            self.model = re.compile("(?:%s)\\Z" % match['model']) if 'model' in match else None
+            self.filename = re.compile(fnmatch.translate(match['filename'])) if 'filename' in match else None
+        except re.error as error:
+            raise ValueError("Rule %d: %s" % (index, error))
+        self.target = target
+        self.date_format, self.needs_format = compile_template(target)
+
+    def matches(self, filename, model, date_source):
+        return self.matches_metadata(model, date_source) and (self.filename is None or
+                                                              self.filename.match(filename) is not None)
+
+    def matches_metadata(self, model, date_source):
+        if self.date_sources is not None and date_source not in self.date_sources:
+            return False
+        return self.model is None or self.model.match(model or "") is not None
+
+    def folder(self, date_folder, extension, model, date_source):
+        """Target folder of a file, date_folder = its date formatted with date_format."""
+        if not self.needs_format:
+            return date_folder
+        return date_folder.format(model=(model or UNKNOWN_MODEL).replace('/', '_').strip() or UNKNOWN_MODEL,
+                                  ext=extension.lower(), date_source=date_source)
+
+
+class RuleSet(object):
+    """Rules in order of priority, indexed by extension."""
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._any_extension = tuple(rule for rule in self.rules if rule.extensions is None)
+        extensions = set()
+        for rule in self.rules:
+            extensions.update(rule.extensions or ())
+        # rules for the extension and rules for any extension, in the order of the file
+        self._by_extension = dict((extension, tuple(rule for rule in self.rules
+                                                    if rule.extensions is None or extension in rule.extensions))
+                                  for extension in extensions)
+        # (extension, model, date_source) -> ([regex of the filename patterns], rule without pattern or None)
+        self._dispatch = {}
+
+    def __len__(self):
+        return len(self.rules)
+
+    def candidates(self, extension):
+        return self._by_extension.get(extension.lower(), self._any_extension)
+
+    def find(self, filename, extension, model, date_source):
+        """The first rule matching the file or None."""
+        key = (extension, model, date_source)
+        dispatch = self._dispatch.get(key)
+        if dispatch is None:
+            dispatch = self._dispatch[key] = self._dispatch_rules(extension, model, date_source)
+        regexes, fallback = dispatch
+        for regex in regexes:
+            match = regex.match(filename)
+            if match:
+                # group r<index> of the rule, the outer group is the last one closed
+                return self.rules[int(match.lastgroup[1:]) - 1]
+        return fallback
+
+    def _dispatch_rules(self, extension, model, date_source):
+        """The rules matching the model and date source up to the first one without filename pattern."""
+        patterns = []
+        fallback = None
+        for rule in self.candidates(extension):
+            if rule.matches_metadata(model, date_source):
+                if rule.filename is None:
+                    fallback = rule
+                    break
+                patterns.append("(?P<r%d>%s)" % (rule.index, rule.filename.pattern))
+        regexes = [re.compile("|".join(patterns[start:start + PATTERNS_PER_REGEX]))
+                   for start in range(0, len(patterns), PATTERNS_PER_REGEX)]
+        return regexes, fallback
+
+
+def compile_rules(config):
+    """RuleSet of a parsed rules file, raises ValueError if it is invalid."""
+    if not isinstance(config, dict) or not isinstance(config.get('rules'), list):
+        raise ValueError("A rules file needs a list of rules: {\"rules\": [...]}")
+    rules = []
+    for index, rule in enumerate(config['rules'], 1):
+        if not isinstance(rule, dict) or 'target' not in rule:
+            raise ValueError("Rule %d: no target" % index)
+        rules.append(Rule(index, rule.get('match', {}), rule['target']))
+    return RuleSet(rules)
+
+
+def load_rules(path):
+    with open(path) as rules_file:
+        return compile_rules(json.load(rules_file))
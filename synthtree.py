@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Salih Kiliclioglu
+
+# Synthetic media trees for the benchmarks of mediasort.
+# A tree has depth levels of fanout subfolders each, the files are spread evenly over all
+# folders. JPEGs carry a real APP1 segment with DateTime and Model, so the header reader
+# does the same work as for camera files. Videos are dated by their name or by the mvhd
+# box of their container, undated files have neither a date in their header nor in their
+# name. Every folder gets a Synology @eaDir folder with thumbnails, which the walker must
+# skip. The tree is the same for the same spec.
+
+from datetime import datetime, timedelta
+
+import os
+import random
+import struct
+import time
+
+EAD_FOLDER = "@eaDir"
+MODELS = ("iPhone X", "Pixel 3", "Canon EOS 80D", "DMC-FZ1000")
+FIRST_DATE = datetime(2000, 1, 1)
+DATE_RANGE = 20 * 365 * 24 * 3600  # seconds after FIRST_DATE
+
+# seconds between 1904-01-01, the epoch of mvhd, and the Unix epoch
+MP4_EPOCH_OFFSET = int((datetime(1970, 1, 1) - datetime(1904, 1, 1)).total_seconds())
+
+# entropy coded data after the start of scan, stands in for the image
+JPEG_SCAN_DATA = b'\x00' * 256
+
+KIND_EXIF = 'exif'
+KIND_NAMED = 'named'
+KIND_VIDEO = 'video'
+KIND_UNDATED = 'undated'
+
+
+class TreeSpec(object):
+    """Shape of a synthetic tree. The ratios are fractions of files, the rest is dated by filename."""
+
+    def __init__(self, files=1000, depth=3, fanout=10, exif_ratio=0.4, video_ratio=0.3, undated_ratio=0.1,
+                 eadir_files=2, seed=1):
+        self.files = files
+        self.depth = depth
+        self.fanout = fanout
+        self.exif_ratio = exif_ratio
+        self.video_ratio = video_ratio
+        self.undated_ratio = undated_ratio
+        self.eadir_files = eadir_files  # thumbnails per folder
+        self.seed = seed
+
+
+def make_tiff(date_str, model):
+    """Little endian TIFF structure with DateTime and Model in IFD0."""
+    entries = sorted([(0x0132, date_str.encode('ascii') + b'\x00'), (0x0110, model.encode('ascii') + b'\x00')])
+    data_offset = 8 + 2 + len(entries) * 12 + 4
+    ifd = struct.pack('<H', len(entries))
+    data = b''
+    for tag, value in entries:
+        ifd += struct.pack('<HHII', tag, 2, len(value), data_offset + len(data))
+        data += value
+    return b'II' + struct.pack('<HI', 42, 8) + ifd + struct.pack('<I', 0) + data
+
+
+def make_jpeg(date_str=None, model=None):
+    """JPEG with a JFIF APP0 segment and, if date_str is given, an Exif APP1 segment."""
+    app0 = b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00\x01\x01\x00\x00\x48\x00\x48\x00\x00'
+    app1 = b''
+    if date_str:
+        tiff = make_tiff(date_str, model or "")
+        app1 = b'\xff\xe1' + struct.pack('>H', len(tiff) + 8) + b'Exif\x00\x00' + tiff
+    return b'\xff\xd8' + app0 + app1 + b'\xff\xda\x00\x02' + JPEG_SCAN_DATA + b'\xff\xd9'
+
+
+def make_mp4(seconds):
+    """MP4 with ftyp, moov/mvhd created seconds after FIRST_DATE in local time and a small mdat."""
+    created = MP4_EPOCH_OFFSET + int(time.mktime((FIRST_DATE + timedelta(seconds=seconds)).timetuple()))
+    mvhd = struct.pack('>I4s4sII', 8 + 12 + 88, b'mvhd', b'\x00' * 4, created, created) + b'\x00' * 88
+    return (struct.pack('>I4s8s', 16, b'ftyp', b'isom\x00\x00\x02\x00') +
+            struct.pack('>I4s', 8 + len(mvhd), b'moov') + mvhd +
+            struct.pack('>I4s', 8 + 256, b'mdat') + b'\x00' * 256)
+
+
+def list_folders(folder, depth, fanout):
+    """The folder and its subfolders up to depth levels, parents first."""
+    folders = [folder]
+    level = [folder]
+    for _ in range(depth):
+        level = [os.path.join(parent, "d%02d" % index) for parent in level for index in range(fanout)]
+        folders.extend(level)
+    return folders
+
+
+def create_tree(folder, spec):
+    """Create the tree described by spec below folder. Returns the number of files per kind."""
+    rng = random.Random(spec.seed)
+    folders = list_folders(folder, spec.depth, spec.fanout)
+    counts = dict((kind, 0) for kind in (KIND_EXIF, KIND_NAMED, KIND_VIDEO, KIND_UNDATED))
+    counts['folders'] = len(folders)
+    counts['noise'] = 0
+    counts['bytes'] = 0
+    for subfolder in folders:
+        os.makedirs(os.path.join(subfolder, EAD_FOLDER))
+        for index in range(spec.eadir_files):
+            write_file(os.path.join(subfolder, EAD_FOLDER, "SYNOPHOTO_THUMB_%d.jpg" % index), make_jpeg())
+            counts['noise'] += 1
+
+    for index in range(spec.files):
+        taken = FIRST_DATE + timedelta(seconds=int(rng.random() * DATE_RANGE))
+        stamp = taken.strftime("%Y%m%d_%H%M%S")
+        choice = rng.random()
+        if choice < spec.exif_ratio:
+            kind = KIND_EXIF
+            name = "DSC%07d.JPG" % index
+            content = make_jpeg(taken.strftime("%Y:%m:%d %H:%M:%S"), MODELS[index % len(MODELS)])
+        elif choice < spec.exif_ratio + spec.video_ratio:
+            kind = KIND_VIDEO
+            if index % 2:
+                name = "VID_%s_%d.mp4" % (stamp, index)
+                content = b'\x00' * 512
+            else:
+                name = "MOV%07d.mp4" % index
+                content = make_mp4(int((taken - FIRST_DATE).total_seconds()))
+        elif choice < spec.exif_ratio + spec.video_ratio + spec.undated_ratio:
+            kind = KIND_UNDATED
+            if index % 2:
+                name = "scan%07d.jpg" % index
+                content = make_jpeg()
+            else:
+                name = "notes%07d.txt" % index
+                content = b'notes\n'
+        else:
+            kind = KIND_NAMED
+            name = "IMG_%s_%d.tif" % (stamp, index)
+            content = b'II*\x00' + b'\x00' * 252
+        write_file(os.path.join(folders[index % len(folders)], name), content)
+        counts[kind] += 1
+        counts['bytes'] += len(content)
+    counts['files'] = spec.files
+    return counts
+
+
+def write_file(path, content):
+    with open(path, 'wb') as media_file:
+        media_file.write(content)
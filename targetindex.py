@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Salih Kiliclioglu
+
+# Index of the target folders of mediasort.
+# A target folder is listed once, when the first move goes there, and the hashes of its
+# names are kept in a NameSet per folder which the moves update, 16-32 bytes per name. So
+# whether a folder has to be created, a file of the same name is there or which name_1.jpg
+# is free is known without a syscall per file. Only the size of a file whose name (hash)
+# collides is read, a file with the same name and size is skipped, otherwise the source
+# gets the first free name_<n>.
+# With a path the listings are stored in sqlite and reused by later runs while the mtime
+# of the folder is unchanged, one stat per folder instead of listing it.
+# The listings are only as fresh as the run: files put into a target folder by another
+# program while the index holds it aren't seen, forget() drops the listings. The moves
+# don't replace such a file, they take the next free name instead.
+# Only the folders created by a run are known to be empty, existing parents are listed.
+
+from array import array
+
+import logging
+import os
+import sys
+import threading
+import time
+
+try:
+    from os import fsencode as _encode, fsdecode as _decode
+except ImportError:
+    # Python 2 paths are byte strings already
+    def _encode(path):
+        return path
+
+    _decode = _encode
+
+
+def _intern(folder):
+    """One string object for all uses of a folder name."""
+    try:
+        return sys.intern(folder)
+    except AttributeError:
+        # Python 2 only interns byte strings
+        return intern(folder) if isinstance(folder, str) else folder  # noqa: F821
+
+INDEX_VERSION = 1
+# folders changed less than this many seconds before they are stored are listed again by the
+# next run, a change within the resolution of the mtime would go unnoticed otherwise.
+# An mtime of whole seconds may come from a filesystem with a resolution of 1 or 2 seconds.
+MTIME_SETTLE_TIME = 0.05
+COARSE_MTIME_SETTLE_TIME = 2.0
+# separates the names of a folder in the stored index, no filename contains it
+NAME_SEPARATOR = b"/"
+
+# NameSet slots: unsigned 64 bit, free and deleted slots are marked by the smallest keys
+try:
+    _TYPECODE = 'Q'
+    array(_TYPECODE)
+except ValueError:
+    _TYPECODE = 'L'  # Python 2, 64 bit on 64 bit Linux
+_KEY_MASK = (1 << (8 * array(_TYPECODE).itemsize)) - 1
+_FREE = 0
+_DELETED = 1
+MIN_SLOTS = 8
+
+
+def _name_key(name):
+    key = hash(name) & _KEY_MASK
+    return key if key > _DELETED else key + 2
+
+
+class NameSet(object):
+    """Set of names stored as their hashes in one array, open addressing with linear probing.
+
+    Two names with the same hash are taken for one, which can only cost a numbered name.
+    """
+    __slots__ = ('_slots', '_count', '_used')
+
+    def __init__(self, names=()):
+        self._slots = array(_TYPECODE, [_FREE]) * MIN_SLOTS
+        self._count = 0
+        self._used = 0  # slots not free, the deleted ones included
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, name):
+        return self._find(_name_key(name)) is not None
+
+    def _find(self, key):
+        slots = self._slots
+        mask = len(slots) - 1
+        index = key & mask
+        while True:
+            value = slots[index]
+            if value == key:
+                return index
+            if value == _FREE:
+                return None
+            index = (index + 1) & mask
+
+    def add(self, name):
+        """Add name, False if it is there already."""
+        key = _name_key(name)
+        if (self._used + 1) * 2 > len(self._slots):
+            self._resize()
+        slots = self._slots
+        mask = len(slots) - 1
+        index = key & mask
+        deleted = None
+        while True:
+            value = slots[index]
+            if value == key:
+                return False
+            if value == _FREE:
+                break
+            if value == _DELETED and deleted is None:
+                deleted = index
+            index = (index + 1) & mask
+        if deleted is None:
+            self._used += 1
+            deleted = index
+        slots[deleted] = key
+        self._count += 1
+        return True
+
+    def discard(self, name):
+        index = self._find(_name_key(name))
+        if index is not None:
+            self._slots[index] = _DELETED
+            self._count -= 1
+
+    def _resize(self):
+        # a quarter of the slots used afterwards, the deleted ones are dropped
+        size = MIN_SLOTS
+        while size < self._count * 4:
+            size *= 2
+        slots = array(_TYPECODE, [_FREE]) * size
+        mask = size - 1
+        for key in self._slots:
+            if key > _DELETED:
+                index = key & mask
+                while slots[index]:
+                    index = (index + 1) & mask
+                slots[index] = key
+        self._slots = slots
+        self._used = self._count
+
+
+def numbered_name(name, number):
+    """name_<number> before the extension: IMG_1.jpg for IMG.jpg and 1."""
+    stem, dot, extension = name.rpartition('.')
+    if not stem:
+        return "%s_%d" % (name, number)
+    return "%s_%d.%s" % (stem, number, extension)
+
+
+class TargetIndex(object):
+    """Names in the target folders, listed on first use. Shared by the plans of a Sorter."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.listed = 0
+        self.reused = 0
+        self._folders = {}  # folder -> NameSet, None if the folder doesn't exist
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            import sqlite3
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.text_factory = bytes
+            if self._db.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+                self._db.execute("DROP TABLE IF EXISTS folders")
+                self._db.execute("PRAGMA user_version = %d" % INDEX_VERSION)
+            self._db.execute("CREATE TABLE IF NOT EXISTS folders (path BLOB PRIMARY KEY, mtime REAL, names BLOB)")
+
+    def __len__(self):
+        """Number of names held."""
+        with self._lock:
+            return sum(len(names) for names in self._folders.values() if names)
+
+    def folder_exists(self, folder):
+        with self._lock:
+            return self._names(folder) is not None
+
+    def folder_created(self, folders):
+        """Record the folders created by makedirs, parents first. The parents which existed are listed on first use."""
+        with self._lock:
+            for folder in folders:
+                if self._folders.get(folder) is None:
+                    self._folders[_intern(folder)] = NameSet()
+                parent, name = os.path.split(folder)
+                names = self._folders.get(parent)
+                if names is not None:
+                    names.add(name)
+
+    def claim(self, folder, name, size):
+        """Reserve a free name for a file of size bytes in folder, None if the same file is there.
+
+        The name itself if it's free, else the first free numbered name. A file of the same
+        size under the name or one of the numbered names taken counts as the same file.
+        """
+        with self._lock:
+            names = self._names(folder)
+            if names is None:
+                return name  # no folder, the move fails
+            candidate = name
+            number = 0
+            while not names.add(candidate):
+                if self._size(os.path.join(folder, candidate)) == size:
+                    return None
+                number += 1
+                candidate = numbered_name(name, number)
+            return candidate
+
+    def release(self, folder, name):
+        """Give up a name claimed for a move which failed."""
+        with self._lock:
+            names = self._folders.get(folder)
+            if names:
+                names.discard(name)
+
+    def forget(self):
+        """Store and drop the listings, folders are listed again on their next use."""
+        with self._lock:
+            self._store()
+            self._folders = {}
+
+    def close(self):
+        with self._lock:
+            self._store()
+            if self._db:
+                self._db.close()
+                self._db = None
+        if self.path:
+            logging.info("[INDEX] %s: %d folders listed, %d unchanged", self.path, self.listed, self.reused)
+        else:
+            logging.info("[INDEX] %d folders listed", self.listed)
+
+    def _names(self, folder):
+        try:
+            return self._folders[folder]
+        except KeyError:
+            pass
+        names = self._load(folder)
+        if names is None:
+            try:
+                names = NameSet(os.listdir(folder))
+                self.listed += 1
+            except OSError:
+                names = None
+        self._folders[_intern(folder)] = names
+        return names
+
+    def _load(self, folder):
+        if not self._db:
+            return None
+        row = self._db.execute("SELECT mtime, names FROM folders WHERE path = ?", (_encode(folder),)).fetchone()
+        if row is None:
+            return None
+        try:
+            if os.stat(folder).st_mtime != row[0]:
+                return None
+        except OSError:
+            return None
+        self.reused += 1
+        return NameSet(_decode(name) for name in row[1].split(NAME_SEPARATOR) if name)
+
+    def _store(self):
+        """Store the folders held, listed again as only the hashes of their names are known."""
+        if not self._db:
+            return
+        now = time.time()
+        rows = []
+        for folder, names in self._folders.items():
+            if names is None:
+                continue
+            try:
+                # a change after the stat changes the mtime, the folder is listed again next time
+                mtime = os.stat(folder).st_mtime
+                if now - mtime >= (COARSE_MTIME_SETTLE_TIME if mtime == int(mtime) else MTIME_SETTLE_TIME):
+                    rows.append((_encode(folder), mtime,
+                                 NAME_SEPARATOR.join(_encode(name) for name in os.listdir(folder))))
+            except OSError:
+                continue
+        self._db.executemany("INSERT OR REPLACE INTO folders VALUES (?, ?, ?)", rows)
+        self._db.commit()
+
+    @staticmethod
+    def _size(path):
+        try:
+            return os.lstat(path).st_size
+        except OSError:
+            return None
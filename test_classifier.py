@@ -0,0 +1,45 @@
+import re
+import unittest
+
+import classifier
+from mediasort import datetime_formats, FILE_EXTENSION_EXIF, FILE_EXTENSION_VIDEO, FILE_EXTENSION_OTHER
+
+
+class FilenameClassifierTest(unittest.TestCase):
+    def setUp(self):
+        self.classifier = classifier.FilenameClassifier(datetime_formats, FILE_EXTENSION_EXIF, FILE_EXTENSION_VIDEO,
+                                                        FILE_EXTENSION_OTHER)
+
+    def test_kinds(self):
+        self.assertEqual(self.classifier.classify("IMG_4810.jpeg"), (classifier.KIND_EXIF, None, None))
+        self.assertEqual(self.classifier.classify("file-19750517_091500.mp4"),
+                         (classifier.KIND_VIDEO, "19750517_091500", "%Y%m%d_%H%M%S"))
+        self.assertEqual(self.classifier.classify("IMG_20190610_190809.JPG"),
+                         (classifier.KIND_EXIF, "20190610_190809", "%Y%m%d_%H%M%S"))
+        self.assertEqual(self.classifier.classify("scan-19750517-0915.tif"),
+                         (classifier.KIND_OTHER, "19750517-0915", "%Y%m%d-%H%M"))
+
+    def test_unknown(self):
+        self.assertEqual(self.classifier.classify("file33-19750517-091500"), (None, None, None))
+        self.assertEqual(self.classifier.classify("file-19750517_091500.mp4.part"), (None, None, None))
+        self.assertEqual(self.classifier.classify("file-19750517_091500.MP4x"), (None, None, None))
+
+    def test_leftmost_date(self):
+        self.assertEqual(self.classifier.classify("file-19750517-0915_20190222_153422.mp4"),
+                         (classifier.KIND_VIDEO, "19750517-0915", "%Y%m%d-%H%M"))
+
+    def test_custom_format(self):
+        self.assertEqual(self.classifier.classify("holiday 1999.07.14.mov"), (classifier.KIND_VIDEO, None, None))
+        self.classifier.add_datetime_format("DOTS", "%Y.%m.%d")
+        self.assertEqual(self.classifier.classify("holiday 1999.07.14.mov"),
+                         (classifier.KIND_VIDEO, "1999.07.14", "%Y.%m.%d"))
+
+    def test_regex_from_datetime_pattern(self):
+        regex = classifier.regex_from_datetime_pattern("%Y%m%d_%H%M%S")
+        self.assertTrue(re.match(regex + "$", "20190222_153422"))
+        self.assertFalse(re.match(regex + "$", "20190222-153422"))
+        self.assertRaises(ValueError, classifier.regex_from_datetime_pattern, "%B %Y")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import duplicates
+
+
+class DuplicateFinderTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.source = os.path.join(self.folder, "source")
+        self.target = os.path.join(self.folder, "target")
+        os.makedirs(self.source)
+        os.makedirs(self.target)
+        # large files share first and last block and differ in the middle
+        edge = b"e" * duplicates.EDGE_BLOCK_SIZE
+        self.write(self.target, "a.jpg", b"a" * 100)
+        self.write(self.target, "large.mp4", edge + b"1" + edge)
+        self.write(self.source, "a-copy.jpg", b"a" * 100)
+        self.write(self.source, "b.jpg", b"b" * 100)
+        self.write(self.source, "b-copy.jpg", b"b" * 100)
+        self.write(self.source, "large.mp4", edge + b"2" + edge)
+        self.write(self.source, "empty.txt", b"")
+        self.write(self.source, "empty-copy.txt", b"")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def write(self, folder, name, content):
+        with open(os.path.join(folder, name), 'wb') as media_file:
+            media_file.write(content)
+
+    def moves(self):
+        return [(os.path.join(self.source, name), self.target)
+                for name in ("a-copy.jpg", "b.jpg", "b-copy.jpg", "large.mp4", "empty.txt", "empty-copy.txt")]
+
+    def test_find(self):
+        for jobs in (1, 4):
+            finder = duplicates.DuplicateFinder(jobs=jobs)
+            self.assertEqual(finder.find(self.moves()),
+                             {os.path.join(self.source, "a-copy.jpg"): os.path.join(self.target, "a.jpg"),
+                              os.path.join(self.source, "b-copy.jpg"): os.path.join(self.source, "b.jpg")})
+            self.assertEqual((finder.edge_hashes, finder.full_hashes), (6, 2))
+            finder.close()
+
+    def test_index(self):
+        index_file = os.path.join(self.folder, "test.hashes")
+        finder = duplicates.DuplicateFinder(duplicates.HashIndex(index_file))
+        finder.find(self.moves())
+        os.rename(os.path.join(self.source, "b.jpg"), os.path.join(self.target, "b.jpg"))
+        finder.record([(os.path.join(self.source, "b.jpg"), os.path.join(self.target, "b.jpg"))])
+        finder.close()
+
+        finder = duplicates.DuplicateFinder(duplicates.HashIndex(index_file))
+        found = finder.find([(os.path.join(self.source, "b-copy.jpg"), self.target)])
+        self.assertEqual(found, {os.path.join(self.source, "b-copy.jpg"): os.path.join(self.target, "b.jpg")})
+        # only the new source file is read
+        self.assertEqual((finder.edge_hashes, finder.full_hashes), (1, 0))
+        finder.close()
+
+    def test_hashes_are_kept_until_recorded(self):
+        finder = duplicates.DuplicateFinder()
+        finder.find(self.moves())
+        # the duplicates aren't moved to the target folder, the empty files aren't hashed
+        self.assertEqual(sorted(finder._hashes), [os.path.join(self.source, "b.jpg"),
+                                                  os.path.join(self.source, "large.mp4")])
+        moves = [(os.path.join(self.source, name), self.target) for name in ("b.jpg", "large.mp4")]
+        finder.record([(os.path.join(self.source, "b.jpg"), os.path.join(self.target, "b.jpg"))], moves)
+        self.assertEqual(finder._hashes, {})
+        finder.close()
+
+    def test_changed_file_is_hashed_again(self):
+        index_file = os.path.join(self.folder, "test.hashes")
+        finder = duplicates.DuplicateFinder(duplicates.HashIndex(index_file))
+        finder.find(self.moves())
+        finder.close()
+        self.write(self.target, "a.jpg", b"c" * 100)
+
+        finder = duplicates.DuplicateFinder(duplicates.HashIndex(index_file))
+        self.assertEqual(finder.find([(os.path.join(self.source, "a-copy.jpg"), self.target)]), {})
+        finder.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
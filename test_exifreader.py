@@ -0,0 +1,73 @@
+import io
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import exifreader
+
+
+def make_tiff(byte_order, entries):
+    """Build a TIFF structure with a single IFD. entries = list of (tag, ascii value)."""
+    data_offset = 8 + 2 + len(entries) * 12 + 4
+    ifd = struct.pack(byte_order + 'H', len(entries))
+    data = b''
+    for tag, value in entries:
+        value = value + b'\x00'
+        if len(value) <= 4:
+            ifd += struct.pack(byte_order + 'HHI4s', tag, exifreader.TYPE_ASCII, len(value), value)
+        else:
+            ifd += struct.pack(byte_order + 'HHII', tag, exifreader.TYPE_ASCII, len(value), data_offset + len(data))
+            data += value
+    header = (b'II' if byte_order == '<' else b'MM') + struct.pack(byte_order + 'HI', 42, 8)
+    return header + ifd + struct.pack(byte_order + 'I', 0) + data
+
+
+def make_jpeg(tiff):
+    app0 = b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00\x01\x01\x00\x00\x48\x00\x48\x00\x00'
+    app1 = b'\xff\xe1' + struct.pack('>H', len(tiff) + 8) + exifreader.EXIF_HEADER + tiff
+    return exifreader.JPEG_SOI + app0 + app1 + b'\xff\xda\x00\x02' + b'\x00' * 64
+
+
+class ExifReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def write_file(self, name, content):
+        path = os.path.join(self.folder, name)
+        with open(path, 'wb') as image_file:
+            image_file.write(content)
+        return path
+
+    def test_testdata_images(self):
+        self.assertEqual(exifreader.read_metadata(os.path.join("testdata", "IMG_4810.jpeg")),
+                         ("2019:08:23 12:05:48", "iPhone X"))
+        self.assertEqual(exifreader.read_metadata(os.path.join("testdata", "IMG_4810.png")),
+                         ("2019:08:23 12:05:48", "iPhone X"))
+        self.assertEqual(exifreader.read_metadata(os.path.join("testdata", "IMG_4810.tiff")),
+                         ("2019:08:23 12:05:48", None))
+
+    def test_no_exif(self):
+        self.assertEqual(exifreader.read_metadata(os.path.join("testdata", "IMG_20190610_190809.JPG")), (None, None))
+        self.assertEqual(exifreader.read_metadata(os.path.join("testdata", "avatar-body.png")), (None, None))
+
+    def test_little_endian_and_empty_model(self):
+        tiff = make_tiff('<', [(exifreader.TAG_MODEL, b''), (exifreader.TAG_DATETIME, b'2020:05:06 12:58:46')])
+        path = self.write_file("little.jpg", make_jpeg(tiff))
+        self.assertEqual(exifreader.read_metadata(path), ("2020:05:06 12:58:46", ""))
+
+    def test_parse_tiff_big_endian(self):
+        tiff = make_tiff('>', [(exifreader.TAG_MODEL, b'X'), (exifreader.TAG_DATETIME, b'1975:05:17 09:15:00')])
+        self.assertEqual(exifreader.parse_tiff(io.BytesIO(tiff)), ("1975:05:17 09:15:00", "X"))
+
+    def test_corrupt_header(self):
+        path = self.write_file("corrupt.jpg", exifreader.JPEG_SOI + b'\xff\xe1\x00\x20' + exifreader.EXIF_HEADER + b'XX')
+        self.assertEqual(exifreader.read_metadata(path), (None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
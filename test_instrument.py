@@ -0,0 +1,89 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import instrument
+import planner
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class RunStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def make_stats(self):
+        clock = FakeClock()
+        stats = instrument.RunStats(clock)
+        for index in range(20):
+            stats.add('classify', 0.000003)
+            stats.add_file("file%02d.jpg" % index, index / 1000.0)
+        stats.add('exif', 0.0015)
+        stats.count('moved', 19)
+        stats.count('no_date')
+        stats.bytes_moved = 1234
+        clock.now += 2
+        stats.finish()
+        return stats
+
+    def test_histogram(self):
+        histogram = instrument.Histogram()
+        for elapsed in (0.0000005, 0.000003, 0.000003, 0.0015, 3600.0):
+            histogram.add(elapsed)
+        self.assertEqual(histogram.to_dict()['histogram_us'], {'<1': 1, '<4': 2, '<2048': 1, '<2147483648': 1})
+        self.assertEqual(histogram.max, 3600.0)
+
+    def test_summary(self):
+        summary = self.make_stats().to_dict()
+        self.assertEqual((summary['files'], summary['elapsed'], summary['files_per_second']), (20, 2, 10))
+        self.assertEqual(summary['outcomes'], {'moved': 19, 'no_date': 1})
+        self.assertEqual(sorted(summary['phases']), ['classify', 'exif'])
+        self.assertEqual(summary['phases']['classify']['count'], 20)
+        self.assertEqual([entry['path'] for entry in summary['slowest_files']],
+                         ["file%02d.jpg" % index for index in range(19, 9, -1)])
+
+    def test_write(self):
+        stats = self.make_stats()
+        stats.write(os.path.join(self.folder, "report.json"))
+        with open(os.path.join(self.folder, "report.json")) as report_file:
+            self.assertEqual(json.load(report_file)['bytes_moved'], 1234)
+        stats.write(os.path.join(self.folder, "report.csv"))
+        with open(os.path.join(self.folder, "report.csv")) as report_file:
+            rows = list(csv.reader(report_file))
+        self.assertIn(['outcome', 'no_date', '1', '', '', ''], rows)
+        self.assertEqual(len([row for row in rows if row[0] == 'slowest']), instrument.SLOWEST_FILES)
+
+    def test_plan_outcomes(self):
+        source = os.path.join(self.folder, "source")
+        os.makedirs(os.path.join(self.folder, "target"))
+        os.makedirs(source)
+        for name in ("a.mp4", "b.mp4"):
+            with open(os.path.join(source, name), 'w') as media_file:
+                media_file.write(name)
+        with open(os.path.join(self.folder, "target", "b.mp4"), 'w') as media_file:
+            media_file.write("existing")
+        stats = instrument.RunStats()
+        plan = planner.MovePlan(stats)
+        plan.add(os.path.join(source, "a.mp4"), os.path.join(self.folder, "target"))
+        plan.add(os.path.join(source, "b.mp4"), os.path.join(self.folder, "target"))
+        plan.execute()
+        self.assertEqual(stats.outcomes, {'moved': 1, 'target_exists': 1})
+        self.assertEqual(stats.bytes_moved, 5)
+        self.assertEqual(stats.to_dict()['bytes_per_second'], 5 / stats.phases['move'].total)
+        self.assertEqual((stats.phases['mkdir'].count, stats.phases['move'].count), (1, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
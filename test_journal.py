@@ -0,0 +1,166 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import journal
+import mediasort
+import planner
+import targetindex
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.journal_file = os.path.join(self.folder, "moves.journal")
+        self.source = os.path.join(self.folder, "source")
+        self.target = os.path.join(self.folder, "target")
+        os.makedirs(self.source)
+        for name in ("a.mp4", "b.mp4", "c.mp4"):
+            with open(os.path.join(self.source, name), 'w') as media_file:
+                media_file.write(name)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def source_file(self, name):
+        return os.path.join(self.source, name)
+
+    def target_file(self, name):
+        return os.path.join(self.target, "2019", "05", name)
+
+    def run_plan(self, names, mode=planner.MODE_MOVE):
+        move_journal = journal.Journal(self.journal_file)
+        plan = planner.MovePlan(journal=move_journal, mode=mode)
+        for name in names:
+            plan.add(self.source_file(name), os.path.dirname(self.target_file(name)))
+        plan.execute()
+        move_journal.close()
+        return plan
+
+    def test_batched_sync(self):
+        clock = FakeClock()
+        move_journal = journal.Journal(self.journal_file, sync_every=3, sync_interval=10, clock=clock)
+        move_journal.begin([(self.source_file(name), self.target_file(name)) for name in ("a.mp4", "b.mp4")])
+        self.assertEqual(move_journal.syncs, 1)
+        for name in ("a.mp4", "b.mp4", "c.mp4"):
+            move_journal.finish(self.source_file(name), self.target_file(name), journal.OUTCOME_MOVED)
+        self.assertEqual(move_journal.syncs, 2)
+        move_journal.undone(self.source_file("a.mp4"))
+        clock.now += 10
+        move_journal.undone(self.source_file("b.mp4"))
+        self.assertEqual(move_journal.syncs, 3)
+        move_journal.close()
+
+    def test_state(self):
+        self.run_plan(["a.mp4", "b.mp4"])
+        with open(self.journal_file, 'a') as journal_file:
+            journal_file.write('{"op": "plan", "source": "%s", "target": "%s"}\n' %
+                               (self.source_file("c.mp4"), self.target_file("c.mp4")))
+            journal_file.write('{"op": "done", "source": "%s", "ta' % self.source_file("c.mp4"))  # cut off
+        state = journal.read_journal(self.journal_file)
+        self.assertEqual(state.pending(), [(self.source_file("c.mp4"), self.target_file("c.mp4"))])
+        self.assertEqual(state.completed(), [(self.source_file(name), self.target_file(name))
+                                             for name in ("a.mp4", "b.mp4")])
+        # the parents created by makedirs are recorded as well
+        self.assertEqual(state.folders, [self.target, os.path.join(self.target, "2019"),
+                                         os.path.join(self.target, "2019", "05")])
+
+    def test_resume(self):
+        self.run_plan(["a.mp4"])
+        move_journal = journal.Journal(self.journal_file)
+        # interrupted run: b.mp4 was moved but its outcome is lost, c.mp4 was not moved yet
+        move_journal.begin([(self.source_file(name), self.target_file(name)) for name in ("b.mp4", "c.mp4")])
+        move_journal.close()
+        os.rename(self.source_file("b.mp4"), self.target_file("b.mp4"))
+
+        move_journal = journal.Journal(self.journal_file)
+        try:
+            plans = mediasort.Sorter(move_journal=move_journal).plan_resume(journal.read_journal(self.journal_file))
+            self.assertEqual(len(plans), 1)
+            plan = plans[0]
+            self.assertEqual(plan.moves, [(self.source_file("c.mp4"), os.path.dirname(self.target_file("c.mp4")))])
+            plan.execute()
+        finally:
+            move_journal.close()
+        state = journal.read_journal(self.journal_file)
+        self.assertEqual(state.pending(), [])
+        self.assertEqual(len(state.completed()), 3)
+
+    def test_renamed_target(self):
+        os.makedirs(os.path.dirname(self.target_file("a.mp4")))
+        with open(self.target_file("a.mp4"), 'w') as media_file:
+            media_file.write("other content")
+        move_journal = journal.Journal(self.journal_file)
+        plan = planner.MovePlan(journal=move_journal, index=targetindex.TargetIndex())
+        plan.add(self.source_file("a.mp4"), os.path.dirname(self.target_file("a.mp4")))
+        plan.execute()
+        move_journal.close()
+        # the plan record has the numbered name, resume and undo never touch the other file
+        with open(self.journal_file) as journal_file:
+            self.assertIn(self.target_file("a_1.mp4"), journal_file.readline())
+        state = journal.read_journal(self.journal_file)
+        self.assertEqual(state.completed(), [(self.source_file("a.mp4"), self.target_file("a_1.mp4"))])
+        plan = mediasort.Sorter().plan_undo(state)
+        plan.execute()
+        self.assertEqual(sorted(os.listdir(self.source)), ["a.mp4", "b.mp4", "c.mp4"])
+        with open(self.target_file("a.mp4")) as media_file:
+            self.assertEqual(media_file.read(), "other content")
+
+    def test_resume_copies(self):
+        os.makedirs(os.path.dirname(self.target_file("a.mp4")))
+        # in the target before the run, not a copy
+        with open(self.target_file("a.mp4"), 'w') as media_file:
+            media_file.write("other content")
+        move_journal = journal.Journal(self.journal_file)
+        move_journal.begin([(self.source_file(name), self.target_file(name)) for name in ("a.mp4", "b.mp4")],
+                           planner.MODE_COPY)
+        move_journal.close()
+        shutil.copy(self.source_file("b.mp4"), self.target_file("b.mp4"))
+
+        move_journal = journal.Journal(self.journal_file)
+        try:
+            # resumed in the mode of the interrupted run
+            plans = mediasort.Sorter(move_journal=move_journal).plan_resume(journal.read_journal(self.journal_file))
+            self.assertEqual([(plan.mode, plan.moves) for plan in plans],
+                             [(planner.MODE_COPY, [(self.source_file("a.mp4"),
+                                                    os.path.dirname(self.target_file("a.mp4")))])])
+        finally:
+            move_journal.close()
+        self.assertEqual(journal.read_journal(self.journal_file).copies(),
+                         [(self.source_file("b.mp4"), self.target_file("b.mp4"))])
+
+    def test_undo(self):
+        self.run_plan(["a.mp4", "b.mp4"])
+        state = journal.read_journal(self.journal_file)
+        plan = mediasort.Sorter().plan_undo(state)
+        self.assertEqual(plan.moves, [(self.target_file("b.mp4"), self.source),
+                                      (self.target_file("a.mp4"), self.source)])
+        plan.execute()
+        mediasort.finish_undo(plan, state, self.journal_file)
+        self.assertEqual(sorted(os.listdir(self.source)), ["a.mp4", "b.mp4", "c.mp4"])
+        self.assertFalse(os.path.exists(self.target))
+        self.assertEqual(journal.read_journal(self.journal_file).completed(), [])
+
+    def test_undo_copies(self):
+        self.run_plan(["a.mp4", "b.mp4"], planner.MODE_HARDLINK)
+        state = journal.read_journal(self.journal_file)
+        self.assertEqual((len(state.completed()), len(state.copies())), (0, 2))
+        plan = mediasort.Sorter().plan_undo(state)
+        self.assertEqual(len(plan), 0)
+        plan.execute()
+        mediasort.finish_undo(plan, state, self.journal_file)
+        self.assertEqual(sorted(os.listdir(self.source)), ["a.mp4", "b.mp4", "c.mp4"])
+        self.assertFalse(os.path.exists(self.target))
+        self.assertEqual(journal.read_journal(self.journal_file).copies(), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import mediasort
+
+# files in the flat folder and the peak RSS allowed for sorting it. The test takes minutes and
+# only runs if the number of files is set, the full run is MEDIASORT_LARGE_FOLDER_FILES=500000
+# within the default 64 MB.
+FILES = int(os.environ.get("MEDIASORT_LARGE_FOLDER_FILES", 0))
+MAX_RSS_KB = int(os.environ.get("MEDIASORT_LARGE_FOLDER_MAX_RSS_KB", 64 * 1024))
+
+# sorted in place with recursion, so the month folders created while it is read show up in the walk
+SORT_SCRIPT = """
+import resource, sys
+import mediasort
+sorter = mediasort.Sorter(mediasort.SortOptions(sys.argv[1], recursion_level=1, batch_size=1000))
+plan = sorter.scan(sys.argv[1])
+print(plan.moved, plan.skipped, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+@unittest.skipUnless(FILES, "set MEDIASORT_LARGE_FOLDER_FILES to run it")
+@unittest.skipUnless(mediasort.scandir and sys.platform.startswith("linux"), "needs scandir and ru_maxrss in KB")
+class LargeFolderTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        for index in range(FILES):
+            open(os.path.join(self.folder, "VID_2019%02d01_120000_%d.mp4" % (index % 12 + 1, index)), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_flat_folder(self):
+        output = subprocess.check_output([sys.executable, "-c", SORT_SCRIPT, self.folder],
+                                         cwd=os.path.dirname(os.path.abspath(__file__)))
+        moved, skipped, max_rss = map(int, output.split())
+        # every file exactly once, none taken again from the folders created meanwhile
+        self.assertEqual((moved, skipped), (FILES, 0))
+        months = ["2019-%02d" % month for month in range(1, 13)]
+        self.assertEqual(sorted(os.listdir(self.folder)), months)
+        self.assertEqual(sum(len(files) for _, _, files in os.walk(self.folder)), FILES)
+        self.assertLess(max_rss, MAX_RSS_KB)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,6 +5,8 @@ import mediasort
 import os
 import logging
 import inspect
+import threading
+from datetime import datetime
 from PIL import Image
 
 from mediasort import get_date_from_filename, make_foldername_from_date, get_model_from_exif
@@ -39,6 +41,30 @@ class MediasortOutput(unittest.TestCase):
         self.assertEqual(make_foldername_from_date("19750517-1534", datetime_formats['OTHER']['datetime'],
                                                    output_formats['MONTHLY']),
                          "1975-05")
+
+    def test_make_foldername_same_as_strptime(self):
+        self.log_testcase_name(inspect.currentframe().f_code.co_name)
+        samples = [("20190218_153425", datetime_formats['IOS']['datetime']),
+                   ("19750517-1534", datetime_formats['OTHER']['datetime']),
+                   ("2019:08:23 12:05:48", mediasort.DATETIME_FORMAT_EXIF),
+                   ("2020:02:29 23:59:59", mediasort.DATETIME_FORMAT_EXIF),
+                   ("2000:12:31 00:00:00", mediasort.DATETIME_FORMAT_EXIF)]
+        for date_str, pattern in samples:
+            for output_format in output_formats.values():
+                self.assertEqual(make_foldername_from_date(date_str, pattern, output_format),
+                                 datetime.strptime(date_str, pattern).strftime(output_format))
+        self.assertEqual(make_foldername_from_date("2019:08:23 12:05:48", mediasort.DATETIME_FORMAT_EXIF, "%Y-%m-%d %H"),
+                         "2019-08-23 12")
+
+    def test_make_foldername_invalid_date(self):
+        self.log_testcase_name(inspect.currentframe().f_code.co_name)
+        for date_str in ("20190230_153425", "20191301_153425", "20190218_246000", "2019021_1534250", "2019021x_153425"):
+            self.assertEqual(make_foldername_from_date(date_str, datetime_formats['IOS']['datetime'],
+                                                       output_formats['DAILY']), date_str)
+        # strptime accepts single digit months, the fast path falls back to it
+        self.assertEqual(make_foldername_from_date("2019:8:23 12:05:48", mediasort.DATETIME_FORMAT_EXIF,
+                                                   output_formats['MONTHLY']), "2019-08")
+
     # system tests
     def test_get_model_from_exif(self):
         testdata.create_test_data()
@@ -128,6 +154,27 @@ class MediasortOutput(unittest.TestCase):
         self.assertTrue(os.path.isfile(os.path.join("target", "1975", "video", "file31-19750517_091500.mp4")))
         testdata.cleanup_test_data()
 
+    def test_walk_files(self):
+        self.log_testcase_name(inspect.currentframe().f_code.co_name)
+        testdata.create_test_data()
+        entries = list(mediasort.walk_files("source", "target", 3))
+        filenames = [entry.filename for entry in entries]
+        self.assertIn("file33-19750517-091500", filenames)
+        self.assertNotIn("lvl11", filenames)
+        self.assertFalse([entry for entry in entries if "@eaDir" in entry.source])
+        self.assertEqual(len(filenames), len(set(filenames)))
+        testdata.cleanup_test_data()
+
+    def test_pipeline_output(self):
+        self.log_testcase_name(inspect.currentframe().f_code.co_name)
+        testdata.create_test_data()
+        mediasort.plan_files("source", "target", 2, output_formats['MONTHLY'], jobs=4).execute()
+        self.assertTrue(os.path.isfile(os.path.join("target", "2019-08", "IMG_4810.jpeg")))
+        self.assertTrue(os.path.isfile(os.path.join("target", "2019-06", "other", "IMG_20190610_190809.JPG")))
+        self.assertTrue(os.path.isfile(os.path.join("target", "1975-05", "video", "file21-19750517_091500.mp4")))
+        self.assertFalse(os.path.isfile(os.path.join("target", "1975-05", "video", "file31-19750517_091500.mp4")))
+        testdata.cleanup_test_data()
+
     def test_detect_already_sorted(self):
         self.log_testcase_name(inspect.currentframe().f_code.co_name)
         testdata.create_test_data()
@@ -142,6 +189,65 @@ class MediasortOutput(unittest.TestCase):
         self.assertFalse(os.path.exists(os.path.join("source", "2020", "2020")))
         testdata.cleanup_test_data()
 
+    def test_sorter_decisions(self):
+        self.log_testcase_name(inspect.currentframe().f_code.co_name)
+        testdata.create_test_data()
+        sorter = mediasort.Sorter(mediasort.SortOptions("target", output_formats['MONTHLY'], 3))
+        decisions = dict((os.path.basename(decision.path), decision) for decision in sorter.iter_decisions("source"))
+        self.assertEqual(os.listdir("target"), ["1980-05"])
+        self.assertEqual(decisions["file-19750517_091500.mp4"],
+                         (os.path.join("source", "file-19750517_091500.mp4"), "19750517_091500",
+                          datetime_formats['IOS']['datetime'], "video", None, os.path.join("target", "1975-05", "video")))
+        self.assertEqual(decisions["IMG_4810.jpeg"].model, "iPhone X")
+        self.assertIsNone(decisions["file33-19750517-091500"].destination)
+        parallel = mediasort.Sorter(mediasort.SortOptions("target", output_formats['MONTHLY'], 3, jobs=4))
+        self.assertEqual(list(parallel.iter_decisions("source")), list(sorter.iter_decisions("source")))
+
+        sorter.apply(sorter.iter_decisions("source"))
+        self.assertTrue(os.path.isfile(os.path.join("target", "1975-05", "video", "file-19750517_091500.mp4")))
+        self.assertTrue(os.path.isfile(os.path.join("source", "lvl13", "lvl23", "lvl33", "file33-19750517-091500")))
+        testdata.cleanup_test_data()
+
+    def test_sorters_are_independent(self):
+        self.log_testcase_name(inspect.currentframe().f_code.co_name)
+        testdata.create_test_data()
+        os.close(os.open(os.path.join("source", "clip.2001.02.03.mp4"), os.O_CREAT))
+        yearly = mediasort.Sorter(mediasort.SortOptions("target", output_formats['YEARLY']))
+        custom = mediasort.Sorter(mediasort.SortOptions("target", output_formats['DAILY'],
+                                                        datetime_formats=["%Y.%m.%d"]))
+        destinations = dict((os.path.basename(decision.path), decision.destination)
+                            for decision in yearly.iter_decisions("source"))
+        self.assertEqual(destinations["file-19750517_091500.mp4"], os.path.join("target", "1975", "video"))
+        self.assertIsNone(destinations["clip.2001.02.03.mp4"])
+        destinations = dict((os.path.basename(decision.path), decision.destination)
+                            for decision in custom.iter_decisions("source"))
+        self.assertEqual(destinations["clip.2001.02.03.mp4"], os.path.join("target", "2001-02-03-Sat", "video"))
+        self.assertEqual(mediasort.filename_classifier.find_date("clip.2001.02.03"), (None, None))
+        testdata.cleanup_test_data()
+
+    def test_has_candidates(self):
+        self.log_testcase_name(inspect.currentframe().f_code.co_name)
+        testdata.create_test_data()
+        sorter = mediasort.Sorter(mediasort.SortOptions("target", recursion_level=3))
+        self.assertTrue(sorter.has_candidates("source"))
+        # only an undated file without extension and an @eaDir folder with an image
+        self.assertFalse(sorter.has_candidates(os.path.join("source", "lvl13", "lvl23", "lvl33")))
+        os.makedirs(os.path.join("source", "lvl13", "lvl23", "lvl33", "@eaDir"))
+        os.close(os.open(os.path.join("source", "lvl13", "lvl23", "lvl33", "@eaDir", "thumb.jpg"), os.O_CREAT))
+        self.assertFalse(sorter.has_candidates(os.path.join("source", "lvl13", "lvl23", "lvl33")))
+        testdata.cleanup_test_data()
+
+    def test_iter_decisions_closed_early(self):
+        self.log_testcase_name(inspect.currentframe().f_code.co_name)
+        testdata.create_test_data()
+        threads = threading.active_count()
+        decisions = mediasort.Sorter(mediasort.SortOptions("target", recursion_level=3, jobs=4)).iter_decisions("source")
+        next(decisions)
+        decisions.close()
+        self.assertEqual(threading.active_count(), threads)
+        testdata.cleanup_test_data()
+
+
 if __name__ == '__main__':
     logging.basicConfig(filename='./test_mediasort.log', format='%(asctime)s %(levelname)s %(message)s',
                         datefmt='%Y-%m-%d %H:%M:%S', filemode='w', level=logging.INFO)
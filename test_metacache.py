@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mediasort
+import metacache
+
+
+class MetadataCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.folder, "test.cache")
+        self.media_file = os.path.join(self.folder, "file-19750517_091500.mp4")
+        with open(self.media_file, 'w') as media_file:
+            media_file.write("video")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_roundtrip(self):
+        file_date = ("19750517_091500", "%Y%m%d_%H%M%S", "video", None)
+        cache = metacache.MetadataCache(self.cache_file)
+        self.assertIs(cache.get(self.media_file, os.stat(self.media_file)), metacache.MISS)
+        cache.put(self.media_file, os.stat(self.media_file), file_date)
+        cache.close()
+
+        cache = metacache.MetadataCache(self.cache_file)
+        self.assertEqual(cache.get(self.media_file, os.stat(self.media_file)), file_date)
+        cache.close()
+
+    def test_file_without_date(self):
+        cache = metacache.MetadataCache(self.cache_file)
+        cache.put(self.media_file, os.stat(self.media_file), None)
+        cache.close()
+        cache = metacache.MetadataCache(self.cache_file)
+        self.assertIsNone(cache.get(self.media_file, os.stat(self.media_file)))
+        cache.close()
+
+    def test_changed_file(self):
+        cache = metacache.MetadataCache(self.cache_file)
+        cache.put(self.media_file, os.stat(self.media_file), None)
+        cache.close()
+        with open(self.media_file, 'a') as media_file:
+            media_file.write("more data")
+        cache = metacache.MetadataCache(self.cache_file)
+        self.assertIs(cache.get(self.media_file, os.stat(self.media_file)), metacache.MISS)
+        cache.close()
+
+    def test_other_formats(self):
+        cache = metacache.MetadataCache(self.cache_file)
+        cache.put(self.media_file, os.stat(self.media_file), None, "formats1")
+        cache.close()
+        cache = metacache.MetadataCache(self.cache_file)
+        self.assertIsNone(cache.get(self.media_file, os.stat(self.media_file), "formats1"))
+        self.assertIs(cache.get(self.media_file, os.stat(self.media_file), "formats2"), metacache.MISS)
+        cache.close()
+
+    def test_added_datetime_format(self):
+        undated_file = os.path.join(self.folder, "clip 2019.01.02.mp4")
+        with open(undated_file, 'w') as media_file:
+            media_file.write("video")
+        cache = metacache.MetadataCache(self.cache_file)
+        sorter = mediasort.Sorter(metadata_cache=cache)
+        self.assertIsNone(sorter.read_file_date(os.path.basename(undated_file), self.folder))
+        sorter = mediasort.Sorter(mediasort.SortOptions(datetime_formats=["%Y.%m.%d"]), metadata_cache=cache)
+        self.assertEqual(sorter.read_file_date(os.path.basename(undated_file), self.folder)[:2], ("2019.01.02", "%Y.%m.%d"))
+        cache.close()
+
+    def test_missing_file_is_undated(self):
+        os.symlink(os.path.join(self.folder, "nonexistent"), os.path.join(self.folder, "broken-link.txt"))
+        cache = metacache.MetadataCache(self.cache_file)
+        sorter = mediasort.Sorter(mediasort.SortOptions(self.folder), cache)
+        entries = dict((entry.filename, entry) for entry in sorter.walk(self.folder))
+        self.assertIsNone(sorter.decide(entries["broken-link.txt"]).destination)
+        self.assertIsNone(sorter.read_file_date("gone.mp4", self.folder))
+        cache.close()
+
+    def test_eviction(self):
+        stat_result = os.stat(self.media_file)
+        for run in range(3):
+            cache = metacache.MetadataCache(self.cache_file, max_entries=2)
+            cache.put("file%d" % run, stat_result, None)
+            cache.close()
+        cache = metacache.MetadataCache(self.cache_file, max_entries=2)
+        self.assertIs(cache.get("file0", stat_result), metacache.MISS)
+        self.assertIsNone(cache.get("file1", stat_result))
+        self.assertIsNone(cache.get("file2", stat_result))
+        cache.close()
+
+    def test_scan_uses_cache(self):
+        for run in range(2):
+            cache = metacache.MetadataCache(self.cache_file)
+            sorter = mediasort.Sorter(mediasort.SortOptions(self.folder), cache)
+            entry = mediasort.MediaEntry(self.folder, os.path.basename(self.media_file), self.folder, None)
+            self.assertEqual(sorter.decide(entry).destination, os.path.join(self.folder, "1975-05", "video"))
+            hits = cache.hits
+            cache.close()
+        self.assertEqual(hits, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
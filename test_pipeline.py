@@ -0,0 +1,76 @@
+import random
+import threading
+import time
+import unittest
+
+import pipeline
+
+
+class PipelineTest(unittest.TestCase):
+    def test_results_in_walk_order(self):
+        def resolve(entry):
+            time.sleep(random.random() / 1000)
+            return entry * 2
+
+        results = pipeline.Pipeline(resolve, 8, max_in_flight=16).results(range(500))
+        self.assertEqual(list(results), [(entry, entry * 2) for entry in range(500)])
+
+    def test_results_in_calling_thread(self):
+        threads = set()
+        for _ in pipeline.Pipeline(lambda entry: entry, 4).results(range(100)):
+            threads.add(threading.current_thread())
+        self.assertEqual(threads, set([threading.current_thread()]))
+
+    def test_resolve_error_is_none(self):
+        def resolve(entry):
+            if entry == 3:
+                raise ValueError("broken file")
+            return entry
+
+        results = pipeline.Pipeline(resolve, 2).results(range(5))
+        self.assertEqual([result for entry, result in results], [0, 1, 2, None, 4])
+
+    def test_results_count_the_stages(self):
+        stages = pipeline.Pipeline(lambda entry: entry, 2)
+        self.assertEqual([result for entry, result in stages.results(range(50))], list(range(50)))
+        self.assertEqual((stages.walk_stats.count, stages.resolve_stats.count, stages.apply_stats.count),
+                         (50, 50, 50))
+
+
+class RunPerDeviceTest(unittest.TestCase):
+    def test_limit_per_device(self):
+        running = {}
+        peak = {}
+        lock = threading.Lock()
+
+        def run(item):
+            device = item[0]
+            with lock:
+                running[device] = running.get(device, 0) + 1
+                peak[device] = max(peak.get(device, 0), running[device])
+            time.sleep(0.01)
+            with lock:
+                running[device] -= 1
+            if item == "b2":
+                raise IOError("device gone")
+            return item.upper()
+
+        items = ["a1", "b1", "a2", "c1", "b2", "a3"]
+        results = pipeline.run_per_device(items, lambda item: item[0], run, per_device=2)
+        self.assertEqual(results, ["A1", "B1", "A2", "C1", None, "A3"])
+        self.assertEqual(peak, {'a': 2, 'b': 2, 'c': 1})
+
+    def test_order_within_device(self):
+        started = []
+        pipeline.run_per_device(["a%d" % index for index in range(10)], lambda item: item[0], started.append)
+        self.assertEqual(started, ["a%d" % index for index in range(10)])
+
+
+class BatchesTest(unittest.TestCase):
+    def test_batches(self):
+        self.assertEqual(list(pipeline.batches(iter(range(7)), 3)), [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(list(pipeline.batches([], 3)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,238 @@
+import errno
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import planner
+import targetindex
+
+
+class MovePlanTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.source = os.path.join(self.folder, "source")
+        self.target = os.path.join(self.folder, "target")
+        os.makedirs(self.source)
+        for name in ("a.mp4", "b.mp4", "c.jpg"):
+            with open(os.path.join(self.source, name), 'w') as media_file:
+                media_file.write(name)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def make_plan(self):
+        plan = planner.MovePlan()
+        plan.add(os.path.join(self.source, "a.mp4"), os.path.join(self.target, "1975-05", "video"))
+        plan.add(os.path.join(self.source, "b.mp4"), os.path.join(self.target, "1975-05", "video"))
+        plan.add(os.path.join(self.source, "c.jpg"), os.path.join(self.target, "2019-08"))
+        return plan
+
+    def test_folders_are_distinct(self):
+        plan = self.make_plan()
+        self.assertEqual(len(plan), 3)
+        self.assertEqual(plan.folders, [os.path.join(self.target, "1975-05", "video"),
+                                        os.path.join(self.target, "2019-08")])
+
+    def test_retarget(self):
+        plan = self.make_plan()
+        plan.retarget({os.path.join(self.source, "a.mp4"): None,
+                       os.path.join(self.source, "c.jpg"): os.path.join(self.target, "2019-08", "duplicates")})
+        self.assertEqual(plan.moves, [(os.path.join(self.source, "b.mp4"), os.path.join(self.target, "1975-05", "video")),
+                                      (os.path.join(self.source, "c.jpg"),
+                                       os.path.join(self.target, "2019-08", "duplicates"))])
+        self.assertEqual(len(plan.folders), 2)
+        self.assertEqual(plan.execute(), 2)
+        self.assertEqual(plan.skipped, 1)
+
+    def test_execute(self):
+        self.assertEqual(self.make_plan().execute(), 3)
+        self.assertTrue(os.path.isfile(os.path.join(self.target, "1975-05", "video", "b.mp4")))
+        self.assertTrue(os.path.isfile(os.path.join(self.target, "2019-08", "c.jpg")))
+        self.assertEqual(os.listdir(self.source), [])
+
+    def test_created_folders(self):
+        plan = self.make_plan()
+        plan.execute()
+        self.assertEqual(plan.created_folders, [self.target, os.path.join(self.target, "1975-05"),
+                                                os.path.join(self.target, "1975-05", "video"),
+                                                os.path.join(self.target, "2019-08")])
+        total = planner.MovePlan()
+        total.add_counts(plan)
+        self.assertEqual((total.moved, total.moved_bytes, len(total)), (3, plan.moved_bytes, 0))
+
+    def test_existing_target_is_skipped(self):
+        os.makedirs(os.path.join(self.target, "2019-08"))
+        with open(os.path.join(self.target, "2019-08", "c.jpg"), 'w') as media_file:
+            media_file.write("other content")
+        plan = self.make_plan()
+        self.assertEqual(plan.execute(), 2)
+        self.assertEqual(plan.skipped, 1)
+        self.assertTrue(os.path.isfile(os.path.join(self.source, "c.jpg")))
+
+    def test_index_renames_collisions(self):
+        os.makedirs(os.path.join(self.target, "2019-08"))
+        with open(os.path.join(self.target, "2019-08", "c.jpg"), 'w') as media_file:
+            media_file.write("other content")
+        plan = self.make_plan()
+        plan.index = targetindex.TargetIndex()
+        self.assertEqual(plan.execute(), 3)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.target, "2019-08"))), ["c.jpg", "c_1.jpg"])
+        self.assertEqual(plan.completed[2], (os.path.join(self.source, "c.jpg"),
+                                             os.path.join(self.target, "2019-08", "c_1.jpg")))
+        self.assertEqual(plan.created_folders, [os.path.join(self.target, "1975-05"),
+                                                os.path.join(self.target, "1975-05", "video")])
+
+    def test_index_skips_same_size(self):
+        os.makedirs(os.path.join(self.target, "2019-08"))
+        with open(os.path.join(self.target, "2019-08", "c.jpg"), 'w') as media_file:
+            media_file.write("xxxxx")
+        plan = self.make_plan()
+        plan.index = targetindex.TargetIndex()
+        self.assertEqual(plan.execute(), 2)
+        self.assertEqual(plan.skipped, 1)
+        self.assertTrue(os.path.isfile(os.path.join(self.source, "c.jpg")))
+
+    def test_index_doesnt_replace_new_files(self):
+        plan = self.make_plan()
+        plan.index = targetindex.TargetIndex()
+        os.makedirs(os.path.join(self.target, "2019-08"))
+        self.assertTrue(plan.index.folder_exists(os.path.join(self.target, "2019-08")))
+        # put there by another program after the folder was listed
+        with open(os.path.join(self.target, "2019-08", "c.jpg"), 'w') as media_file:
+            media_file.write("other content")
+        self.assertEqual(plan.execute(), 3)
+        with open(os.path.join(self.target, "2019-08", "c.jpg")) as media_file:
+            self.assertEqual(media_file.read(), "other content")
+        self.assertTrue(os.path.isfile(os.path.join(self.target, "2019-08", "c_1.jpg")))
+
+    def test_rename_new(self):
+        with open(os.path.join(self.folder, "c.jpg"), 'w') as media_file:
+            media_file.write("other content")
+        with self.assertRaises(OSError) as context:
+            planner.rename_new(os.path.join(self.source, "c.jpg"), os.path.join(self.folder, "c.jpg"))
+        self.assertEqual(context.exception.errno, errno.EEXIST)
+        planner.rename_new(os.path.join(self.source, "c.jpg"), os.path.join(self.folder, "d.jpg"))
+        self.assertEqual(sorted(os.listdir(self.source)), ["a.mp4", "b.mp4"])
+
+    def test_copy_across_devices(self):
+        plan = self.make_plan()
+        plan.is_same_device = lambda source_folder, target_folder: False
+        self.assertEqual(plan.execute(), 3)
+        self.assertEqual(plan.copied_bytes, len("a.mp4") + len("b.mp4") + len("c.jpg"))
+        with open(os.path.join(self.target, "2019-08", "c.jpg")) as media_file:
+            self.assertEqual(media_file.read(), "c.jpg")
+        self.assertEqual(os.listdir(self.source), [])
+
+    def test_copy_mode(self):
+        os.utime(os.path.join(self.source, "c.jpg"), (1000000000, 1000000000))
+        plan = self.make_plan()
+        plan.mode = planner.MODE_COPY
+        self.assertEqual(plan.execute(), 3)
+        self.assertEqual(sorted(os.listdir(self.source)), ["a.mp4", "b.mp4", "c.jpg"])
+        self.assertEqual((plan.copied_bytes, plan.linked_bytes), (15, 0))
+        target_file = os.path.join(self.target, "2019-08", "c.jpg")
+        self.assertEqual(os.path.getmtime(target_file), 1000000000)
+        with open(target_file) as media_file:
+            self.assertEqual(media_file.read(), "c.jpg")
+
+    def test_copy_without_kernel_copy(self):
+        def unsupported(source_fd, target_fd, offset):
+            raise OSError(errno.ENOSYS, "not supported")
+        kernel_copies = planner._kernel_copies
+        planner._kernel_copies = lambda: [unsupported]
+        try:
+            plan = self.make_plan()
+            plan.mode = planner.MODE_COPY
+            self.assertEqual(plan.execute(), 3)
+        finally:
+            planner._kernel_copies = kernel_copies
+        with open(os.path.join(self.target, "2019-08", "c.jpg")) as media_file:
+            self.assertEqual(media_file.read(), "c.jpg")
+
+    def test_copy_falls_back_when_nothing_is_copied(self):
+        kernel_copies = planner._kernel_copies
+        planner._kernel_copies = lambda: [lambda source_fd, target_fd, offset: 0]
+        try:
+            plan = self.make_plan()
+            plan.mode = planner.MODE_COPY
+            self.assertEqual(plan.execute(), 3)
+        finally:
+            planner._kernel_copies = kernel_copies
+        with open(os.path.join(self.target, "2019-08", "c.jpg")) as media_file:
+            self.assertEqual(media_file.read(), "c.jpg")
+
+    def test_incomplete_copy_keeps_source(self):
+        def short_copy(source_fd, target_fd, offset):
+            return os.write(target_fd, b"c") if offset == 0 else 0
+        kernel_copies = planner._kernel_copies
+        planner._kernel_copies = lambda: [short_copy]
+        plan = self.make_plan()
+        plan.is_same_device = lambda source_folder, target_folder: False
+        try:
+            self.assertEqual(plan.execute(), 0)
+        finally:
+            planner._kernel_copies = kernel_copies
+        self.assertEqual(sorted(os.listdir(self.source)), ["a.mp4", "b.mp4", "c.jpg"])
+        self.assertEqual(os.listdir(os.path.join(self.target, "2019-08")), [])
+
+    def test_hardlink_mode(self):
+        plan = self.make_plan()
+        plan.mode = planner.MODE_HARDLINK
+        self.assertEqual(plan.execute(), 3)
+        self.assertTrue(os.path.samefile(os.path.join(self.source, "c.jpg"),
+                                         os.path.join(self.target, "2019-08", "c.jpg")))
+        self.assertEqual((plan.copied_bytes, plan.linked_bytes), (0, 15))
+
+    def test_hardlink_across_devices_copies(self):
+        plan = self.make_plan()
+        plan.mode = planner.MODE_HARDLINK
+        plan.is_same_device = lambda source_folder, target_folder: False
+        self.assertEqual(plan.execute(), 3)
+        self.assertFalse(os.path.samefile(os.path.join(self.source, "c.jpg"),
+                                          os.path.join(self.target, "2019-08", "c.jpg")))
+        self.assertEqual(plan.copied_bytes, 15)
+
+    def test_reflink_mode(self):
+        # cloned on Btrfs or XFS, copied elsewhere
+        plan = self.make_plan()
+        plan.mode = planner.MODE_REFLINK
+        self.assertEqual(plan.execute(), 3)
+        self.assertEqual(plan.copied_bytes + plan.linked_bytes, 15)
+        with open(os.path.join(self.target, "1975-05", "video", "b.mp4")) as media_file:
+            self.assertEqual(media_file.read(), "b.mp4")
+        self.assertEqual(len(os.listdir(self.source)), 3)
+
+    def test_parallel_plans(self):
+        # plans of two sources move a file of the same name to the same, new folder
+        other_source = os.path.join(self.folder, "other")
+        os.makedirs(other_source)
+        with open(os.path.join(other_source, "a.mp4"), 'w') as media_file:
+            media_file.write("other")
+        plans = []
+        for source in (self.source, other_source):
+            plan = planner.MovePlan()
+            plan.add(os.path.join(source, "a.mp4"), os.path.join(self.target, "1975-05", "video"))
+            plans.append(plan)
+        threads = [threading.Thread(target=plan.execute) for plan in plans]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted((plan.moved, plan.skipped) for plan in plans), [(0, 1), (1, 0)])
+        self.assertEqual(os.listdir(os.path.join(self.target, "1975-05", "video")), ["a.mp4"])
+
+    def test_dump(self):
+        stream = io.StringIO() if str is not bytes else io.BytesIO()
+        self.make_plan().dump(stream)
+        dumped = json.loads(stream.getvalue())
+        self.assertEqual(len(dumped['moves']), 3)
+        self.assertEqual(dumped['moves'][2]['target'], os.path.join(self.target, "2019-08", "c.jpg"))
+        self.assertFalse(os.path.exists(self.target))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mediasort
+import rules
+
+RULES = {'rules': [
+    {'match': {'extension': ["mp4", ".MOV"]}, 'target': "{year}/video"},
+    {'match': {'date_source': "exif", 'model': ""}, 'target': "{year}/{month}/other"},
+    {'match': {'date_source': ["exif"], 'model': "iPhone.*"}, 'target': "{year}/{month}/{model}"},
+    {'match': {'filename': "IMG_*", 'extension': "tif"}, 'target': "{year}/{month}-{day} {weekday}/{ext}"},
+    {'target': "{year}/100%/{{{date_source}}}"},
+]}
+
+
+class RulesTest(unittest.TestCase):
+    def setUp(self):
+        self.rule_set = rules.compile_rules(RULES)
+
+    def find(self, filename, model=None, date_source=rules.DATE_SOURCE_FILENAME):
+        rule = self.rule_set.find(filename, filename.rpartition('.')[2], model, date_source)
+        return rule and rule.index
+
+    def test_compile_template(self):
+        self.assertEqual(rules.compile_template("{year}/{month}/{model}"), ("%Y/%m/{model}", True))
+        self.assertEqual(rules.compile_template("{year}-{day} {weekday}"), ("%Y-%d %a", False))
+        self.assertEqual(rules.compile_template("100%/{{x}}"), ("100%%/{{x}}", True))
+        self.assertRaises(ValueError, rules.compile_template, "{year}/{lens}")
+        self.assertRaises(ValueError, rules.compile_template, "{year")
+
+    def test_dispatch_table(self):
+        self.assertEqual([rule.index for rule in self.rule_set.candidates("MP4")], [1, 2, 3, 5])
+        self.assertEqual([rule.index for rule in self.rule_set.candidates("tif")], [2, 3, 4, 5])
+        self.assertEqual([rule.index for rule in self.rule_set.candidates("jpg")], [2, 3, 5])
+
+    def test_first_match_wins(self):
+        self.assertEqual(self.find("clip.mov", "iPhone X", rules.DATE_SOURCE_VIDEO), 1)
+        self.assertEqual(self.find("DSC0001.jpg", "", rules.DATE_SOURCE_EXIF), 2)
+        self.assertEqual(self.find("DSC0001.jpg", "iPhone X", rules.DATE_SOURCE_EXIF), 3)
+        self.assertEqual(self.find("DSC0001.jpg", "Pixel 3", rules.DATE_SOURCE_EXIF), 5)
+        self.assertEqual(self.find("IMG_20190610_190809.tif"), 4)
+        self.assertEqual(self.find("scan_20190610_190809.tif"), 5)
+
+    def test_many_filename_patterns(self):
+        rule_set = rules.compile_rules({'rules': [{'match': {'filename': "x%03d_*" % index}, 'target': "{year}"}
+                                                  for index in range(200)]})
+        for index in (0, rules.PATTERNS_PER_REGEX, 199):
+            self.assertEqual(rule_set.find("x%03d_1.jpg" % index, "jpg", None, rules.DATE_SOURCE_FILENAME).index,
+                             index + 1)
+        self.assertIsNone(rule_set.find("y000_1.jpg", "jpg", None, rules.DATE_SOURCE_FILENAME))
+
+    def test_folder(self):
+        rule = self.rule_set.rules[2]
+        self.assertEqual(rule.folder("2019/08/{model}", "JPG", "iPhone X", rules.DATE_SOURCE_EXIF), "2019/08/iPhone X")
+        self.assertEqual(rule.folder("2019/08/{model}", "JPG", "a/b", rules.DATE_SOURCE_EXIF), "2019/08/a_b")
+        self.assertEqual(rule.folder("2019/08/{model}", "JPG", None, rules.DATE_SOURCE_EXIF), "2019/08/unknown")
+        rule = self.rule_set.rules[4]
+        self.assertEqual(rule.folder("2019/100%/{{{date_source}}}", "jpg", None, rules.DATE_SOURCE_FILENAME),
+                         "2019/100%/{filename}")
+
+    def test_invalid_rules(self):
+        for config in ({}, {'rules': [{'match': {}}]}, {'rules': [{'match': {'size': 1}, 'target': "{year}"}]},
+                       {'rules': [{'match': {'date_source': "gps"}, 'target': "{year}"}]},
+                       {'rules': [{'match': {'model': "("}, 'target': "{year}"}]}):
+            self.assertRaises(ValueError, rules.compile_rules, config)
+
+
+class SorterRulesTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        for name in ("IMG_20190610_190809.tif", "VID_20190610_190809.mp4", "notes_20190610_190809.txt"):
+            open(os.path.join(self.folder, name), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_decisions(self):
+        options = mediasort.SortOptions("target", rules=rules.compile_rules(RULES))
+        decisions = dict((os.path.basename(decision.path), decision.destination)
+                         for decision in mediasort.Sorter(options).iter_decisions(self.folder))
+        self.assertEqual(decisions, {"IMG_20190610_190809.tif": os.path.join("target", "2019/06-10 Mon/tif"),
+                                     "VID_20190610_190809.mp4": os.path.join("target", "2019/video"),
+                                     "notes_20190610_190809.txt": None})
+
+
+if __name__ == '__main__':
+    unittest.main()
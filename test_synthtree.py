@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import exifreader
+import mediasort
+import synthtree
+import videoreader
+
+
+class SyntheticTreeTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_headers_are_readable(self):
+        path = os.path.join(self.folder, "a.jpg")
+        synthtree.write_file(path, synthtree.make_jpeg("2019:08:23 12:05:48", "iPhone X"))
+        self.assertEqual(exifreader.read_metadata(path), ("2019:08:23 12:05:48", "iPhone X"))
+        synthtree.write_file(path, synthtree.make_jpeg())
+        self.assertEqual(exifreader.read_metadata(path), (None, None))
+        path = os.path.join(self.folder, "a.mp4")
+        synthtree.write_file(path, synthtree.make_mp4(86400 + 3661))
+        self.assertEqual(videoreader.read_creation_date(path), "2000:01:02 01:01:01")
+
+    def test_create_tree(self):
+        spec = synthtree.TreeSpec(files=200, depth=2, fanout=3)
+        counts = synthtree.create_tree(os.path.join(self.folder, "a"), spec)
+        self.assertEqual(counts['folders'], 1 + 3 + 9)
+        self.assertEqual(counts['noise'], 2 * counts['folders'])
+        self.assertEqual(sum(counts[kind] for kind in (synthtree.KIND_EXIF, synthtree.KIND_NAMED,
+                                                       synthtree.KIND_VIDEO, synthtree.KIND_UNDATED)), 200)
+        # same spec, same tree
+        self.assertEqual(synthtree.create_tree(os.path.join(self.folder, "b"), spec), counts)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.folder, "a", "d01"))),
+                         sorted(os.listdir(os.path.join(self.folder, "b", "d01"))))
+
+        sorter = mediasort.Sorter(mediasort.SortOptions(os.path.join(self.folder, "target"), recursion_level=2))
+        decisions = list(sorter.iter_decisions(os.path.join(self.folder, "a")))
+        self.assertEqual(len(decisions), 200)
+        self.assertEqual(len([decision for decision in decisions if decision.destination is None]),
+                         counts[synthtree.KIND_UNDATED])
+        self.assertEqual(len([decision for decision in decisions if decision.model]), counts[synthtree.KIND_EXIF])
+
+
+if __name__ == '__main__':
+    unittest.main()
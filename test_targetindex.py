@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import targetindex
+
+
+class NameSetTest(unittest.TestCase):
+    def test_add_discard(self):
+        names = targetindex.NameSet("file%d.jpg" % number for number in range(1000))
+        for number in range(0, 1000, 2):
+            names.discard("file%d.jpg" % number)
+        names.add("file0.jpg")
+        names.add("file1.jpg")
+        self.assertEqual(len(names), 501)
+        self.assertIn("file0.jpg", names)
+        self.assertIn("file999.jpg", names)
+        self.assertNotIn("file2.jpg", names)
+        self.assertNotIn("other.jpg", names)
+
+
+class TargetIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.target = os.path.join(self.folder, "2019-08")
+        os.makedirs(self.target)
+        self.write(os.path.join(self.target, "a.jpg"), "a")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    @staticmethod
+    def write(path, content):
+        with open(path, 'w') as media_file:
+            media_file.write(content)
+
+    def test_numbered_name(self):
+        self.assertEqual(targetindex.numbered_name("IMG.jpg", 1), "IMG_1.jpg")
+        self.assertEqual(targetindex.numbered_name("a.tar.gz", 2), "a.tar_2.gz")
+        self.assertEqual(targetindex.numbered_name("README", 3), "README_3")
+
+    def test_claim(self):
+        index = targetindex.TargetIndex()
+        self.assertEqual(index.claim(self.target, "b.jpg", 5), "b.jpg")
+        # same name and size: the same file, else the next free numbered name
+        self.assertIsNone(index.claim(self.target, "a.jpg", 1))
+        self.assertEqual(index.claim(self.target, "a.jpg", 2), "a_1.jpg")
+        self.assertEqual(index.claim(self.target, "a.jpg", 3), "a_2.jpg")
+        index.release(self.target, "a_1.jpg")
+        self.assertEqual(index.claim(self.target, "a.jpg", 3), "a_1.jpg")
+        self.assertEqual(index.listed, 1)
+        self.assertEqual(len(index), 4)
+
+    def test_folders(self):
+        index = targetindex.TargetIndex()
+        new_folder = os.path.join(self.folder, "1975-05", "video")
+        self.assertTrue(index.folder_exists(self.target))
+        self.assertFalse(index.folder_exists(new_folder))
+        os.makedirs(new_folder)
+        index.folder_created([os.path.join(self.folder, "1975-05"), new_folder])
+        self.assertTrue(index.folder_exists(new_folder))
+        self.assertTrue(index.folder_exists(os.path.join(self.folder, "1975-05")))
+        self.assertEqual(index.claim(new_folder, "a.mp4", 1), "a.mp4")
+        self.assertEqual(index.listed, 1)
+
+    def test_existing_parent_is_listed(self):
+        index = targetindex.TargetIndex()
+        new_folder = os.path.join(self.target, "video")
+        self.assertFalse(index.folder_exists(new_folder))
+        os.makedirs(new_folder)
+        index.folder_created([new_folder])
+        # the parent existed before, its files are still there
+        self.assertEqual(index.claim(self.target, "a.jpg", 2), "a_1.jpg")
+        self.assertEqual(index.claim(self.target, "video", 2), "video_1")
+
+    def test_forget(self):
+        index = targetindex.TargetIndex()
+        self.assertEqual(index.claim(self.target, "b.jpg", 1), "b.jpg")
+        self.write(os.path.join(self.target, "b.jpg"), "other")
+        index.forget()
+        self.assertEqual(index.claim(self.target, "b.jpg", 1), "b_1.jpg")
+        self.assertEqual(index.listed, 2)
+
+    def test_persistence(self):
+        path = os.path.join(self.folder, "test.index")
+        past = time.time() - 10
+        os.utime(self.target, (past, past))
+        index = targetindex.TargetIndex(path)
+        self.assertEqual(index.claim(self.target, "a.jpg", 2), "a_1.jpg")
+        index.close()  # the folder wasn't changed, a_1.jpg isn't stored
+
+        index = targetindex.TargetIndex(path)
+        self.assertEqual(index.claim(self.target, "a.jpg", 2), "a_1.jpg")
+        self.assertEqual((index.listed, index.reused), (0, 1))
+        index.close()
+
+        self.write(os.path.join(self.target, "a_1.jpg"), "aa")
+        index = targetindex.TargetIndex(path)
+        self.assertIsNone(index.claim(self.target, "a.jpg", 2))
+        self.assertEqual((index.listed, index.reused), (1, 0))
+        index.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+from datetime import datetime
+
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import mediasort
+import videoreader
+
+# 2019-05-17 09:15:00 UTC in seconds since 1904, read as local time
+CREATION_TIME = 3640929300
+CREATION_DATE = datetime.fromtimestamp(CREATION_TIME - 2082844800).strftime("%Y:%m:%d %H:%M:%S")
+
+
+def box(box_type, data):
+    return struct.pack('>I', len(data) + 8) + box_type + data
+
+
+def make_mvhd(version=0, creation_time=CREATION_TIME):
+    if version == 1:
+        return box(b'mvhd', b'\x01\x00\x00\x00' + struct.pack('>QQ', creation_time, creation_time) + b'\x00' * 96)
+    return box(b'mvhd', b'\x00\x00\x00\x00' + struct.pack('>II', creation_time, creation_time) + b'\x00' * 88)
+
+
+def chunk(chunk_id, data):
+    return struct.pack('<4sI', chunk_id, len(data)) + data + b'\x00' * (len(data) & 1)
+
+
+def riff_list(list_type, data):
+    return chunk(b'LIST', list_type + data)
+
+
+def make_avi(hdrl_chunks=b'', info_chunks=b''):
+    data = b'AVI ' + riff_list(b'hdrl', chunk(b'avih', b'\x00' * 56) + hdrl_chunks)
+    if info_chunks:
+        data += riff_list(b'INFO', info_chunks)
+    data += riff_list(b'movi', b'00dc' + b'\x00' * 100)
+    return b'RIFF' + struct.pack('<I', len(data)) + data
+
+
+class CountingFile(object):
+    def __init__(self, video_file):
+        self.video_file = video_file
+        self.bytes_read = 0
+
+    def read(self, size):
+        data = self.video_file.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        return self.video_file.seek(offset, whence)
+
+    def tell(self):
+        return self.video_file.tell()
+
+
+class VideoReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def write_file(self, name, content):
+        path = os.path.join(self.folder, name)
+        with open(path, 'wb') as video_file:
+            video_file.write(content)
+        return path
+
+    def test_mp4(self):
+        for version in (0, 1):
+            path = self.write_file("a.mp4", box(b'ftyp', b'isom\x00\x00\x02\x00') +
+                                   box(b'moov', make_mvhd(version) + box(b'trak', b'\x00' * 32)) +
+                                   box(b'mdat', b'\x00' * 1000))
+            self.assertEqual(videoreader.read_creation_date(path), CREATION_DATE)
+
+    def test_moov_at_end_of_large_file(self):
+        # sparse file: 64 bit mdat of 5 GB in front of moov
+        mdat_size = 5 * 1024 ** 3
+        path = os.path.join(self.folder, "large.mov")
+        with open(path, 'wb') as video_file:
+            video_file.write(box(b'ftyp', b'qt  \x00\x00\x02\x00'))
+            video_file.write(struct.pack('>I4sQ', 1, b'mdat', mdat_size + 16))
+            video_file.seek(mdat_size, 1)
+            video_file.write(box(b'moov', make_mvhd()))
+        with open(path, 'rb') as video_file:
+            counting_file = CountingFile(video_file)
+            self.assertEqual(videoreader.parse_video(counting_file), CREATION_DATE)
+        self.assertLess(counting_file.bytes_read, 256)
+
+    def test_mp4_without_date(self):
+        path = self.write_file("a.mp4", box(b'ftyp', b'isom') + box(b'moov', make_mvhd(creation_time=0)))
+        self.assertIsNone(videoreader.read_creation_date(path))
+        path = self.write_file("b.mp4", box(b'ftyp', b'isom') + struct.pack('>I4s', 4, b'moov'))
+        self.assertIsNone(videoreader.read_creation_date(path))
+        path = self.write_file("c.mpg", b'\x00\x00\x01\xba' + b'\x00' * 100)
+        self.assertIsNone(videoreader.read_creation_date(path))
+
+    def test_avi(self):
+        for idit in (b'2005:08:17 11:42:43\n\x00', b'WED AUG 17 11:42:43 2005\n\x00'):
+            path = self.write_file("a.avi", make_avi(chunk(b'IDIT', idit)))
+            self.assertEqual(videoreader.read_creation_date(path), "2005:08:17 11:42:43")
+        path = self.write_file("b.avi", make_avi(info_chunks=chunk(b'ISFT', b'camera\x00') +
+                                                 chunk(b'ICRD', b'2005-08-17\x00')))
+        self.assertEqual(videoreader.read_creation_date(path), "2005:08:17 00:00:00")
+        path = self.write_file("c.avi", make_avi())
+        self.assertIsNone(videoreader.read_creation_date(path))
+
+    def test_video_date_used_for_folder(self):
+        self.write_file("clip.mp4", box(b'ftyp', b'isom') + box(b'moov', make_mvhd()))
+        sorter = mediasort.Sorter(mediasort.SortOptions(self.folder))
+        entry = mediasort.MediaEntry(self.folder, "clip.mp4", self.folder, None)
+        self.assertEqual(sorter.decide(entry).destination, os.path.join(self.folder, "2019-05", "video"))
+        # a date in the filename is used first
+        self.write_file("clip-20200101_101010.mp4", box(b'ftyp', b'isom') + box(b'moov', make_mvhd()))
+        entry = mediasort.MediaEntry(self.folder, "clip-20200101_101010.mp4", self.folder, None)
+        self.assertEqual(sorter.decide(entry).destination, os.path.join(self.folder, "2020-01", "video"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import mediasort
+import planner
+import watcher
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FileTrackerTest(unittest.TestCase):
+    def test_waits_for_close_and_settle_time(self):
+        clock = FakeClock()
+        tracker = watcher.FileTracker(2.0, require_close=True, clock=clock)
+        tracker.update("source", "a.mp4", False)
+        clock.sleep(5)
+        self.assertEqual(tracker.pop_ready(), [])
+        tracker.update("source", "a.mp4", True)
+        clock.sleep(1)
+        self.assertEqual(tracker.pop_ready(), [])
+        clock.sleep(1)
+        self.assertEqual(tracker.pop_ready(), [("source", "a.mp4", 1005.0)])
+        self.assertEqual(tracker.in_flight, {})
+        tracker.record_done(1005.0)
+        self.assertEqual((tracker.events, tracker.released, tracker.latency_max), (2, 1, 2.0))
+
+    def test_removed_file_is_dropped(self):
+        clock = FakeClock()
+        tracker = watcher.FileTracker(2.0, require_close=False, clock=clock)
+        tracker.update("source", "a.mp4", False)
+        tracker.remove("source", "a.mp4")
+        clock.sleep(3)
+        self.assertEqual(tracker.pop_ready(), [])
+
+    def test_polling_mode_needs_no_close(self):
+        clock = FakeClock()
+        tracker = watcher.FileTracker(2.0, require_close=False, clock=clock)
+        tracker.update("source", "a.mp4", False)
+        clock.sleep(1)
+        tracker.update("source", "a.mp4", False)  # still growing
+        clock.sleep(1.5)
+        self.assertEqual(tracker.pop_ready(), [])
+        clock.sleep(0.5)
+        self.assertEqual([name for _, name, _ in tracker.pop_ready()], ["a.mp4"])
+
+
+class WatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def listing(self):
+        for name in os.listdir(self.folder):
+            yield self.folder, name, os.stat(os.path.join(self.folder, name))
+
+    def test_polling_watcher(self):
+        clock = FakeClock()
+        file_watcher = watcher.PollingWatcher(self.listing, 5.0, clock, clock.sleep)
+        with open(os.path.join(self.folder, "a.mp4"), 'w') as media_file:
+            media_file.write("a")
+        self.assertEqual(file_watcher.poll(1.0), [])
+        clock.sleep(3)
+        self.assertEqual(file_watcher.poll(1.0), [(self.folder, "a.mp4", False)])
+        os.remove(os.path.join(self.folder, "a.mp4"))
+        self.assertEqual(file_watcher.poll(10.0), [(self.folder, "a.mp4", None)])
+
+    @unittest.skipUnless(watcher.InotifyWatcher.available(), "inotify not available")
+    def test_inotify_watcher(self):
+        os.makedirs(os.path.join(self.folder, "@eaDir"))
+        file_watcher = watcher.InotifyWatcher(self.folder, 2, ["@eaDir"])
+        try:
+            with open(os.path.join(self.folder, "@eaDir", "thumb.jpg"), 'w') as thumbnail:
+                thumbnail.write("t")
+            with open(os.path.join(self.folder, "a.mp4"), 'w') as media_file:
+                media_file.write("a")
+            os.makedirs(os.path.join(self.folder, "sub"))
+            with open(os.path.join(self.folder, "sub", "b.mp4"), 'w') as media_file:
+                media_file.write("b")
+            events = []
+            deadline = time.time() + 5
+            while time.time() < deadline and (os.path.join(self.folder, "sub"), "b.mp4", True) not in events:
+                events += file_watcher.poll(0.1)
+        finally:
+            file_watcher.close()
+        self.assertIn((self.folder, "a.mp4", True), events)
+        self.assertIn((os.path.join(self.folder, "sub"), "b.mp4", True), events)
+        self.assertNotIn("thumb.jpg", [name for _, name, _ in events])
+
+    @unittest.skipUnless(watcher.InotifyWatcher.available(), "inotify not available")
+    def test_inotify_ignores_sorted_folders(self):
+        sorted_folder = os.path.join(self.folder, "2019-01")
+        file_watcher = watcher.InotifyWatcher(self.folder, 2, [], lambda folder: folder == sorted_folder)
+        try:
+            os.makedirs(sorted_folder)
+            with open(os.path.join(sorted_folder, "a.mp4"), 'w') as media_file:
+                media_file.write("a")
+            with open(os.path.join(self.folder, "b.mp4"), 'w') as media_file:
+                media_file.write("b")
+            events = []
+            deadline = time.time() + 5
+            while time.time() < deadline and (self.folder, "b.mp4", True) not in events:
+                events += file_watcher.poll(0.1)
+        finally:
+            file_watcher.close()
+        self.assertNotIn("a.mp4", [name for _, name, _ in events])
+
+    def test_sorted_folders(self):
+        # sorted in place: the files of a subfolder go to subfolders of it
+        sub_folder = os.path.join(self.folder, "sub")
+        os.makedirs(os.path.join(sub_folder, "2018-12"))
+        with open(os.path.join(sub_folder, "clip-20190102_030405.mp4"), 'w') as media_file:
+            media_file.write("clip")
+        sorter = mediasort.Sorter(mediasort.SortOptions(self.folder, recursion_level=2))
+        plan = planner.MovePlan()
+        plan.add(os.path.join(sub_folder, "clip-20190102_030405.mp4"), os.path.join(sub_folder, "2019-01", "video"))
+        sorter.execute_plan(plan)
+        self.assertTrue(sorter.in_sorted_folder(os.path.join(sub_folder, "2019-01"), self.folder))
+        self.assertTrue(sorter.in_sorted_folder(os.path.join(sub_folder, "2019-01", "video", "2019-01"), self.folder))
+        self.assertFalse(sorter.in_sorted_folder(sub_folder, self.folder))
+        self.assertFalse(sorter.in_sorted_folder(os.path.join(sub_folder, "2018-12"), self.folder))
+        self.assertFalse(sorter.in_sorted_folder(self.folder, self.folder))
+        # an output folder inside the source holds sorted files only
+        sorter = mediasort.Sorter(mediasort.SortOptions(os.path.join(self.folder, "sorted"), recursion_level=2))
+        self.assertTrue(sorter.in_sorted_folder(os.path.join(self.folder, "sorted", "2019-01"), self.folder))
+        self.assertFalse(sorter.in_sorted_folder(sub_folder, self.folder))
+
+
+if __name__ == '__main__':
+    unittest.main()
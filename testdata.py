@@ -9,7 +9,7 @@ def cleanup_test_data():
         shutil.rmtree(os.path.join("source"), ignore_errors=True)
         shutil.rmtree("target", ignore_errors=True)
     except IOError:
-        print IOError
+        print(IOError)
 
 
 def create_test_data():
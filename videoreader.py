@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Salih Kiliclioglu
+
+# Minimal video metadata reader used by mediasort.
+# MP4/MOV: the top level boxes are skipped by seeking over them until moov is found,
+# wherever it is in the file, then the creation time is read from moov/mvhd.
+# AVI: only the hdrl and INFO lists are entered for the IDIT (DateTimeOriginal) or ICRD
+# (creation date) chunk, the movi list is skipped by seeking over it.
+# The media data itself is never read.
+
+from datetime import datetime
+
+import logging
+import re
+import struct
+
+# format of the returned date strings, same as the EXIF DateTime
+DATETIME_FORMAT = "%Y:%m:%d %H:%M:%S"
+
+# mvhd times are seconds since 1904-01-01 00:00:00 UTC, this many before the Unix epoch
+MP4_EPOCH_OFFSET = 2082844800
+MP4_BOX_HEADER = struct.Struct('>I4s')
+MP4_FILE_TYPES = (b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide', b'pnot')
+
+RIFF_HEADER = struct.Struct('<4sI4s')
+RIFF_CHUNK_HEADER = struct.Struct('<4sI')
+# AVI lists which may contain the date, all others (movi, strl, ...) are skipped
+AVI_DATE_LISTS = (b'hdrl', b'INFO')
+
+# upper limit for the boxes or chunks read from one file, protects against corrupt sizes
+MAX_BOXES = 1024
+
+MONTHS = dict((name, index + 1) for index, name in enumerate(
+    ('JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC')))
+# IDIT values seen in the wild: "2005:08:17 11:42:43" and ctime style "SAT DEC 12 17:48:20 2009"
+IDIT_NUMERIC = re.compile(br'\s*(\d{4})[:/-](\d{2})[:/-](\d{2})[ T](\d{2}):(\d{2}):(\d{2})')
+IDIT_CTIME = re.compile(br'\s*[A-Za-z]{3}\s+([A-Za-z]{3})\s+(\d{1,2})\s+(\d{2}):(\d{2}):(\d{2})\s+(\d{4})')
+ICRD_DATE = re.compile(br'\s*(\d{4})-(\d{2})-(\d{2})')
+
+
+def read_creation_date(path):
+    """Return the creation date of a video file formatted as DATETIME_FORMAT or None."""
+    with open(path, 'rb') as video_file:
+        try:
+            return parse_video(video_file)
+        except (struct.error, ValueError, OverflowError) as error:
+            logging.debug("Invalid video header in %s: %s", path, error)
+            return None
+
+
+def parse_video(video_file):
+    header = video_file.read(12)
+    video_file.seek(0, 2)
+    end = video_file.tell()
+    if header[:4] == b'RIFF' and header[8:12] == b'AVI ':
+        return parse_avi(video_file, end)
+    if header[4:8] in MP4_FILE_TYPES:
+        return parse_mp4(video_file, end)
+    return None
+
+
+def iter_boxes(video_file, start, end):
+    """Yield (type, data offset, data size) of the MP4 boxes between start and end."""
+    offset = start
+    for _ in range(MAX_BOXES):
+        if offset + MP4_BOX_HEADER.size > end:
+            return
+        video_file.seek(offset)
+        size, box_type = MP4_BOX_HEADER.unpack(video_file.read(MP4_BOX_HEADER.size))
+        header_size = MP4_BOX_HEADER.size
+        if size == 1:
+            size = struct.unpack('>Q', video_file.read(8))[0]
+            header_size += 8
+        elif size == 0:
+            size = end - offset  # box extends to the end of the file
+        if size < header_size:
+            raise ValueError("Invalid box size %d" % size)
+        yield box_type, offset + header_size, size - header_size
+        offset += size
+
+
+def parse_mp4(video_file, end):
+    for box_type, offset, size in iter_boxes(video_file, 0, end):
+        if box_type == b'moov':
+            for child_type, child_offset, child_size in iter_boxes(video_file, offset, offset + size):
+                if child_type == b'mvhd':
+                    return read_mvhd(video_file, child_offset)
+            return None
+    return None
+
+
+def read_mvhd(video_file, offset):
+    video_file.seek(offset)
+    version = video_file.read(4)[:1]
+    if version == b'\x01':
+        seconds = struct.unpack('>Q', video_file.read(8))[0]
+    else:
+        seconds = struct.unpack('>I', video_file.read(4))[0]
+    if not seconds:
+        return None  # not set by the writer
+    # local time, like the EXIF and file name dates
+    return datetime.fromtimestamp(seconds - MP4_EPOCH_OFFSET).strftime(DATETIME_FORMAT)
+
+
+def iter_chunks(video_file, start, end):
+    """Yield (id, list type or None, data offset, data size) of the RIFF chunks between start and end."""
+    offset = start
+    for _ in range(MAX_BOXES):
+        if offset + RIFF_CHUNK_HEADER.size > end:
+            return
+        video_file.seek(offset)
+        chunk_id, size = RIFF_CHUNK_HEADER.unpack(video_file.read(RIFF_CHUNK_HEADER.size))
+        offset += RIFF_CHUNK_HEADER.size
+        if chunk_id == b'LIST':
+            yield chunk_id, video_file.read(4), offset + 4, size - 4
+        else:
+            yield chunk_id, None, offset, size
+        offset += size + (size & 1)  # chunks are word aligned
+
+
+def parse_avi(video_file, end):
+    # the size in the RIFF header is wrong for files > 4 GB, the file size is used instead
+    return find_avi_date(video_file, RIFF_HEADER.size, end)
+
+
+def find_avi_date(video_file, start, end):
+    created = None
+    for chunk_id, list_type, offset, size in iter_chunks(video_file, start, end):
+        if list_type in AVI_DATE_LISTS:
+            date_str = find_avi_date(video_file, offset, offset + size)
+            if date_str:
+                return date_str
+        elif chunk_id == b'IDIT':
+            video_file.seek(offset)
+            date_str = parse_idit(video_file.read(min(size, 64)))
+            if date_str:
+                return date_str
+        elif chunk_id == b'ICRD' and not created:
+            video_file.seek(offset)
+            created = parse_icrd(video_file.read(min(size, 64)))
+    return created
+
+
+def make_datetime_str(year, month, day, hour=0, minute=0, second=0):
+    return datetime(int(year), int(month), int(day), int(hour), int(minute), int(second)).strftime(DATETIME_FORMAT)
+
+
+def parse_idit(value):
+    match = IDIT_NUMERIC.match(value)
+    if match:
+        return make_datetime_str(*match.groups())
+    match = IDIT_CTIME.match(value)
+    if match and match.group(1).upper().decode('ascii') in MONTHS:
+        month, day, hour, minute, second, year = match.groups()
+        return make_datetime_str(year, MONTHS[month.upper().decode('ascii')], day, hour, minute, second)
+    return None
+
+
+def parse_icrd(value):
+    match = ICRD_DATE.match(value)
+    if match:
+        return make_datetime_str(*match.groups())
+    return None
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Salih Kiliclioglu
+
+# Watch the source folder for new files.
+# InotifyWatcher uses the Linux inotify API through ctypes, PollingWatcher compares
+# directory listings and is used where inotify isn't available. ctypes is imported on
+# first use, runs without --watch don't need it.
+# Both report (folder, filename) events to a FileTracker, which holds the files that
+# are still in flight and releases them once they are complete and quiet for a while.
+
+import errno
+import logging
+import os
+import select
+import struct
+import time
+
+# inotify event masks, see inotify(7)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+EVENT_HEADER = struct.Struct('iIII')
+READ_SIZE = 64 * 1024
+
+DEFAULT_SETTLE_TIME = 2.0  # seconds a file has to be quiet before it is sorted
+DEFAULT_POLL_INTERVAL = 5.0
+
+try:
+    from os import fsencode
+except ImportError:
+    # Python 2 paths are byte strings already
+    def fsencode(path):
+        return path
+
+
+class FileTracker(object):
+    """In-flight files and their debouncing.
+
+    A file is ready when it was closed after writing (or moved into the folder) and no
+    further event arrived for settle_time seconds. Without close events (polling) a file
+    is ready when it didn't change for settle_time seconds.
+    """
+
+    def __init__(self, settle_time=DEFAULT_SETTLE_TIME, require_close=True, clock=time.time):
+        self.settle_time = settle_time
+        self.require_close = require_close
+        self.clock = clock
+        self.in_flight = {}  # (folder, filename) -> [last event, closed]
+        self.events = 0
+        self.released = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def update(self, folder, filename, closed):
+        self.events += 1
+        self.in_flight[(folder, filename)] = [self.clock(), closed or not self.require_close]
+
+    def remove(self, folder, filename):
+        self.events += 1
+        self.in_flight.pop((folder, filename), None)
+
+    def pop_ready(self):
+        """Return [(folder, filename, time of last event)] of the files which are complete."""
+        now = self.clock()
+        ready = [(key[0], key[1], state[0]) for key, state in self.in_flight.items()
+                 if state[1] and now - state[0] >= self.settle_time]
+        for folder, filename, _ in ready:
+            del self.in_flight[(folder, filename)]
+        return sorted(ready)
+
+    def record_done(self, closed_at):
+        """Count a file as handled, latency is measured from its last event (close)."""
+        latency = self.clock() - closed_at
+        self.released += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+
+    def report(self):
+        average = self.latency_total / self.released if self.released else 0.0
+        logging.info("[WATCH] %d events, %d files sorted, %d in flight, latency avg %.2fs max %.2fs",
+                     self.events, self.released, len(self.in_flight), average, self.latency_max)
+
+
+def import_ctypes():
+    import ctypes
+    import ctypes.util
+    return ctypes
+
+
+class InotifyWatcher(object):
+    """Watch source and its subfolders up to max_recursion_level with inotify.
+
+    Folders for which ignore(folder) is true aren't watched, e.g. the ones the sorted files are moved to.
+    """
+    require_close = True
+
+    def __init__(self, source, max_recursion_level, skip_folders, ignore=None):
+        self.max_recursion_level = max_recursion_level
+        self.skip_folders = skip_folders
+        self.ignore = ignore
+        self.overflowed = False
+        self.folders = {}  # watch descriptor -> (folder, level)
+        ctypes = import_ctypes()
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._pending = []
+        self.add_tree(source, 1, report_files=False)
+
+    @classmethod
+    def available(cls):
+        ctypes = import_ctypes()
+        libc = ctypes.util.find_library('c')
+        return libc is not None and hasattr(ctypes.CDLL(libc), 'inotify_init1')
+
+    def add_tree(self, folder, level, report_files=True):
+        """Watch folder and its subfolders. Files already inside are reported as complete if report_files
+        is set, this covers folders which were created (or moved in) with files before the watch was added."""
+        if self.ignore and self.ignore(folder):
+            return
+        descriptor = self._libc.inotify_add_watch(self._fd, fsencode(folder), WATCH_MASK)
+        if descriptor < 0:
+            logging.error("Can't watch %s: %s", folder, os.strerror(import_ctypes().get_errno()))
+            return
+        self.folders[descriptor] = (folder, level)
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            if os.path.isdir(path):
+                if self.enter(name, level):
+                    self.add_tree(path, level + 1, report_files)
+            elif report_files:
+                self._pending.append((folder, name, True))
+
+    def enter(self, name, level):
+        return self.max_recursion_level and self.max_recursion_level >= level and name not in self.skip_folders
+
+    def poll(self, timeout):
+        """Return [(folder, filename, closed)] for new or changed files, closed=None if a file is gone."""
+        events, self._pending = self._pending, []
+        if events or not select.select([self._fd], [], [], timeout)[0]:
+            return events
+        try:
+            data = os.read(self._fd, READ_SIZE)
+        except OSError as error:
+            if error.errno == errno.EAGAIN:
+                return events
+            raise
+        offset = 0
+        while offset < len(data):
+            descriptor, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                logging.warning("inotify queue overflow, events were lost")
+                self.overflowed = True
+                continue
+            if mask & IN_IGNORED:
+                self.folders.pop(descriptor, None)
+                continue
+            if descriptor not in self.folders:
+                continue
+            folder, level = self.folders[descriptor]
+            if str is not bytes:
+                name = os.fsdecode(name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and self.enter(name, level):
+                    self.add_tree(os.path.join(folder, name), level + 1)
+                    events.extend(self._pending)
+                    self._pending = []
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                events.append((folder, name, None))
+            else:
+                events.append((folder, name, bool(mask & (IN_CLOSE_WRITE | IN_MOVED_TO))))
+        return events
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher(object):
+    """Detect new and changed files by comparing listings. walk() yields (folder, filename, stat)."""
+    require_close = False
+
+    def __init__(self, walk, interval=DEFAULT_POLL_INTERVAL, clock=time.time, sleep=time.sleep):
+        self.walk = walk
+        self.interval = interval
+        self.overflowed = False
+        self._sleep = sleep
+        self._clock = clock
+        self._next_poll = clock() + interval
+        self._known = self._snapshot()
+
+    def _snapshot(self):
+        snapshot = {}
+        for folder, filename, stat_result in self.walk():
+            snapshot[(folder, filename)] = (stat_result.st_size, stat_result.st_mtime)
+        return snapshot
+
+    def poll(self, timeout):
+        delay = self._next_poll - self._clock()
+        if delay > timeout:
+            self._sleep(timeout)
+            return []
+        self._sleep(max(delay, 0))
+        self._next_poll = self._clock() + self.interval
+        current = self._snapshot()
+        events = [(key[0], key[1], False) for key, state in current.items() if self._known.get(key) != state]
+        events += [(key[0], key[1], None) for key in self._known if key not in current]
+        self._known = current
+        return events
+
+    def close(self):
+        pass